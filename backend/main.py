@@ -28,11 +28,9 @@ except ImportError as e:
 
 try:
     print("[*] Loading Photobooth routes...")
-    # Temporarily disable photobooth routes to fix server startup
-    # from src.Photobooth.routes import router as photobooth_router
-    photobooth_router = None
-    PHOTOBOOTH_ROUTES_AVAILABLE = False
-    print("[WARN] Photobooth routes temporarily disabled")
+    # The background removal model loads after startup (see /api/photobooth/ready)
+    from src.Photobooth.routes import router as photobooth_router
+    PHOTOBOOTH_ROUTES_AVAILABLE = True
 except Exception as e:
     print(f"[ERROR] Could not import photobooth routes: {e}")
     import traceback
@@ -139,6 +137,14 @@ async def add_cors_and_debug(request, call_next):
     print(f"[DEBUG] Response status: {response.status_code}")
     return response
 
+@app.on_event("shutdown")
+async def shutdown_gemini_pool():
+    """Release the shared Gemini thread pool and pooled clients"""
+    from src.Common.gemini_async import shutdown_gemini_executor
+    from src.Common.gemini_clients import close_clients
+    shutdown_gemini_executor(wait=False)
+    close_clients()
+
 # Include routers
 if WARDROBE_ROUTES_AVAILABLE:
     app.include_router(wardrobe_router, tags=["Wardrobe & Clothing"])
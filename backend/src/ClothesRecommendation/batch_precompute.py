@@ -0,0 +1,314 @@
+"""
+Batch Recommendation Precomputation
+
+Offline job that walks every user in WardrobeDB, generates recommendations
+ahead of time and stores them in Firestore so the API can serve them instantly.
+
+Features:
+- Thread worker pool sharing one global Gemini rate budget
+- Checkpoint file so an interrupted run can be resumed
+- Incremental mode that skips users whose wardrobe has not changed
+
+Run with (from the backend directory):
+    python -m src.ClothesRecommendation.batch_precompute --workers 4 --rpm 60
+    python -m src.ClothesRecommendation.batch_precompute --incremental
+"""
+
+import os
+import json
+import hashlib
+import argparse
+import threading
+from pathlib import Path
+from datetime import datetime, timezone
+from typing import List, Dict, Optional, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    from .clothes_recommendation import ClothesRecommender
+    from ..WardrobeDB.wardrobe_db import WardrobeDB, ClothingItem, Outfit
+    from ..ClothesSearch.clothes_search import ClothesSearcher
+    from ..Common.rate_limiter import RateLimiter
+except ImportError:
+    # Fallback for direct execution
+    import sys
+    sys.path.append(str(Path(__file__).parent.parent))
+    from ClothesRecommendation.clothes_recommendation import ClothesRecommender
+    from WardrobeDB.wardrobe_db import WardrobeDB, ClothingItem, Outfit
+    from ClothesSearch.clothes_search import ClothesSearcher
+    from Common.rate_limiter import RateLimiter
+
+
+DEFAULT_CHECKPOINT_PATH = Path(__file__).parent / "precompute_checkpoint.json"
+
+
+def wardrobe_fingerprint(clothing_items: List[ClothingItem], outfits: List[Outfit]) -> str:
+    """
+    Compute a stable fingerprint of a user's wardrobe
+
+    Any added, removed or updated item or outfit changes the fingerprint,
+    which is how incremental runs and the API detect stale results.
+    """
+    parts = sorted(f"i:{item.id}:{item.updated_at}" for item in clothing_items)
+    parts += sorted(f"o:{o.id}:{o.updated_at}:{o.times_worn}" for o in outfits)
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+
+def load_precomputed(
+    wardrobe_db: WardrobeDB,
+    user_id: str,
+    max_outfits: Optional[int] = None,
+    max_shopping_items: Optional[int] = None,
+    verify_fresh: bool = True
+) -> Optional[Dict[str, Any]]:
+    """
+    Load a precomputed recommendation result for serving
+
+    Args:
+        wardrobe_db: WardrobeDB instance
+        user_id: User ID
+        max_outfits: Maximum outfit recommendations to return (None for all stored)
+        max_shopping_items: Maximum shopping suggestions to return (None for all stored)
+        verify_fresh: Only return the result if the wardrobe is unchanged
+
+    Returns:
+        RecommendationResult dictionary, or None if missing/stale/too small
+    """
+    stored = wardrobe_db.get_precomputed_recommendations(user_id)
+    if not stored or 'result' not in stored:
+        return None
+
+    # A request asking for more than was precomputed must go to the model
+    if max_outfits is not None and max_outfits > stored.get('max_outfits', 0):
+        return None
+    if max_shopping_items is not None and max_shopping_items > stored.get('max_shopping_items', 0):
+        return None
+
+    if verify_fresh:
+        current = wardrobe_fingerprint(
+            wardrobe_db.get_user_clothing_items(user_id),
+            wardrobe_db.get_user_outfits(user_id)
+        )
+        if current != stored.get('fingerprint'):
+            return None
+
+    result = dict(stored['result'])
+    result['existing_outfits'] = result.get('existing_outfits', [])[:max_outfits]
+    result['missing_items'] = result.get('missing_items', [])[:max_shopping_items]
+    return result
+
+
+class RecommendationPrecomputer:
+    """
+    Precomputes recommendations for all users with a bounded worker pool
+
+    All workers share one RateLimiter, so the total Gemini request rate stays
+    within budget no matter how many workers are configured.
+    """
+
+    def __init__(
+        self,
+        recommender: ClothesRecommender,
+        wardrobe_db: WardrobeDB,
+        workers: int = 4,
+        requests_per_minute: float = 60,
+        checkpoint_path: Optional[Path] = None,
+        max_outfits: int = 5,
+        max_shopping_items: int = 5
+    ):
+        """
+        Initialize the precomputer
+
+        Args:
+            recommender: ClothesRecommender used to generate results
+            wardrobe_db: WardrobeDB to read users from and store results in
+            workers: Number of concurrent users processed
+            requests_per_minute: Global Gemini request budget for the whole run
+            checkpoint_path: Checkpoint file location
+            max_outfits: Outfit recommendations stored per user
+            max_shopping_items: Shopping suggestions stored per user
+        """
+        self.recommender = recommender
+        self.wardrobe_db = wardrobe_db
+        self.workers = max(1, workers)
+        self.checkpoint_path = Path(checkpoint_path or DEFAULT_CHECKPOINT_PATH)
+        self.max_outfits = max_outfits
+        self.max_shopping_items = max_shopping_items
+
+        # One limiter for every Gemini call made by the run
+        self.rate_limiter = RateLimiter(requests_per_minute=requests_per_minute)
+        self.recommender.rate_limiter = self.rate_limiter
+        if self.recommender.clothes_searcher:
+            self.recommender.clothes_searcher.rate_limiter = self.rate_limiter
+
+        self._lock = threading.Lock()
+        self._checkpoint: Dict[str, Any] = {}
+
+    # ==================== CHECKPOINTING ====================
+
+    def _load_checkpoint(self, resume: bool) -> None:
+        if resume and self.checkpoint_path.exists():
+            try:
+                with open(self.checkpoint_path, 'r') as f:
+                    checkpoint = json.load(f)
+                if not checkpoint.get('finished_at'):
+                    # Older checkpoints kept failures as a list with repeats
+                    failed = checkpoint.get('failed') or {}
+                    if isinstance(failed, list):
+                        failed = {user_id: None for user_id in failed}
+                    checkpoint['failed'] = failed
+                    self._checkpoint = checkpoint
+                    print(f"Resuming run {checkpoint['run_id']} "
+                          f"({len(checkpoint['completed'])} users already done)")
+                    return
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Warning: Ignoring unreadable checkpoint: {e}")
+
+        self._checkpoint = {
+            'run_id': datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S'),
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'finished_at': None,
+            'completed': [],
+            # user_id -> last error, dropped once the user succeeds
+            'failed': {}
+        }
+        self._save_checkpoint()
+
+    def _save_checkpoint(self) -> None:
+        """Atomically write the checkpoint file (caller holds the lock or is single-threaded)"""
+        tmp_path = self.checkpoint_path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self._checkpoint, f, indent=2)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _mark(self, user_id: str, status: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            if status == 'failed':
+                self._checkpoint['failed'][user_id] = error
+            else:
+                self._checkpoint['failed'].pop(user_id, None)
+                self._checkpoint['completed'].append(user_id)
+            self._save_checkpoint()
+
+    # ==================== PROCESSING ====================
+
+    def _process_user(self, user_id: str, incremental: bool) -> str:
+        """Compute and store recommendations for one user, returning the outcome"""
+        clothing_items = self.wardrobe_db.get_user_clothing_items(user_id)
+        outfits = self.wardrobe_db.get_user_outfits(user_id)
+        fingerprint = wardrobe_fingerprint(clothing_items, outfits)
+
+        if incremental:
+            stored = self.wardrobe_db.get_precomputed_recommendations(user_id)
+            # A result stored with other limits is stale even if the wardrobe is not
+            if (stored and stored.get('fingerprint') == fingerprint
+                    and stored.get('max_outfits') == self.max_outfits
+                    and stored.get('max_shopping_items') == self.max_shopping_items):
+                return 'unchanged'
+
+        result = self.recommender.generate_recommendations(
+            user_id=user_id,
+            max_outfits=self.max_outfits,
+            max_shopping_items=self.max_shopping_items
+        )
+
+        self.wardrobe_db.save_precomputed_recommendations(user_id, {
+            'user_id': user_id,
+            'fingerprint': fingerprint,
+            'generated_at': datetime.now(timezone.utc).isoformat(),
+            'run_id': self._checkpoint.get('run_id'),
+            'max_outfits': self.max_outfits,
+            'max_shopping_items': self.max_shopping_items,
+            'result': result.to_dict()
+        })
+        return 'computed'
+
+    def run(
+        self,
+        user_ids: Optional[List[str]] = None,
+        incremental: bool = False,
+        resume: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Run the batch job
+
+        Args:
+            user_ids: Users to process (defaults to every user in WardrobeDB)
+            incremental: Skip users whose wardrobe and limits are unchanged since their last result
+            resume: Continue an unfinished run from the checkpoint file
+
+        Returns:
+            Run statistics
+        """
+        self._load_checkpoint(resume)
+
+        if user_ids is None:
+            user_ids = self.wardrobe_db.list_user_ids()
+
+        done = set(self._checkpoint['completed'])
+        pending = [uid for uid in user_ids if uid not in done]
+        print(f"Precomputing recommendations for {len(pending)} users "
+              f"({len(done)} skipped from checkpoint, {self.workers} workers)")
+
+        stats = {'computed': 0, 'unchanged': 0, 'failed': 0, 'skipped': len(user_ids) - len(pending)}
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self._process_user, uid, incremental): uid for uid in pending}
+            for future in as_completed(futures):
+                user_id = futures[future]
+                error = None
+                try:
+                    status = future.result()
+                except Exception as e:
+                    print(f"Error precomputing recommendations for {user_id}: {e}")
+                    status = 'failed'
+                    error = str(e)
+                self._mark(user_id, status, error)
+                stats[status] += 1
+
+        with self._lock:
+            self._checkpoint['finished_at'] = datetime.now(timezone.utc).isoformat()
+            self._save_checkpoint()
+
+        stats['run_id'] = self._checkpoint['run_id']
+        stats['rate_limiter'] = self.rate_limiter.get_stats()
+        stats['prompt_compiler'] = self.recommender.prompt_compiler.get_stats()
+        return stats
+
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Precompute outfit recommendations for all users")
+    parser.add_argument('--workers', type=int, default=4, help="Concurrent users processed")
+    parser.add_argument('--rpm', type=float, default=60, help="Global Gemini requests per minute")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only process users whose wardrobe changed since their last result")
+    parser.add_argument('--no-resume', action='store_true', help="Ignore an unfinished checkpoint")
+    parser.add_argument('--checkpoint', type=str, default=None, help="Checkpoint file path")
+    parser.add_argument('--user', action='append', dest='user_ids', help="Only process this user (repeatable)")
+    args = parser.parse_args()
+
+    wardrobe_db = WardrobeDB(credentials_path=os.getenv('FIREBASE_CREDENTIALS_PATH'))
+    searcher = ClothesSearcher() if os.getenv("GEMINI_API_KEY") else None
+    recommender = ClothesRecommender(wardrobe_db=wardrobe_db, clothes_searcher=searcher)
+
+    precomputer = RecommendationPrecomputer(
+        recommender=recommender,
+        wardrobe_db=wardrobe_db,
+        workers=args.workers,
+        requests_per_minute=args.rpm,
+        checkpoint_path=args.checkpoint
+    )
+    stats = precomputer.run(
+        user_ids=args.user_ids,
+        incremental=args.incremental,
+        resume=not args.no_resume
+    )
+
+    print("=" * 70)
+    print(json.dumps(stats, indent=2))
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
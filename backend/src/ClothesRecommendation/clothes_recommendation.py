@@ -13,7 +13,7 @@ Features:
 """
 
 import os
-import json
+from itertools import islice
 from typing import List, Dict, Optional, Any
 from dataclasses import dataclass, asdict, field
 from datetime import datetime
@@ -32,6 +32,10 @@ except ImportError:
 try:
     from ..WardrobeDB.wardrobe_db import WardrobeDB, ClothingItem, Outfit
     from ..ClothesSearch.clothes_search import ClothesSearcher
+    from ..Common.rate_limiter import RateLimiter
+    from ..Common.llm_json import parse_llm_json, iter_json_array, json_generation_config
+    from ..Common.gemini_clients import get_model, request_options
+    from .prompt_compiler import WardrobePromptCompiler, compact_json
 except ImportError:
     # Fallback for direct execution
     import sys
@@ -39,6 +43,59 @@ except ImportError:
     sys.path.append(str(Path(__file__).parent.parent))
     from WardrobeDB.wardrobe_db import WardrobeDB, ClothingItem, Outfit
     from ClothesSearch.clothes_search import ClothesSearcher
+    from Common.rate_limiter import RateLimiter
+    from Common.llm_json import parse_llm_json, iter_json_array, json_generation_config
+    from Common.gemini_clients import get_model, request_options
+    from ClothesRecommendation.prompt_compiler import WardrobePromptCompiler, compact_json
+
+
+# Response schemas for Gemini structured output
+_STRING_LIST = {"type": "array", "items": {"type": "string"}}
+
+STYLE_PROFILE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "dominant_colors": _STRING_LIST,
+        "style_keywords": _STRING_LIST,
+        "common_occasions": _STRING_LIST,
+        "favorite_brands": _STRING_LIST,
+        "wardrobe_strengths": _STRING_LIST,
+        "wardrobe_gaps": _STRING_LIST,
+        "style_summary": {"type": "string"}
+    },
+    "required": ["style_keywords", "style_summary"]
+}
+
+OUTFITS_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "outfit_items": _STRING_LIST,
+            "confidence_score": {"type": "number"},
+            "occasion": {"type": "string"},
+            "reasoning": {"type": "string"},
+            "style_notes": {"type": "string"},
+            "color_palette": _STRING_LIST
+        },
+        "required": ["outfit_items", "confidence_score", "occasion", "reasoning"]
+    }
+}
+
+WARDROBE_GAPS_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "category": {"type": "string"},
+            "description": {"type": "string"},
+            "reason": {"type": "string"},
+            "search_query": {"type": "string"},
+            "priority": {"type": "string", "enum": ["high", "medium", "low"]}
+        },
+        "required": ["category", "description", "reason", "search_query", "priority"]
+    }
+}
 
 
 @dataclass
@@ -116,7 +173,10 @@ class ClothesRecommender:
         self,
         gemini_api_key: Optional[str] = None,
         wardrobe_db: Optional[WardrobeDB] = None,
-        clothes_searcher: Optional[ClothesSearcher] = None
+        clothes_searcher: Optional[ClothesSearcher] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        structured_output: bool = True,
+        prompt_token_budget: int = 2000
     ):
         """
         Initialize the recommender
@@ -125,6 +185,9 @@ class ClothesRecommender:
             gemini_api_key: Gemini API key (defaults to GEMINI_API_KEY env var)
             wardrobe_db: WardrobeDB instance (will create if None)
             clothes_searcher: ClothesSearcher instance (will create if None)
+            rate_limiter: Optional shared limiter applied to every Gemini call
+            structured_output: Ask Gemini for schema-constrained JSON responses
+            prompt_token_budget: Token budget for the wardrobe item table in prompts
         """
         if not GEMINI_AVAILABLE:
             raise ImportError("google-generativeai package not installed")
@@ -136,16 +199,49 @@ class ClothesRecommender:
         # Configure Gemini
         genai.configure(api_key=self.api_key)
         
-        # Use Gemini 2.0 Flash for fast, high-quality responses
-        self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
+        # Use Gemini Flash for fast, high-quality responses
+        self.model = genai.GenerativeModel(get_model('text'))
         
         # Initialize integrations
         self.wardrobe_db = wardrobe_db
         self.clothes_searcher = clothes_searcher
+        self.rate_limiter = rate_limiter
+        self.structured_output = structured_output
+        self.prompt_compiler = WardrobePromptCompiler(token_budget=prompt_token_budget)
         
         # Cache for user style profiles (simple in-memory cache)
         self._style_cache: Dict[str, Dict[str, Any]] = {}
     
+    def _generate(self, prompt: str, schema: Optional[Dict[str, Any]] = None, stream: bool = False):
+        """
+        Call Gemini, waiting on the shared rate limiter if one is configured
+        
+        Args:
+            prompt: Prompt text
+            schema: Response schema used when structured output is enabled
+            stream: Return an iterator of response chunks
+        """
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        
+        kwargs = {'request_options': request_options('text')}
+        if self.structured_output and schema:
+            kwargs['generation_config'] = json_generation_config(schema)
+        if stream:
+            kwargs['stream'] = True
+        return self.model.generate_content(prompt, **kwargs)
+    
+    @staticmethod
+    def _iter_chunk_text(response):
+        """Yield text from a streamed response, skipping chunks without text parts"""
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                continue
+            if text:
+                yield text
+    
     def analyze_user_style(
         self,
         user_outfits: List[Dict[str, Any]],
@@ -161,35 +257,27 @@ class ClothesRecommender:
         Returns:
             Dictionary with style profile and insights
         """
-        # Prepare data for analysis
-        outfits_summary = []
-        for outfit in user_outfits:
-            outfits_summary.append({
-                'name': outfit.get('name', 'Unnamed'),
-                'occasion': outfit.get('occasion', 'casual'),
-                'items': outfit.get('clothing_item_ids', []) or outfit.get('items', [])
-            })
-        
-        # Prepare clothing items summary if available
-        items_summary = []
+        # Compile wardrobe items into a compact, budgeted table
+        compiled_items = None
         if user_clothing_items:
-            for item in user_clothing_items:
-                items_summary.append({
-                    'name': item.name,
-                    'category': item.category,
-                    'color': item.color,
-                    'brand': item.brand
-                })
+            compiled_items = self.prompt_compiler.compile_items(
+                user_clothing_items,
+                wear_counts=self.prompt_compiler.wear_counts(user_outfits),
+                include_ids=True
+            )
+        outfits_table = self.prompt_compiler.compile_outfits(user_outfits, compiled_items)
         
         # Create prompt for style analysis
         prompt = f"""
 Analyze this user's fashion style based on their wardrobe and outfits.
+Tables are pipe-separated; outfit items refer to the wardrobe item refs ("+N unlisted" counts
+items of the outfit left out of the wardrobe table).
 
 EXISTING OUTFITS:
-{json.dumps(outfits_summary, indent=2)}
+{outfits_table or "Not provided"}
 
 WARDROBE ITEMS:
-{json.dumps(items_summary[:30], indent=2) if items_summary else "Not provided"}
+{compiled_items.table if compiled_items and compiled_items.table else "Not provided"}
 
 Please analyze and return a JSON object with the following structure:
 {{
@@ -206,32 +294,25 @@ Focus on being specific and actionable. Return ONLY the JSON object, no addition
 """
         
         try:
-            response = self.model.generate_content(prompt)
-            
-            # Parse JSON response
-            response_text = response.text.strip()
-            # Remove markdown code blocks if present
-            if response_text.startswith('```'):
-                response_text = response_text.split('```')[1]
-                if response_text.startswith('json'):
-                    response_text = response_text[4:]
-                response_text = response_text.strip()
+            response = self._generate(prompt, schema=STYLE_PROFILE_SCHEMA)
             
-            style_profile = json.loads(response_text)
-            return style_profile
+            style_profile = parse_llm_json(response.text, expect=dict)
+            if style_profile is not None:
+                return style_profile
             
         except Exception as e:
             print(f"Error analyzing user style: {e}")
-            # Return default profile
-            return {
-                "dominant_colors": [],
-                "style_keywords": ["casual"],
-                "common_occasions": ["casual"],
-                "favorite_brands": [],
-                "wardrobe_strengths": [],
-                "wardrobe_gaps": [],
-                "style_summary": "Unable to analyze style at this time"
-            }
+        
+        # Return default profile
+        return {
+            "dominant_colors": [],
+            "style_keywords": ["casual"],
+            "common_occasions": ["casual"],
+            "favorite_brands": [],
+            "wardrobe_strengths": [],
+            "wardrobe_gaps": [],
+            "style_summary": "Unable to analyze style at this time"
+        }
     
     def recommend_outfits(
         self,
@@ -261,22 +342,16 @@ Focus on being specific and actionable. Return ONLY the JSON object, no addition
         if not clothing_items:
             return []
         
-        # Convert to dict format for AI processing
-        items_data = []
-        for item in clothing_items:
-            items_data.append({
-                'id': item.id,
-                'name': item.name,
-                'category': item.category,
-                'color': item.color,
-                'brand': item.brand,
-                'tags': item.tags
-            })
+        # Only pay for outfit usage stats when the wardrobe must be sampled
+        wear_counts = None
+        if self.prompt_compiler.exceeds_budget(clothing_items):
+            wear_counts = self.prompt_compiler.wear_counts(self.wardrobe_db.get_user_outfits(user_id))
+        compiled_items = self.prompt_compiler.compile_items(clothing_items, wear_counts=wear_counts)
         
         # Create prompt for outfit recommendations
         style_context = ""
         if style_profile:
-            style_context = f"\nUser Style Profile: {json.dumps(style_profile, indent=2)}"
+            style_context = f"\nUser Style Profile: {compact_json(style_profile)}"
         
         occasion_context = ""
         if occasion:
@@ -285,8 +360,8 @@ Focus on being specific and actionable. Return ONLY the JSON object, no addition
         prompt = f"""
 You are a professional fashion stylist. Create {max_outfits} complete outfit recommendations from these wardrobe items.
 
-AVAILABLE ITEMS:
-{json.dumps(items_data, indent=2)}
+AVAILABLE ITEMS (pipe-separated, "ref" identifies each item):
+{compiled_items.table}
 {style_context}
 {occasion_context}
 
@@ -300,7 +375,7 @@ Create outfit combinations that:
 Return a JSON array with this structure:
 [
   {{
-    "outfit_items": ["item_id_1", "item_id_2", "item_id_3"],
+    "outfit_items": ["I1", "I4", "I7"],
     "confidence_score": 85,
     "occasion": "casual",
     "reasoning": "Why this outfit works well",
@@ -309,30 +384,25 @@ Return a JSON array with this structure:
   }}
 ]
 
-Return ONLY the JSON array, no additional text. Make sure outfit_items contains valid item IDs from the available items.
+Return ONLY the JSON array, no additional text. Make sure outfit_items contains valid refs from the available items.
 """
         
         try:
-            response = self.model.generate_content(prompt)
-            
-            # Parse JSON response
-            response_text = response.text.strip()
-            if response_text.startswith('```'):
-                response_text = response_text.split('```')[1]
-                if response_text.startswith('json'):
-                    response_text = response_text[4:]
-                response_text = response_text.strip()
+            response = self._generate(prompt, schema=OUTFITS_SCHEMA)
             
-            outfits_data = json.loads(response_text)
+            outfits_data = parse_llm_json(response.text, expect=list, default=[])
+            items_by_id = {item.id: item for item in clothing_items}
             
             # Convert to OutfitRecommendation objects
             recommendations = []
             for outfit_data in outfits_data[:max_outfits]:
-                # Get full item details
-                item_ids = outfit_data.get('outfit_items', [])
+                if not isinstance(outfit_data, dict):
+                    continue
+                # Map refs back to real IDs and get full item details
+                item_ids = [compiled_items.resolve(ref) for ref in outfit_data.get('outfit_items', [])]
                 full_items = []
                 for item_id in item_ids:
-                    item = next((i for i in clothing_items if i.id == item_id), None)
+                    item = items_by_id.get(item_id)
                     if item:
                         full_items.append({
                             'id': item.id,
@@ -402,7 +472,7 @@ Return ONLY the JSON array, no additional text. Make sure outfit_items contains
         # Create prompt for gap analysis
         style_context = ""
         if style_profile:
-            style_context = f"\nUser Style Profile: {json.dumps(style_profile, indent=2)}"
+            style_context = f"\nUser Style Profile: {compact_json(style_profile)}"
         
         occasion_context = ""
         if occasion:
@@ -411,11 +481,11 @@ Return ONLY the JSON array, no additional text. Make sure outfit_items contains
         prompt = f"""
 You are a personal shopping assistant. Analyze this user's wardrobe and identify missing items they should buy.
 
-WARDROBE SUMMARY:
-{json.dumps(category_counts, indent=2)}
+WARDROBE SUMMARY (items per category):
+{compact_json(category_counts)}
 
 OUTFIT USAGE:
-{json.dumps(outfits_summary, indent=2)}
+{self.prompt_compiler.compile_outfits(outfits_summary) or "No outfits yet"}
 {style_context}
 {occasion_context}
 
@@ -440,59 +510,67 @@ Priority levels: high, medium, low
 Return ONLY the JSON array, no additional text.
 """
         
-        try:
-            response = self.model.generate_content(prompt)
-            
-            # Parse JSON response
-            response_text = response.text.strip()
-            if response_text.startswith('```'):
-                response_text = response_text.split('```')[1]
-                if response_text.startswith('json'):
-                    response_text = response_text[4:]
-                response_text = response_text.strip()
-            
-            gaps_data = json.loads(response_text)
-            
-            # Convert to MissingItemRecommendation objects
-            recommendations = []
-            for gap in gaps_data[:max_suggestions]:
+        # Gaps received so far, and the gap index behind each product search
+        received_gaps: List[Dict[str, Any]] = []
+        searched_gaps: List[int] = []
+        products_by_gap: Dict[int, List[dict]] = {}
+        
+        def gap_searches():
+            for gap in islice(gaps, max_suggestions):
+                if not isinstance(gap, dict):
+                    continue
+                received_gaps.append(gap)
                 search_query = gap.get('search_query', '')
-                
-                # Get product links if clothes searcher is available
-                product_links = []
                 if self.clothes_searcher and search_query:
-                    try:
-                        print(f"Searching for products: {search_query}")
-                        products = self.clothes_searcher.search_products(search_query, n=5)
-                        print(f"Found {len(products)} products")
-                        product_links = [
-                            ProductLink(
-                                url=p['url'],
-                                title=p['title'],
-                                description=p.get('description', '')
-                            )
-                            for p in products
-                        ]
-                    except Exception as e:
-                        print(f"Error searching for products '{search_query}': {e}")
-                        # Continue without product links instead of failing
+                    print(f"Searching for products: {search_query}")
+                    searched_gaps.append(len(received_gaps) - 1)
+                    yield {'query': search_query, 'n': 5}
                 else:
                     print(f"ClothesSearcher not available for query: {search_query}")
-                
-                recommendations.append(MissingItemRecommendation(
-                    category=gap.get('category', 'other'),
-                    description=gap.get('description', ''),
-                    reason=gap.get('reason', ''),
-                    search_query=search_query,
-                    product_links=product_links,
-                    priority=gap.get('priority', 'medium')
-                ))
-            
-            return recommendations
+        
+        try:
+            # Stream the response so product searches for the first gaps start
+            # (concurrently) while the remaining gaps are still being generated
+            response = self._generate(prompt, schema=WARDROBE_GAPS_SCHEMA, stream=True)
+            gaps = iter_json_array(self._iter_chunk_text(response))
             
+            if self.clothes_searcher:
+                for index, products, error in self.clothes_searcher.iter_search_many(gap_searches()):
+                    if error is not None:
+                        # Continue without product links instead of failing
+                        print(f"Error searching for products '{received_gaps[searched_gaps[index]].get('search_query')}': {error}")
+                        continue
+                    print(f"Found {len(products)} products")
+                    products_by_gap[searched_gaps[index]] = products
+            else:
+                for _ in gap_searches():
+                    pass
+        
         except Exception as e:
+            # Keep the gaps that were fully received before the failure
             print(f"Error finding wardrobe gaps: {e}")
-            return []
+        
+        # Convert to MissingItemRecommendation objects
+        recommendations = []
+        for gap_index, gap in enumerate(received_gaps):
+            product_links = [
+                ProductLink(
+                    url=p['url'],
+                    title=p['title'],
+                    description=p.get('description', '')
+                )
+                for p in products_by_gap.get(gap_index, [])
+            ]
+            recommendations.append(MissingItemRecommendation(
+                category=gap.get('category', 'other'),
+                description=gap.get('description', ''),
+                reason=gap.get('reason', ''),
+                search_query=gap.get('search_query', ''),
+                product_links=product_links,
+                priority=gap.get('priority', 'medium')
+            ))
+        
+        return recommendations
     
     def generate_recommendations(
         self,
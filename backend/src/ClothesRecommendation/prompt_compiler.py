@@ -0,0 +1,283 @@
+"""
+Wardrobe Prompt Compiler
+
+Encodes wardrobe items compactly for Gemini prompts:
+- Short aliases (I1, I2, ...) instead of full UUIDs, mapped back after the call
+- Pipe-separated table instead of indented JSON, one row per item
+- Columns that are empty for every item are dropped
+- A configurable token budget; large wardrobes are sampled across categories,
+  favouring the most worn items
+- Reports tokens saved against the previous `json.dumps(..., indent=2)` payload
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import List, Dict, Optional, Any, Callable, Sequence
+
+try:
+    from ..WardrobeDB.wardrobe_db import ClothingItem
+except ImportError:
+    # Fallback for direct execution
+    import sys
+    from pathlib import Path
+    sys.path.append(str(Path(__file__).parent.parent))
+    from WardrobeDB.wardrobe_db import ClothingItem
+
+
+DEFAULT_FIELDS = ('name', 'category', 'color', 'brand', 'tags')
+
+
+@dataclass
+class CompiledWardrobe:
+    """Result of compiling wardrobe items into a prompt table"""
+    table: str
+    aliases: Dict[str, str]  # alias -> real item ID
+    total_items: int
+    included_items: int
+    tokens: int
+    baseline_tokens: int
+    ids_to_aliases: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.baseline_tokens - self.tokens)
+
+    @property
+    def sampled(self) -> bool:
+        return self.included_items < self.total_items
+
+    def resolve(self, alias: Any) -> Optional[str]:
+        """Map an alias from model output back to the real item ID"""
+        alias = str(alias).strip()
+        if alias in self.aliases:
+            return self.aliases[alias]
+        # Tolerate the model echoing a real ID or changing the alias case
+        if alias in self.ids_to_aliases:
+            return alias
+        return self.aliases.get(alias.upper())
+
+
+class WardrobePromptCompiler:
+    """Compiles wardrobe items into compact, token-budgeted prompt tables"""
+
+    def __init__(
+        self,
+        token_budget: int = 2000,
+        fields: Sequence[str] = DEFAULT_FIELDS,
+        token_counter: Optional[Callable[[str], int]] = None,
+        chars_per_token: float = 4.0,
+        verbose: bool = False
+    ):
+        """
+        Initialize the compiler
+
+        Args:
+            token_budget: Maximum tokens spent on the item table
+            fields: ClothingItem attributes included as columns
+            token_counter: Optional exact token counter (e.g. model.count_tokens wrapper);
+                           defaults to a characters-per-token estimate
+            chars_per_token: Ratio used by the default estimate
+            verbose: Print the tokens-saved report for every compile
+        """
+        self.token_budget = token_budget
+        self.fields = tuple(fields)
+        self._token_counter = token_counter
+        self.chars_per_token = chars_per_token
+        self.verbose = verbose
+
+        # Cumulative stats across calls
+        self.calls = 0
+        self.total_tokens_saved = 0
+
+    def estimate_tokens(self, text: str) -> int:
+        """Estimate the token count of a text"""
+        if self._token_counter:
+            return self._token_counter(text)
+        return int(len(text) / self.chars_per_token) + 1
+
+    @staticmethod
+    def wear_counts(outfits: Sequence[Any]) -> Dict[str, int]:
+        """
+        Count how often each item is worn, from Outfit objects or outfit dicts
+
+        Each outfit counts once plus its times_worn.
+        """
+        counts: Dict[str, int] = {}
+        for outfit in outfits:
+            if isinstance(outfit, dict):
+                item_ids = outfit.get('clothing_item_ids') or []
+                times_worn = outfit.get('times_worn') or 0
+            else:
+                item_ids = outfit.clothing_item_ids or []
+                times_worn = outfit.times_worn or 0
+            for item_id in item_ids:
+                counts[item_id] = counts.get(item_id, 0) + 1 + times_worn
+        return counts
+
+    @staticmethod
+    def _cell(value: Any) -> str:
+        if value is None:
+            return ''
+        if isinstance(value, (list, tuple)):
+            value = ';'.join(str(v) for v in value if v)
+        return str(value).replace('|', '/').replace('\n', ' ').strip()
+
+    def _sample_order(self, items: List[ClothingItem], wear_counts: Dict[str, int]) -> List[ClothingItem]:
+        """
+        Order items so any prefix is a balanced sample
+
+        Categories are interleaved round-robin; within a category the most worn
+        (then most recently updated) items come first.
+        """
+        by_category: Dict[str, List[ClothingItem]] = {}
+        for item in items:
+            by_category.setdefault(item.category or 'other', []).append(item)
+
+        for category_items in by_category.values():
+            category_items.sort(
+                key=lambda i: (wear_counts.get(i.id, 0), i.updated_at or ''),
+                reverse=True
+            )
+
+        # Larger categories first so each round starts with the richest one
+        queues = sorted(by_category.values(), key=len, reverse=True)
+        ordered = []
+        depth = 0
+        while len(ordered) < len(items):
+            for queue in queues:
+                if depth < len(queue):
+                    ordered.append(queue[depth])
+            depth += 1
+        return ordered
+
+    def compile_items(
+        self,
+        items: List[ClothingItem],
+        wear_counts: Optional[Dict[str, int]] = None,
+        include_ids: bool = True,
+        token_budget: Optional[int] = None
+    ) -> CompiledWardrobe:
+        """
+        Compile wardrobe items into a prompt table
+
+        Args:
+            items: Clothing items
+            wear_counts: Optional item ID -> wear count used when sampling
+            include_ids: Add an alias column the model can reference
+            token_budget: Override the configured budget for this call
+
+        Returns:
+            CompiledWardrobe with the table text and alias mapping
+        """
+        budget = token_budget or self.token_budget
+        ordered = self._sample_order(items, wear_counts or {})
+
+        # Drop columns that are empty for every item
+        columns = [f for f in self.fields if any(self._cell(getattr(i, f, None)) for i in items)]
+        header = '|'.join((['ref'] if include_ids else []) + columns)
+        tokens = self.estimate_tokens(header)
+
+        rows = []
+        aliases: Dict[str, str] = {}
+        for index, item in enumerate(ordered, 1):
+            alias = f"I{index}"
+            cells = [self._cell(getattr(item, f, None)) for f in columns]
+            row = '|'.join(([alias] if include_ids else []) + cells)
+            row_tokens = self.estimate_tokens(row)
+            if tokens + row_tokens > budget and rows:
+                break
+            rows.append(row)
+            aliases[alias] = item.id
+            tokens += row_tokens
+
+        table = '\n'.join([header] + rows) if rows else ''
+
+        # What the previous implementation sent for the same items
+        baseline = json.dumps(
+            [{'id': i.id, **{f: getattr(i, f, None) for f in self.fields}} for i in items],
+            indent=2
+        )
+
+        compiled = CompiledWardrobe(
+            table=table,
+            aliases=aliases,
+            total_items=len(items),
+            included_items=len(rows),
+            tokens=tokens if rows else 0,
+            baseline_tokens=self.estimate_tokens(baseline),
+            ids_to_aliases={v: k for k, v in aliases.items()}
+        )
+
+        self.calls += 1
+        self.total_tokens_saved += compiled.tokens_saved
+        if self.verbose:
+            print(
+                f"[PromptCompiler] {compiled.included_items}/{compiled.total_items} items, "
+                f"~{compiled.tokens} tokens (saved ~{compiled.tokens_saved} vs JSON)"
+            )
+        return compiled
+
+    def exceeds_budget(self, items: List[ClothingItem]) -> bool:
+        """Whether the full item table would exceed the token budget (sampling needed)"""
+        columns = [f for f in self.fields if any(self._cell(getattr(i, f, None)) for i in items)]
+        text = '\n'.join('|'.join(self._cell(getattr(i, f, None)) for f in columns) for i in items)
+        # Alias column adds roughly 2 tokens per row
+        return self.estimate_tokens(text) + 2 * len(items) > self.token_budget
+
+    def compile_outfits(
+        self,
+        outfits: List[Dict[str, Any]],
+        compiled_items: Optional[CompiledWardrobe] = None,
+        max_outfits: Optional[int] = None
+    ) -> str:
+        """
+        Compile outfit summaries into a prompt table
+
+        Item IDs are replaced by the aliases from `compiled_items`. Items that
+        were sampled out of the item table are counted instead ("+2 unlisted"),
+        so the model never takes an outfit for fewer items than it has; an
+        outfit none of whose items are listed falls back to its free-text
+        items if it has any.
+        """
+        columns = ['name', 'occasion', 'times_worn', 'items']
+        rows = []
+        for outfit in outfits[:max_outfits]:
+            item_ids = outfit.get('clothing_item_ids') or []
+            item_refs = list(item_ids)
+            if compiled_items is not None and item_ids:
+                item_refs = [compiled_items.ids_to_aliases[i] for i in item_ids if i in compiled_items.ids_to_aliases]
+                unlisted = len(item_ids) - len(item_refs)
+                if unlisted and (item_refs or not outfit.get('items')):
+                    item_refs.append(f"+{unlisted} unlisted")
+            if not item_refs:
+                # Free-text item descriptions provided by the client
+                item_refs = outfit.get('items') or []
+            values = {
+                'name': outfit.get('name'),
+                'occasion': outfit.get('occasion'),
+                'times_worn': outfit.get('times_worn') or None,
+                'items': item_refs
+            }
+            rows.append([self._cell(values[c]) for c in columns])
+
+        used = [i for i, c in enumerate(columns) if any(row[i] for row in rows)]
+        if not used:
+            return ''
+        lines = ['|'.join(columns[i] for i in used)]
+        lines += ['|'.join(row[i] for i in used) for row in rows]
+        return '\n'.join(lines)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cumulative compiler statistics"""
+        return {
+            'token_budget': self.token_budget,
+            'calls': self.calls,
+            'total_tokens_saved': self.total_tokens_saved
+        }
+
+
+def compact_json(data: Any) -> str:
+    """Serialize auxiliary prompt data without indentation or null fields"""
+    if isinstance(data, dict):
+        data = {k: v for k, v in data.items() if v not in (None, '', [], {})}
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False)
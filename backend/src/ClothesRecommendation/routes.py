@@ -18,8 +18,11 @@ try:
         MissingItemRecommendation,
         GEMINI_AVAILABLE
     )
+    from .batch_precompute import load_precomputed
     from ..WardrobeDB.wardrobe_db import WardrobeDB
     from ..ClothesSearch.clothes_search import ClothesSearcher
+    from ..Common.gemini_async import run_blocking
+    from ..Common.gemini_clients import get_model
 except ImportError:
     # Fallback for direct execution
     from clothes_recommendation import (
@@ -32,8 +35,11 @@ except ImportError:
     import sys
     from pathlib import Path
     sys.path.append(str(Path(__file__).parent.parent))
+    from ClothesRecommendation.batch_precompute import load_precomputed
     from WardrobeDB.wardrobe_db import WardrobeDB
     from ClothesSearch.clothes_search import ClothesSearcher
+    from Common.gemini_async import run_blocking
+    from Common.gemini_clients import get_model
 
 # Create router
 router = APIRouter(prefix="/api/recommendations", tags=["Clothes Recommendations"])
@@ -56,6 +62,7 @@ class RecommendationRequest(BaseModel):
     occasion: Optional[str] = Field(None, description="Target occasion (work, casual, date, formal, etc.)")
     max_outfits: int = Field(5, ge=1, le=10, description="Maximum outfit recommendations (1-10)")
     max_shopping_items: int = Field(5, ge=1, le=10, description="Maximum shopping suggestions (1-10)")
+    use_precomputed: bool = Field(True, description="Serve the offline precomputed result when the wardrobe is unchanged")
 
 
 class ProductLinkResponse(BaseModel):
@@ -201,6 +208,23 @@ async def analyze_and_recommend(request: RecommendationRequest):
     ```
     """
     try:
+        # Serve the batch-precomputed result when the request matches what the
+        # offline job computes (no occasion, style taken from the stored wardrobe)
+        if request.use_precomputed and not request.occasion and not request.existing_outfits:
+            try:
+                precomputed = await run_blocking(
+                    load_precomputed,
+                    get_wardrobe_db(),
+                    request.user_id,
+                    max_outfits=request.max_outfits,
+                    max_shopping_items=request.max_shopping_items
+                )
+            except Exception as e:
+                print(f"Warning: Could not load precomputed recommendations: {e}")
+                precomputed = None
+            if precomputed:
+                return RecommendationResponse(**precomputed)
+        
         recommender = get_recommender()
         
         # Convert Pydantic models to dicts
@@ -209,7 +233,8 @@ async def analyze_and_recommend(request: RecommendationRequest):
             outfits_data = [outfit.dict() for outfit in request.existing_outfits]
         
         # Generate recommendations
-        result = recommender.generate_recommendations(
+        result = await run_blocking(
+            recommender.generate_recommendations,
             user_id=request.user_id,
             user_outfits=outfits_data,
             occasion=request.occasion,
@@ -269,7 +294,8 @@ async def get_outfit_recommendations(
         recommender = get_recommender()
         
         # Generate outfit recommendations
-        outfits = recommender.recommend_outfits(
+        outfits = await run_blocking(
+            recommender.recommend_outfits,
             user_id=user_id,
             occasion=occasion,
             max_outfits=max_results
@@ -307,7 +333,8 @@ async def get_shopping_recommendations(
         recommender = get_recommender()
         
         # Find wardrobe gaps
-        missing_items = recommender.find_wardrobe_gaps(
+        missing_items = await run_blocking(
+            recommender.find_wardrobe_gaps,
             user_id=user_id,
             occasion=occasion,
             max_suggestions=max_suggestions
@@ -374,7 +401,7 @@ async def get_user_style_profile(
         clothing_items = wardrobe_db.get_user_clothing_items(user_id)
         
         # Analyze style
-        style_profile = recommender.analyze_user_style(outfits_data, clothing_items)
+        style_profile = await run_blocking(recommender.analyze_user_style, outfits_data, clothing_items)
         
         return {
             "user_id": user_id,
@@ -392,6 +419,41 @@ async def get_user_style_profile(
         )
 
 
+@router.get("/precomputed/{user_id}", response_model=RecommendationResponse)
+async def get_precomputed_recommendations(
+    user_id: str = Path(..., description="User ID"),
+    allow_stale: bool = Query(False, description="Return the stored result even if the wardrobe changed since")
+):
+    """
+    Get recommendations computed by the offline batch job
+    
+    Returns 404 if no result has been precomputed for the user, or if the
+    wardrobe changed since it was computed (unless `allow_stale` is set).
+    """
+    try:
+        result = await run_blocking(
+            load_precomputed,
+            get_wardrobe_db(),
+            user_id,
+            verify_fresh=not allow_stale
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to load precomputed recommendations: {str(e)}"
+        )
+    
+    if not result:
+        raise HTTPException(
+            status_code=404,
+            detail="No up-to-date precomputed recommendations for this user"
+        )
+    
+    return RecommendationResponse(**result)
+
+
 @router.get("/health")
 async def recommendation_health_check():
     """Check if the recommendation service is operational"""
@@ -417,7 +479,7 @@ async def recommendation_health_check():
         else:
             health_status["components"]["gemini"] = {
                 "status": "operational",
-                "model": "gemini-2.0-flash-exp"
+                "model": get_model('text')
             }
         
         # Check WardrobeDB
@@ -445,6 +507,13 @@ async def recommendation_health_check():
                 "message": "ClothesSearcher not configured (optional)"
             }
         
+        # Prompt compaction since startup (without creating the recommender)
+        if _recommender is not None:
+            health_status["components"]["prompt_compiler"] = {
+                "status": "operational",
+                **_recommender.prompt_compiler.get_stats()
+            }
+        
         return health_status
     
     except Exception as e:
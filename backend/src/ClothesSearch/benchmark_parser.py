@@ -0,0 +1,154 @@
+"""
+Search Response Parser Benchmark
+
+Compares the structured-output parser with the line-format parser chain on
+recorded Gemini responses: parse time, products recovered per response and
+how often a response yields nothing.
+
+Record real responses by running the API (or clothes_search.py) with
+SEARCH_RESPONSE_LOG=responses.jsonl, once with structured output on and once
+with it off, then:
+    python benchmark_parser.py --responses responses.jsonl
+
+Without --responses a built-in set of representative responses is used.
+"""
+
+import sys
+import json
+import time
+import argparse
+import statistics
+from pathlib import Path
+from collections import Counter
+from typing import List, Dict, Any
+
+try:
+    from .response_parser import parse_products
+except ImportError:
+    sys.path.append(str(Path(__file__).parent.parent))
+    from ClothesSearch.response_parser import parse_products
+
+
+def _text_product(i: int, image: bool = True) -> str:
+    lines = [
+        f"URL: https://www.asos.com/sg/nike/nike-air-force-1-trainers-in-white/prd/20{i:04d}",
+        f"IMAGE: https://images.asos-media.com/products/nike-air-force-1/20{i:04d}-1-white" if image else "IMAGE: N/A",
+        f"TITLE: Nike Air Force 1 '07 Trainers in White #{i}",
+        "DESC: Classic low-top trainers with a leather upper and Air cushioning. Available in Singapore."
+    ]
+    return "\n".join(lines)
+
+
+def _json_product(i: int) -> Dict[str, str]:
+    return {
+        "url": f"https://www2.hm.com/en_sg/productpage.{i:010d}.html",
+        "image": f"https://image.hm.com/assets/hm/{i:04x}/white-sneakers.jpg",
+        "title": f"Chunky Trainers #{i}",
+        "description": "Chunky trainers in faux leather with a padded top edge."
+    }
+
+
+def builtin_responses() -> List[Dict[str, Any]]:
+    """Representative responses in the shapes the search model produces"""
+    n = 10
+    text = "\n---\n".join(_text_product(i) for i in range(n))
+    markdown = "\n---\n".join(
+        f"**URL:** [https://www.zalora.sg/p/item-{i}](https://www.zalora.sg/p/item-{i})\n"
+        f"**IMAGE:** https://dynamic.zacdn.com/{i}.jpg\n**TITLE:** Linen Shirt {i}\n**DESC:** Relaxed fit."
+        for i in range(n)
+    )
+    prose = (
+        "Here are some options I found for white sneakers in Singapore: the Nike Air Force 1 "
+        "(https://www.nike.com/sg/t/air-force-1-07-shoes-WrLlWX) and the Adidas Stan Smith "
+        "(https://www.adidas.com.sg/stan-smith-shoes/FX5502), also see https://www.google.com/search?q=sneakers."
+    )
+    mixed = "\n---\n".join(_text_product(i, image=i % 2 == 0) for i in range(n)) + "\n---\nNote: prices vary."
+    structured = json.dumps({"products": [_json_product(i) for i in range(n)]})
+    structured_bad_items = json.dumps({"products": [
+        *(_json_product(i) for i in range(n - 2)),
+        {"url": "https://www.google.com/search?q=white+sneakers", "title": "Search results"},
+        {"url": "not a url", "title": "Broken"}
+    ]})
+    structured_truncated = structured[:int(len(structured) * 0.8)]
+    fenced = "```json\n" + json.dumps([_json_product(i) for i in range(n)]) + "\n```"
+
+    return [
+        {'structured': False, 'n': n, 'text': text, 'label': 'line format'},
+        {'structured': False, 'n': n, 'text': markdown, 'label': 'line format in markdown'},
+        {'structured': False, 'n': n, 'text': mixed, 'label': 'line format, missing images'},
+        {'structured': False, 'n': n, 'text': prose, 'label': 'prose with links'},
+        {'structured': False, 'n': n, 'text': fenced, 'label': 'fenced JSON'},
+        {'structured': True, 'n': n, 'text': structured, 'label': 'schema JSON'},
+        {'structured': True, 'n': n, 'text': structured_bad_items, 'label': 'schema JSON, invalid items'},
+        {'structured': True, 'n': n, 'text': structured_truncated, 'label': 'schema JSON, truncated'},
+    ]
+
+
+def load_responses(path: str) -> List[Dict[str, Any]]:
+    """Load responses recorded with SEARCH_RESPONSE_LOG"""
+    responses = []
+    with open(path, encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            if line.strip():
+                record = json.loads(line)
+                record.setdefault('label', f"line {line_no}")
+                responses.append(record)
+    return responses
+
+
+def time_parse(text: str, n: int, structured: bool, repeat: int) -> float:
+    """Median parse time in microseconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse_products(text, n, structured=structured)
+        timings.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(timings)
+
+
+def run_benchmark(responses: List[Dict[str, Any]], repeat: int = 200) -> None:
+    print("=" * 86)
+    print(f"{'response':34} {'mode':10} {'method':10} {'products':>9} {'parse us':>10}")
+    print("=" * 86)
+
+    totals: Dict[str, Dict[str, Any]] = {}
+    for record in responses:
+        text, n, structured = record['text'], record.get('n', 10), record.get('structured', False)
+        products, method = parse_products(text, n, structured=structured)
+        micros = time_parse(text, n, structured, repeat)
+        mode = 'structured' if structured else 'text'
+        print(f"{record['label'][:34]:34} {mode:10} {method:10} {len(products):>4}/{n:<4} {micros:>10.1f}")
+
+        total = totals.setdefault(mode, {'responses': 0, 'products': 0, 'requested': 0, 'empty': 0,
+                                         'micros': [], 'methods': Counter()})
+        total['responses'] += 1
+        total['products'] += len(products)
+        total['requested'] += n
+        total['empty'] += not products
+        total['micros'].append(micros)
+        total['methods'][method] += 1
+
+    print("\nSummary")
+    for mode, total in totals.items():
+        print(f"  {mode:10} responses={total['responses']:<4} "
+              f"yield={total['products'] / total['requested']:.0%} "
+              f"empty={total['empty'] / total['responses']:.0%} "
+              f"median parse={statistics.median(total['micros']):.1f} us "
+              f"methods={dict(total['methods'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark search response parsers")
+    parser.add_argument("--responses", help="JSON lines file recorded with SEARCH_RESPONSE_LOG")
+    parser.add_argument("--repeat", type=int, default=200, help="Parses per response for timing")
+    args = parser.parse_args()
+
+    responses = load_responses(args.responses) if args.responses else builtin_responses()
+    if not responses:
+        print("No responses to benchmark")
+        return
+    run_benchmark(responses, repeat=args.repeat)
+
+
+if __name__ == "__main__":
+    main()
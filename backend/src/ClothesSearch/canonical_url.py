@@ -0,0 +1,104 @@
+"""
+Canonical Product URL Keys
+
+The same product comes back from different queries (and sometimes twice in
+one response) with tracking parameters, mobile or www. hosts, http links
+or trailing slashes. The canonical form of a URL is used as a key, so the
+catalog, link verifier, image proxy and result dedupe treat these as one
+product:
+- Tracking parameters (utm_*, ref, gclid, fbclid, ...) and fragments dropped
+- http and https folded together, host lowercased, default port removed
+- Mobile and desktop hosts folded together (m., mobile. and www. prefixes dropped)
+- Duplicate slashes collapsed, trailing slash and Amazon-style /ref=... segments removed
+- Remaining query parameters sorted (and re-encoded)
+
+The canonical form is only a key and is never shown or fetched: it may drop
+affiliate parameters the shop needs, or not be a valid page at all. Products
+keep the URL they were found with.
+
+Example:
+    canonicalize_url("http://M.Zalora.sg/p/shirt-123/?utm_source=x&color=red#reviews")
+    -> "https://zalora.sg/p/shirt-123?color=red"
+"""
+
+import re
+from typing import List, Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+
+# Exact parameter names that only identify the referrer or campaign
+TRACKING_PARAMS = {
+    'ref', 'ref_', 'refsrc', 'referrer', 'tag', 'affiliate', 'aff_id',
+    'gclid', 'gclsrc', 'dclid', 'fbclid', 'msclkid', 'yclid', 'igshid', 'twclid', 'ttclid',
+    'mc_cid', 'mc_eid', 'srsltid', 'spm', 'scm', '_ga', '_gl', 'cmpid', 'campaign'
+}
+# Parameter prefixes with the same meaning
+TRACKING_PREFIXES = ('utm_', 'pd_rd_', 'pf_rd_', 'hsa_', 'trk')
+
+# Host prefixes of the same site's mobile and desktop versions (dropped only if a domain remains)
+_HOST_PREFIX_RE = re.compile(r'^(?:www|m|mobile)\.(?=[^.]+\.)')
+_AMAZON_REF_RE = re.compile(r'/ref=[^/]*$')
+_SLASHES_RE = re.compile(r'/{2,}')
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def _is_tracking_param(name: str) -> bool:
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def canonicalize_url(url: Optional[str]) -> Optional[str]:
+    """
+    Canonical key of a product or image URL (not for display or fetching)
+
+    URLs that are not absolute http(s) URLs are returned stripped but
+    otherwise unchanged.
+    """
+    if not url:
+        return url
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    if scheme not in _DEFAULT_PORTS or not parts.hostname:
+        return url
+
+    host = _HOST_PREFIX_RE.sub('', parts.hostname.lower().rstrip('.'))
+    if port and port != _DEFAULT_PORTS[scheme]:
+        host = f"{host}:{port}"
+
+    path = _SLASHES_RE.sub('/', parts.path)
+    path = _AMAZON_REF_RE.sub('', path)
+    if path != '/':
+        path = path.rstrip('/')
+
+    params = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not _is_tracking_param(k)]
+    query = urlencode(sorted(params))
+
+    return urlunsplit(('https', host, path or '/', query, ''))
+
+
+def dedupe_products(products: List[dict]) -> List[dict]:
+    """
+    Drop products whose URLs share a canonical key
+
+    The first occurrence is kept with its URL unchanged; a missing image or
+    description is filled in from a later duplicate.
+    """
+    seen = {}
+    unique = []
+    for product in products:
+        product = dict(product)
+        key = canonicalize_url(product.get('url'))
+        existing = seen.get(key)
+        if existing is None:
+            seen[key] = product
+            unique.append(product)
+            continue
+        for field in ('image', 'description'):
+            if not existing.get(field) and product.get(field):
+                existing[field] = product[field]
+    return unique
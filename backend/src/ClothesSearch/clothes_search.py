@@ -6,9 +6,11 @@ based on user queries for fashion items.
 """
 
 import os
-import re
 import sys
-from typing import List, Optional
+import json
+import threading
+from typing import List, Optional, Dict, Any, Iterable, Iterator, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 
 # Fix Windows encoding issues
@@ -23,6 +25,26 @@ if sys.platform == 'win32':
 # Load environment variables
 load_dotenv()
 
+try:
+    from ..Common.llm_json import json_generation_config
+    from ..Common.gemini_clients import get_client, get_model
+    from .search_cache import SearchCache, normalize_query
+    from .response_parser import PRODUCTS_SCHEMA, parse_products, parse_json_products, is_product_url
+    from .product_catalog import ProductCatalog
+    from ..Common.single_flight import SingleFlight
+    from ..Common.gemini_async import get_gemini_executor
+except ImportError:
+    # Fallback for direct execution
+    from pathlib import Path
+    sys.path.append(str(Path(__file__).parent.parent))
+    from Common.llm_json import json_generation_config
+    from Common.gemini_clients import get_client, get_model
+    from ClothesSearch.search_cache import SearchCache, normalize_query
+    from ClothesSearch.response_parser import PRODUCTS_SCHEMA, parse_products, parse_json_products, is_product_url
+    from ClothesSearch.product_catalog import ProductCatalog
+    from Common.single_flight import SingleFlight
+    from Common.gemini_async import get_gemini_executor
+
 try:
     import google.genai as genai
     from google.genai import types
@@ -40,15 +62,36 @@ except ImportError:
         print("Run: pip install google-genai")
 
 
+# Shared by every ClothesSearcher in the process so concurrent identical
+# searches from different routes (search, recommendations) share one call
+_search_flight = SingleFlight("clothes_search")
+_response_log_lock = threading.Lock()
+
+
 class ClothesSearcher:
     """Search for clothing products using Gemini API with Google Search"""
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        rate_limiter=None,
+        cache: Optional[SearchCache] = None,
+        enable_cache: bool = True,
+        catalog: Optional[ProductCatalog] = None,
+        enable_catalog: bool = True,
+        structured_output: bool = True
+    ):
         """
         Initialize the clothes searcher
         
         Args:
             api_key: Gemini API key (defaults to GEMINI_API_KEY env var)
+            rate_limiter: Optional shared RateLimiter applied to every Gemini call
+            cache: Search result cache (a default SQLite-backed cache is created if None)
+            enable_cache: Set False to always call Gemini
+            catalog: Local product catalog fed by every live search (a default one is created if None)
+            enable_catalog: Set False to neither record products nor answer instant searches locally
+            structured_output: Ask Gemini for schema-constrained JSON instead of the line format
         """
         if not GEMINI_AVAILABLE:
             raise ImportError("google-generativeai package not installed")
@@ -57,10 +100,36 @@ class ClothesSearcher:
         if not self.api_key:
             raise ValueError("GEMINI_API_KEY not found in environment variables")
         
-        # Configure Gemini
-        client = genai.Client(api_key=self.api_key)
-        self.client = client
-        self.model_id = 'gemini-2.0-flash-exp'
+        # Shared Gemini client (one connection pool per process)
+        self.client = get_client(self.api_key, purpose='search')
+        self.model_id = get_model('search')
+        self.rate_limiter = rate_limiter
+        self.structured_output = structured_output
+        # How each response was parsed (structured, json, text, scrape, empty)
+        self.parse_stats: Dict[str, int] = {}
+        # Raw responses are appended here for parser benchmarks when set
+        self.response_log = os.getenv("SEARCH_RESPONSE_LOG")
+        
+        # Result cache keyed on the normalized query
+        self.cache = cache
+        if self.cache is None and enable_cache:
+            try:
+                self.cache = SearchCache()
+            except Exception as e:
+                print(f"Warning: Search cache disabled: {e}")
+        
+        # Full-text catalog of every product seen, for instant results
+        self.catalog = catalog
+        if self.catalog is None and enable_catalog:
+            try:
+                self.catalog = ProductCatalog()
+            except Exception as e:
+                print(f"Warning: Product catalog disabled: {e}")
+        
+        self.single_flight = _search_flight
+        # Normalized queries with a background refresh queued or running
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
     
     def search_products(
         self, 
@@ -69,7 +138,8 @@ class ClothesSearcher:
         size: Optional[str] = None,
         color: Optional[str] = None,
         brand: Optional[str] = None,
-        category: Optional[str] = None
+        category: Optional[str] = None,
+        use_cache: bool = True
     ) -> List[dict]:
         """
         Search for clothing products based on query with optional filters
@@ -81,6 +151,7 @@ class ClothesSearcher:
             color: Color filter (e.g., "black", "blue")
             brand: Brand filter (e.g., "Nike", "Adidas")
             category: Category filter (e.g., "Tops", "Shoes", "Dresses")
+            use_cache: Serve repeat searches from the result cache
         
         Returns:
             List of dictionaries with product information:
@@ -93,6 +164,204 @@ class ClothesSearcher:
                 ...
             ]
         """
+        # Repeat searches are served from the cache
+        if use_cache:
+            cached = self.get_cached(query, n, size, color, brand, category)
+            if cached is not None:
+                return cached
+        
+        return self.fetch_products(query, n, size, color, brand, category, store=use_cache)
+    
+    def fetch_products(
+        self,
+        query: str,
+        n: int = 10,
+        size: Optional[str] = None,
+        color: Optional[str] = None,
+        brand: Optional[str] = None,
+        category: Optional[str] = None,
+        store: bool = True
+    ) -> List[dict]:
+        """
+        Search Gemini without a cache lookup (use after get_cached missed)
+        
+        Concurrent identical searches are coalesced into one call; the result is
+        stored in the cache when `store` is set.
+        """
+        key = normalize_query(query, size=size, color=color, brand=brand, category=category)
+        
+        def fetch() -> List[dict]:
+            products = self._search_gemini(query, n, size, color, brand, category)
+            if store and self.cache:
+                self.cache.set(key, n, products)
+            if self.catalog:
+                try:
+                    self.catalog.add_products(products, brand=brand, category=category, color=color)
+                except Exception as e:
+                    print(f"Warning: Failed to add products to catalog: {e}")
+            return products
+        
+        # Concurrent identical searches share one Gemini call
+        return self.single_flight.do((key, n), fetch)
+    
+    def get_cached(
+        self,
+        query: str,
+        n: int = 10,
+        size: Optional[str] = None,
+        color: Optional[str] = None,
+        brand: Optional[str] = None,
+        category: Optional[str] = None
+    ) -> Optional[List[dict]]:
+        """
+        Look up a search in the result cache without calling Gemini
+        
+        Returns:
+            Cached products, or None on a miss (or when caching is disabled)
+        """
+        if not self.cache:
+            return None
+        key = normalize_query(query, size=size, color=color, brand=brand, category=category)
+        return self.cache.get(key, n)
+    
+    def search_instant(
+        self,
+        query: str,
+        n: int = 10,
+        size: Optional[str] = None,
+        color: Optional[str] = None,
+        brand: Optional[str] = None,
+        category: Optional[str] = None
+    ) -> Tuple[List[dict], str]:
+        """
+        Answer a search immediately from local data
+        
+        A fresh cached result is returned as is. Otherwise matching products
+        from the local catalog are returned (possibly none) and the live Gemini
+        search is started in the background, so the next identical search is
+        served its result from the cache.
+        
+        Returns:
+            Tuple of (products, source) where source is "cache" or "catalog"
+        """
+        cached = self.get_cached(query, n, size, color, brand, category)
+        if cached is not None:
+            return cached, "cache"
+        
+        products = []
+        if self.catalog:
+            products = self.catalog.search(query, n, size=size, color=color, brand=brand, category=category)
+        self.refresh_in_background(query, n, size, color, brand, category)
+        return products, "catalog"
+    
+    def refresh_in_background(
+        self,
+        query: str,
+        n: int = 10,
+        size: Optional[str] = None,
+        color: Optional[str] = None,
+        brand: Optional[str] = None,
+        category: Optional[str] = None
+    ) -> bool:
+        """
+        Run the live search on the Gemini executor without waiting for it
+        
+        Returns:
+            False if a refresh for the same search is already queued or running
+        """
+        key = (normalize_query(query, size=size, color=color, brand=brand, category=category), n)
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+        
+        def refresh():
+            try:
+                self.fetch_products(query, n, size, color, brand, category)
+            except Exception as e:
+                print(f"Background search refresh failed for '{query}': {e}")
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(key)
+        
+        get_gemini_executor().submit(refresh)
+        return True
+    
+    def iter_search_many(
+        self,
+        searches: Iterable[Dict[str, Any]],
+        max_concurrency: int = 4,
+        use_cache: bool = True
+    ) -> Iterator[Tuple[int, Optional[List[dict]], Optional[Exception]]]:
+        """
+        Run several searches concurrently, yielding each result as it is ready
+        
+        Cache hits are yielded immediately; misses run on a pool of
+        `max_concurrency` threads. `searches` may be a generator: each search is
+        started as soon as it is produced.
+        
+        Args:
+            searches: Dicts with search_products arguments (query, n, size, color, brand, category)
+            max_concurrency: Maximum Gemini searches running at once
+            use_cache: Serve repeat searches from the result cache
+        
+        Yields:
+            (index, products, error) tuples in completion order; products is None on error
+        """
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+            futures = {}
+            for index, search in enumerate(searches):
+                params = {'n': 10, **search}
+                if use_cache:
+                    cached = self.get_cached(**params)
+                    if cached is not None:
+                        yield index, cached, None
+                        continue
+                futures[pool.submit(self.fetch_products, store=use_cache, **params)] = index
+            
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], None, e
+    
+    def search_many(
+        self,
+        searches: Iterable[Dict[str, Any]],
+        max_concurrency: int = 4,
+        use_cache: bool = True
+    ) -> List[List[dict]]:
+        """
+        Run several searches concurrently
+        
+        Args:
+            searches: Dicts with search_products arguments (query, n, size, color, brand, category)
+            max_concurrency: Maximum Gemini searches running at once
+            use_cache: Serve repeat searches from the result cache
+        
+        Returns:
+            Product lists in the same order as `searches` (empty list for a failed search)
+        
+        Example:
+            >>> searcher.search_many([{"query": "white sneakers", "n": 5}, {"query": "denim jacket"}])
+        """
+        results: Dict[int, List[dict]] = {}
+        for index, products, error in self.iter_search_many(searches, max_concurrency, use_cache):
+            if error is not None:
+                print(f"Error in batch search #{index}: {error}")
+            results[index] = products or []
+        return [results[i] for i in range(len(results))]
+    
+    def _search_gemini(
+        self,
+        query: str,
+        n: int,
+        size: Optional[str] = None,
+        color: Optional[str] = None,
+        brand: Optional[str] = None,
+        category: Optional[str] = None
+    ) -> List[dict]:
+        """Run the Gemini web search for a query (no caching or coalescing)"""
         # Build enhanced query with filters
         enhanced_query = query
         
@@ -112,8 +381,27 @@ class ClothesSearcher:
         
         # Silently add "Singapore" to focus on local availability
         enhanced_query = f"{enhanced_query} Singapore"
-        # Create a detailed prompt for fashion product search
-        prompt = f"""
+        if self.structured_output:
+            prompt = f"""
+        You are a fashion shopping assistant. Search the web and find {n} real, buyable clothing products 
+        that match this query: "{enhanced_query}"
+        
+        Requirements:
+        - Find products from real e-commerce websites (Amazon, ASOS, Zara, H&M, Nike, Nordstrom, Macy's, etc.)
+        - Each result must be a direct product page URL (not category pages)
+        - Products should be currently available for purchase
+        - Provide diverse sources
+        
+        Return a JSON object with a "products" array of exactly {n} items, each with:
+        - "url": direct product page URL (must be a real, working link)
+        - "image": main product image URL from the website
+        - "title": product name
+        - "description": brief description (1-2 sentences)
+        """
+            config = json_generation_config(PRODUCTS_SCHEMA)
+        else:
+            # Create a detailed prompt for fashion product search
+            prompt = f"""
         You are a fashion shopping assistant. Search the web and find {n} real, buyable clothing products 
         that match this query: "{enhanced_query}"
         
@@ -139,16 +427,23 @@ class ClothesSearcher:
         
         Provide exactly {n} products. Focus on giving real, working product links and their images.
         """
+            config = None
         
         try:
             # Generate content
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
             response = self.client.models.generate_content(
                 model=self.model_id,
-                contents=prompt
+                contents=prompt,
+                config=config
             )
             
+            response_text = response.text or ''
+            self._record_response(response_text, n)
+            
             # Parse the response
-            products = self._parse_response(response.text, n)
+            products = self._parse_response(response_text, n)
             
             return products
             
@@ -156,10 +451,24 @@ class ClothesSearcher:
             print(f"Error during Gemini API call: {e}")
             raise
     
+    def _record_response(self, response_text: str, n: int) -> None:
+        """Append a raw response to SEARCH_RESPONSE_LOG (JSON lines) for parser benchmarks"""
+        if not self.response_log:
+            return
+        record = {'structured': self.structured_output, 'n': n, 'text': response_text}
+        try:
+            with _response_log_lock, open(self.response_log, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+        except OSError as e:
+            print(f"Warning: Failed to record search response: {e}")
+    
     def _parse_response(self, response_text: str, max_results: int) -> List[dict]:
         """
         Parse the Gemini response to extract product information
         
+        Structured responses are validated against the product schema; the
+        JSON, line format and URL scraping parsers remain as fallbacks.
+        
         Args:
             response_text: Raw response from Gemini
             max_results: Maximum number of results to return
@@ -167,56 +476,18 @@ class ClothesSearcher:
         Returns:
             List of product dictionaries
         """
-        products = []
-        
-        # Split by separator
-        sections = response_text.split('---')
+        products, method = parse_products(response_text, max_results, structured=self.structured_output)
+        self.parse_stats[method] = self.parse_stats.get(method, 0) + 1
+        return products
+    
+    def _parse_json_products(self, response_text: str, max_results: int) -> List[dict]:
+        """
+        Extract products from a JSON (possibly fenced or truncated) response
         
-        for section in sections[:max_results]:
-            # Extract URL, IMAGE, TITLE, DESC using regex
-            url_match = re.search(r'URL:\s*(.+?)(?:\n|$)', section, re.IGNORECASE)
-            image_match = re.search(r'IMAGE:\s*(.+?)(?:\n|$)', section, re.IGNORECASE)
-            title_match = re.search(r'TITLE:\s*(.+?)(?:\n|$)', section, re.IGNORECASE)
-            desc_match = re.search(r'DESC:\s*(.+?)(?:\n|$)', section, re.IGNORECASE | re.DOTALL)
-            
-            if url_match:
-                url = url_match.group(1).strip()
-                # Clean URL - remove markdown formatting if present
-                url = re.sub(r'[\[\]\(\)]', '', url)
-                
-                # Extract and clean image URL
-                image_url = None
-                if image_match:
-                    image_url = image_match.group(1).strip()
-                    image_url = re.sub(r'[\[\]\(\)]', '', image_url)
-                    # Validate it looks like a URL
-                    if not image_url.startswith(('http://', 'https://')):
-                        image_url = None
-                
-                product = {
-                    "url": url,
-                    "image": image_url,
-                    "title": title_match.group(1).strip() if title_match else "Unknown Product",
-                    "description": desc_match.group(1).strip() if desc_match else ""
-                }
-                
-                # Validate URL
-                if self._is_valid_url(url):
-                    products.append(product)
-        
-        # Fallback: If structured parsing failed, try to extract any URLs
-        if not products:
-            urls = re.findall(r'https?://[^\s\)]+', response_text)
-            for url in urls[:max_results]:
-                if self._is_valid_url(url):
-                    products.append({
-                        "url": url,
-                        "image": None,
-                        "title": "Product Link",
-                        "description": ""
-                    })
-        
-        return products[:max_results]
+        Returns:
+            List of product dictionaries, empty if the response is not JSON
+        """
+        return parse_json_products(response_text, max_results)
     
     def _is_valid_url(self, url: str) -> bool:
         """
@@ -228,21 +499,7 @@ class ClothesSearcher:
         Returns:
             True if URL appears valid
         """
-        if not url.startswith(('http://', 'https://')):
-            return False
-        
-        # Filter out obvious non-product URLs
-        invalid_patterns = [
-            'google.com/search',
-            'youtube.com',
-            'facebook.com',
-            'twitter.com',
-            'instagram.com',
-            '/category/',
-            '/categories/',
-        ]
-        
-        return not any(pattern in url.lower() for pattern in invalid_patterns)
+        return is_product_url(url)
     
     def search_simple(
         self, 
@@ -0,0 +1,376 @@
+"""
+Product Image Proxy
+
+Serves third-party product images at grid-friendly sizes instead of
+hotlinking multi-megabyte originals:
+- Pooled aiohttp session with timeouts, bounded concurrency and a source size cap
+- Resized to one of a few fixed widths (never upscaled) and re-encoded as WebP
+- Results stored in a size-bounded on-disk LRU cache keyed by canonical URL hash
+- Concurrent requests for the same image share one download
+- Only public http(s) hosts are fetched
+
+Run a self-contained demo against a local stub server with:
+    python image_proxy.py
+"""
+
+import io
+import os
+import time
+import socket
+import asyncio
+from pathlib import Path
+from typing import Dict, Optional, Any, Tuple
+from urllib.parse import urlsplit, quote
+
+from PIL import Image, ImageOps, features
+
+try:
+    import aiohttp
+    from yarl import URL
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+    print("Warning: aiohttp not installed, image proxy disabled. Run: pip install aiohttp")
+
+try:
+    from ..Common.disk_cache import DiskLRUCache, hash_key
+    from ..Common.public_hosts import HostNotAllowed, check_public_url_async
+    from .canonical_url import canonicalize_url
+except ImportError:
+    # Fallback for direct execution
+    import sys
+    sys.path.append(str(Path(__file__).parent.parent))
+    from Common.disk_cache import DiskLRUCache, hash_key
+    from Common.public_hosts import HostNotAllowed, check_public_url_async
+    from ClothesSearch.canonical_url import canonicalize_url
+
+
+DEFAULT_CACHE_DIR = Path(__file__).parent / "image_cache"
+DEFAULT_CACHE_MAX_MB = 512
+
+# Widths served by the proxy; requests are snapped up to the nearest one so
+# each image has a handful of cached variants at most
+ALLOWED_WIDTHS = (160, 320, 480, 640, 960, 1280)
+DEFAULT_WIDTH = 320
+
+DEFAULT_USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+)
+
+
+class ImageProxyError(Exception):
+    """Image could not be served; status_code is the HTTP status to return"""
+
+    def __init__(self, message: str, status_code: int = 502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def snap_width(width: int) -> int:
+    """Round a requested width up to the nearest allowed width"""
+    for allowed in ALLOWED_WIDTHS:
+        if width <= allowed:
+            return allowed
+    return ALLOWED_WIDTHS[-1]
+
+
+def proxy_url(image_url: Optional[str], width: int = DEFAULT_WIDTH, prefix: str = "/api/search/image") -> Optional[str]:
+    """Build the proxy URL for a product image (None if there is no image)"""
+    if not image_url:
+        return None
+    return f"{prefix}?url={quote(image_url, safe='')}&w={snap_width(width)}"
+
+
+def resize_to_webp(data: bytes, width: int, quality: int = 80) -> bytes:
+    """
+    Decode an image, shrink it to `width` (keeping aspect ratio) and encode as WebP
+
+    CPU-bound; run it off the event loop.
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        # Let JPEG decode at a reduced scale directly
+        img.draft('RGB', (width, max(1, width * img.height // max(1, img.width))))
+        img = ImageOps.exif_transpose(img)
+        has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+        img = img.convert('RGBA' if has_alpha else 'RGB')
+
+        if img.width > width:
+            height = max(1, round(img.height * width / img.width))
+            img = img.resize((width, height), Image.LANCZOS)
+
+        buffer = io.BytesIO()
+        img.save(buffer, format='WEBP', quality=quality, method=4)
+        return buffer.getvalue()
+
+
+class ImageProxy:
+    """Fetches, resizes and caches product images"""
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_cache_bytes: Optional[int] = None,
+        timeout: float = 8.0,
+        max_source_bytes: int = 15 * 1024 * 1024,
+        max_concurrency: int = 16,
+        per_host_limit: int = 4,
+        quality: int = 80,
+        allow_private_hosts: bool = False,
+        user_agent: str = DEFAULT_USER_AGENT
+    ):
+        """
+        Initialize the proxy
+
+        Args:
+            cache_dir: Cache directory (defaults to IMAGE_CACHE_DIR or the module directory)
+            max_cache_bytes: Cache size bound (defaults to IMAGE_CACHE_MAX_MB, 512 MB)
+            timeout: Total seconds allowed per download
+            max_source_bytes: Largest original image that will be downloaded
+            max_concurrency: Maximum simultaneous downloads
+            per_host_limit: Maximum simultaneous downloads per host
+            quality: WebP quality (1-100)
+            allow_private_hosts: Allow loopback/private addresses (local testing only)
+            user_agent: User-Agent header sent with downloads
+        """
+        if not AIOHTTP_AVAILABLE:
+            raise ImportError("aiohttp package not installed")
+        if not features.check('webp'):
+            raise ImportError("Pillow was built without WebP support")
+
+        if max_cache_bytes is None:
+            max_cache_bytes = int(float(os.getenv("IMAGE_CACHE_MAX_MB", DEFAULT_CACHE_MAX_MB)) * 1024 * 1024)
+        self.cache = DiskLRUCache(
+            cache_dir or os.getenv("IMAGE_CACHE_DIR") or DEFAULT_CACHE_DIR,
+            max_bytes=max_cache_bytes,
+            suffix=".webp"
+        )
+        self.timeout = timeout
+        self.max_source_bytes = max_source_bytes
+        self.max_concurrency = max_concurrency
+        self.per_host_limit = per_host_limit
+        self.quality = quality
+        self.allow_private_hosts = allow_private_hosts
+        self.user_agent = user_agent
+
+        self._session: Optional["aiohttp.ClientSession"] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._in_flight: Dict[str, "asyncio.Future"] = {}
+        self.stats = {'requests': 0, 'fetched': 0, 'coalesced': 0, 'errors': 0,
+                      'bytes_in': 0, 'bytes_out': 0}
+
+    # ==================== SESSION ====================
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        loop = asyncio.get_running_loop()
+        if self._session is not None and self._session_loop is not loop:
+            # Sessions are bound to the loop they were created in
+            self._session = None
+        if self._session is None or self._session.closed:
+            self._session_loop = loop
+            connector = aiohttp.TCPConnector(
+                limit=self.max_concurrency,
+                limit_per_host=self.per_host_limit,
+                ttl_dns_cache=300
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"User-Agent": self.user_agent, "Accept": "image/webp,image/*;q=0.9"}
+            )
+        return self._session
+
+    async def close(self) -> None:
+        """Close the pooled HTTP session"""
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    # ==================== PROXY ====================
+
+    def cache_key(self, url: str, width: int) -> str:
+        """Cache key (and ETag) for one image variant; tracking-parameter variants share it"""
+        return hash_key(canonicalize_url(url), snap_width(width), 'webp', self.quality)
+
+    async def get(self, url: str, width: int = DEFAULT_WIDTH) -> Tuple[bytes, bool]:
+        """
+        Get a resized WebP version of an image
+
+        Args:
+            url: Original image URL
+            width: Requested width in pixels (snapped to ALLOWED_WIDTHS)
+
+        Returns:
+            Tuple of (webp bytes, whether it came from the cache)
+
+        Raises:
+            ImageProxyError: URL rejected, download failed or not an image
+        """
+        width = snap_width(width)
+        key = self.cache_key(url, width)
+        loop = asyncio.get_running_loop()
+        self.stats['requests'] += 1
+
+        data = await loop.run_in_executor(None, self.cache.get, key)
+        if data is not None:
+            return data, True
+
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(pending), False
+
+        future = loop.create_future()
+        self._in_flight[key] = future
+        try:
+            source = await self._download(url)
+            data = await loop.run_in_executor(None, self._transform, source, width)
+            await loop.run_in_executor(None, self.cache.set, key, data)
+            self.stats['fetched'] += 1
+            self.stats['bytes_in'] += len(source)
+            self.stats['bytes_out'] += len(data)
+            future.set_result(data)
+            return data, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            self.stats['errors'] += 1
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else is waiting
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+
+    def _transform(self, source: bytes, width: int) -> bytes:
+        try:
+            return resize_to_webp(source, width, self.quality)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            raise ImageProxyError(f"Could not decode image: {e}", status_code=415)
+
+    async def _check_host(self, url: str) -> None:
+        """Reject non-http(s) URLs and hosts that resolve to non-public addresses"""
+        if urlsplit(url).scheme not in ('http', 'https'):
+            raise ImageProxyError("Only http(s) image URLs can be proxied", status_code=400)
+        try:
+            await check_public_url_async(url, allow_private=self.allow_private_hosts)
+        except HostNotAllowed:
+            raise ImageProxyError("Image host is not allowed", status_code=400)
+        except socket.gaierror:
+            raise ImageProxyError(f"Unknown image host: {urlsplit(url).hostname}", status_code=502)
+
+    async def _download(self, url: str) -> bytes:
+        """Download the original image, enforcing content type and size"""
+        await self._check_host(url)
+        session = self._get_session()
+        try:
+            # Redirects are not followed blindly: each hop is checked like the original URL
+            for _ in range(5):
+                async with session.get(url, allow_redirects=False) as response:
+                    if response.status in (301, 302, 303, 307, 308) and 'Location' in response.headers:
+                        url = str(response.url.join(URL(response.headers['Location'])))
+                        await self._check_host(url)
+                        continue
+                    if response.status != 200:
+                        raise ImageProxyError(f"Image host returned HTTP {response.status}", status_code=502)
+
+                    content_type = response.headers.get('Content-Type', '')
+                    if not content_type.startswith('image/'):
+                        raise ImageProxyError(f"Not an image: {content_type or 'unknown type'}", status_code=415)
+                    if (response.content_length or 0) > self.max_source_bytes:
+                        raise ImageProxyError("Image is too large", status_code=413)
+
+                    buffer = bytearray()
+                    async for chunk in response.content.iter_chunked(64 * 1024):
+                        buffer.extend(chunk)
+                        if len(buffer) > self.max_source_bytes:
+                            raise ImageProxyError("Image is too large", status_code=413)
+                    return bytes(buffer)
+            raise ImageProxyError("Too many redirects", status_code=502)
+        except asyncio.TimeoutError:
+            raise ImageProxyError("Image download timed out", status_code=504)
+        except aiohttp.ClientError as e:
+            raise ImageProxyError(f"Image download failed: {e.__class__.__name__}", status_code=502)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get proxy and cache statistics"""
+        stats = dict(self.stats)
+        stats['in_flight'] = len(self._in_flight)
+        stats['cache'] = self.cache.get_stats()
+        return stats
+
+
+async def _demo():
+    """Proxy images from a local stub server and show sizes and cache behaviour"""
+    import tempfile
+    from aiohttp import web
+
+    original = io.BytesIO()
+    Image.new('RGB', (2400, 3200), (200, 40, 60)).save(original, format='PNG')
+    original = original.getvalue()
+
+    async def product_image(request):
+        await asyncio.sleep(0.2)
+        return web.Response(body=original, content_type='image/png')
+
+    async def moved(request):
+        raise web.HTTPFound("/img/product.png")
+
+    async def page(request):
+        return web.Response(text="<html></html>", content_type='text/html')
+
+    app = web.Application()
+    app.router.add_get("/img/product.png", product_image)
+    app.router.add_get("/img/moved", moved)
+    app.router.add_get("/page", page)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    base = f"http://127.0.0.1:{port}"
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        proxy = ImageProxy(cache_dir=cache_dir, allow_private_hosts=True)
+        try:
+            print("=" * 70)
+            print(f"Original: {len(original) / 1024:.0f} KB PNG, 2400x3200")
+            print("=" * 70)
+
+            start = time.perf_counter()
+            results = await asyncio.gather(*(proxy.get(f"{base}/img/product.png", 300) for _ in range(5)))
+            print(f"5 concurrent requests: {(time.perf_counter() - start) * 1000:.0f} ms, "
+                  f"{len(results[0][0]) / 1024:.1f} KB WebP, coalesced={proxy.stats['coalesced']}")
+
+            start = time.perf_counter()
+            data, cached = await proxy.get(f"{base}/img/product.png", 320)
+            print(f"Repeat request: cached={cached}, {(time.perf_counter() - start) * 1000:.2f} ms")
+
+            data, cached = await proxy.get(f"{base}/img/moved", 640)
+            with Image.open(io.BytesIO(data)) as img:
+                print(f"Redirected, w=640: {img.format} {img.size}, {len(data) / 1024:.1f} KB")
+
+            for url in (f"{base}/page", "file:///etc/passwd"):
+                try:
+                    await proxy.get(url)
+                except ImageProxyError as e:
+                    print(f"Rejected {url}: {e} (HTTP {e.status_code})")
+
+            strict = ImageProxy(cache_dir=cache_dir)
+            try:
+                await strict.get(f"{base}/img/product.png", 1280)
+            except ImageProxyError as e:
+                print(f"Rejected loopback host by default: {e} (HTTP {e.status_code})")
+            finally:
+                await strict.close()
+
+            print(f"\nStats: {proxy.get_stats()}")
+        finally:
+            await proxy.close()
+            await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(_demo())
@@ -0,0 +1,491 @@
+"""
+Product Link Verifier
+
+Checks that product URLs returned by the searcher actually resolve before
+they reach users:
+- Pooled aiohttp session with tight timeouts and bounded (per-host) concurrency
+- HEAD first, falling back to a GET when servers reject HEAD
+- Follows redirects and reports the final URL; every hop must be a public
+  host, so model output cannot make the server probe internal addresses
+- Verdicts cached per canonical URL key with TTL, so tracking-parameter
+  variants share one check; the URL itself is requested as given
+- A host:port that repeatedly does not exist in DNS (NXDOMAIN, typical of
+  hallucinated shops) is cached as dead, so its other links are rejected
+  without a request; refused connections, TLS errors and other transient
+  failures only make a link's status unknown
+- Concurrent checks of the same URL share one request
+
+Run a self-contained demo against a local stub server with:
+    python link_verifier.py
+"""
+
+import time
+import socket
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import List, Dict, Optional, Any, Iterable, AsyncIterator, Tuple, Callable
+from urllib.parse import urlsplit
+
+try:
+    import aiohttp
+    from yarl import URL
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+    print("Warning: aiohttp not installed, link verification disabled. Run: pip install aiohttp")
+
+try:
+    from ..Common.public_hosts import HostNotAllowed, check_public_url_async, is_unknown_host
+    from .canonical_url import canonicalize_url
+except ImportError:
+    # Fallback for direct execution
+    import sys
+    from pathlib import Path
+    sys.path.append(str(Path(__file__).parent.parent))
+    from Common.public_hosts import HostNotAllowed, check_public_url_async, is_unknown_host
+    from ClothesSearch.canonical_url import canonicalize_url
+
+
+ALIVE = "alive"
+DEAD = "dead"
+UNKNOWN = "unknown"
+
+# Statuses that mean the page does not exist
+_DEAD_STATUSES = {404, 410}
+# Statuses where HEAD is refused but GET may work
+_RETRY_WITH_GET = {403, 405, 406, 501}
+# Statuses from bot protection or overload; say nothing about the product
+_BLOCKED_STATUSES = {401, 403, 429, 999}
+_REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+
+DEFAULT_USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+)
+
+
+@dataclass
+class LinkVerdict:
+    """Result of checking one URL"""
+    url: str
+    status: str  # alive, dead or unknown
+    http_status: Optional[int] = None
+    final_url: Optional[str] = None
+    reason: str = ""
+    checked_at: float = 0.0
+    cached: bool = False
+    # Dead because of the host (unknown or not allowed), not the page itself
+    host_level: bool = False
+
+    @property
+    def usable(self) -> bool:
+        """Whether the link should be shown (only confirmed-dead links are dropped)"""
+        return self.status != DEAD
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class _RedirectLoop(Exception):
+    pass
+
+
+def _host_key(url: str) -> str:
+    """host:port a verdict about a whole host applies to"""
+    parts = urlsplit(url)
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    return f"{parts.hostname or ''}:{port or (443 if parts.scheme == 'https' else 80)}"
+
+
+class LinkVerifier:
+    """Async, cached liveness checks for product URLs"""
+
+    def __init__(
+        self,
+        timeout: float = 3.0,
+        max_concurrency: int = 16,
+        per_host_limit: int = 4,
+        ttl_seconds: float = 6 * 60 * 60,
+        dead_ttl_seconds: float = 30 * 60,
+        max_cache_entries: int = 10000,
+        dead_host_failures: int = 3,
+        max_redirects: int = 5,
+        allow_private_hosts: bool = False,
+        user_agent: str = DEFAULT_USER_AGENT
+    ):
+        """
+        Initialize the verifier
+
+        Args:
+            timeout: Total seconds allowed per URL (including redirects)
+            max_concurrency: Maximum simultaneous connections
+            per_host_limit: Maximum simultaneous connections per host
+            ttl_seconds: How long alive/unknown verdicts are cached
+            dead_ttl_seconds: How long dead verdicts (URL or host) are cached
+            max_cache_entries: Size bound for the URL verdict cache
+            dead_host_failures: NXDOMAIN results (within dead_ttl_seconds) after which
+                                a whole host:port is treated as dead
+            max_redirects: Redirect hops followed per URL
+            allow_private_hosts: Allow loopback/private addresses (local testing only)
+            user_agent: User-Agent header sent with checks
+        """
+        if not AIOHTTP_AVAILABLE:
+            raise ImportError("aiohttp package not installed")
+
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.per_host_limit = per_host_limit
+        self.ttl_seconds = ttl_seconds
+        self.dead_ttl_seconds = dead_ttl_seconds
+        self.max_cache_entries = max_cache_entries
+        self.dead_host_failures = max(1, dead_host_failures)
+        self.max_redirects = max_redirects
+        self.allow_private_hosts = allow_private_hosts
+        self.user_agent = user_agent
+
+        self._session: Optional["aiohttp.ClientSession"] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+        # url -> (expires_at, verdict)
+        self._url_cache: "OrderedDict[str, Tuple[float, LinkVerdict]]" = OrderedDict()
+        # host:port -> (expires_at, reason) for hosts that do not exist
+        self._dead_hosts: Dict[str, Tuple[float, str]] = {}
+        # host:port -> (NXDOMAIN count, window expires_at)
+        self._host_failures: Dict[str, Tuple[int, float]] = {}
+        self._in_flight: Dict[str, "asyncio.Future"] = {}
+        self.stats = {'checked': 0, 'cache_hits': 0, 'host_hits': 0, 'coalesced': 0,
+                      ALIVE: 0, DEAD: 0, UNKNOWN: 0}
+
+    # ==================== SESSION ====================
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        loop = asyncio.get_running_loop()
+        if self._session is not None and self._session_loop is not loop:
+            # Sessions are bound to the loop they were created in
+            self._session = None
+        if self._session is None or self._session.closed:
+            self._session_loop = loop
+            connector = aiohttp.TCPConnector(
+                limit=self.max_concurrency,
+                limit_per_host=self.per_host_limit,
+                ttl_dns_cache=300
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"User-Agent": self.user_agent}
+            )
+        return self._session
+
+    async def close(self) -> None:
+        """Close the pooled HTTP session"""
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    # ==================== CACHE ====================
+
+    def _cached(self, key: str, url: str) -> Optional[LinkVerdict]:
+        now = time.time()
+        entry = self._url_cache.get(key)
+        if entry and entry[0] > now:
+            self._url_cache.move_to_end(key)
+            self.stats['cache_hits'] += 1
+            return LinkVerdict(**{**entry[1].to_dict(), 'url': url, 'cached': True})
+
+        host = self._dead_hosts.get(_host_key(url))
+        if host and host[0] > now:
+            self.stats['host_hits'] += 1
+            return LinkVerdict(url=url, status=DEAD, reason=host[1], checked_at=now, cached=True, host_level=True)
+        return None
+
+    def _store(self, key: str, verdict: LinkVerdict) -> None:
+        ttl = self.dead_ttl_seconds if verdict.status == DEAD else self.ttl_seconds
+        self._url_cache[key] = (verdict.checked_at + ttl, verdict)
+        self._url_cache.move_to_end(key)
+        while len(self._url_cache) > self.max_cache_entries:
+            self._url_cache.popitem(last=False)
+
+    def _record_host(self, verdict: LinkVerdict, unknown_host: bool) -> None:
+        """Count NXDOMAIN results per host:port; any answer from the host resets the count"""
+        key = _host_key(verdict.url)
+        if not unknown_host:
+            if verdict.http_status is not None:
+                self._host_failures.pop(key, None)
+            return
+        count, expires_at = self._host_failures.get(key, (0, 0.0))
+        if expires_at <= verdict.checked_at:
+            count, expires_at = 0, verdict.checked_at + self.dead_ttl_seconds
+        count += 1
+        self._host_failures[key] = (count, expires_at)
+        if count >= self.dead_host_failures:
+            self._dead_hosts[key] = (verdict.checked_at + self.dead_ttl_seconds, verdict.reason)
+            del self._host_failures[key]
+
+    # ==================== CHECKS ====================
+
+    async def verify(self, url: str) -> LinkVerdict:
+        """
+        Check one URL (cached, and coalesced with concurrent checks of the same URL)
+
+        Checks are cached and coalesced by canonical URL key, so
+        tracking-parameter variants of a product share one check.
+
+        Returns:
+            LinkVerdict for the URL as given
+        """
+        url = url.strip()
+        key = canonicalize_url(url)
+        cached = self._cached(key, url)
+        if cached:
+            return cached
+
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            self.stats['coalesced'] += 1
+            verdict = await asyncio.shield(pending)
+            return LinkVerdict(**{**verdict.to_dict(), 'url': url})
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            verdict, unknown_host = await self._check(url)
+            self._store(key, verdict)
+            self._record_host(verdict, unknown_host)
+            self.stats['checked'] += 1
+            self.stats[verdict.status] += 1
+            future.set_result(verdict)
+            return verdict
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else is waiting
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+
+    async def _fetch_status(self, url: str) -> Tuple[int, str]:
+        """
+        Request a URL, following redirects hop by hop
+
+        Returns:
+            (final HTTP status, final URL)
+        """
+        session = self._get_session()
+        method = "HEAD"
+        hops = 0
+        while True:
+            # Every hop must be a public host, not only the URL we were given
+            await check_public_url_async(url, allow_private=self.allow_private_hosts)
+            # Only the status line and headers are needed, also for GET
+            async with session.request(method, url, allow_redirects=False) as response:
+                status = response.status
+                location = response.headers.get('Location')
+                if status in _REDIRECT_STATUSES and location:
+                    hops += 1
+                    if hops > self.max_redirects:
+                        raise _RedirectLoop()
+                    url = str(response.url.join(URL(location)))
+                    continue
+            if method == "HEAD" and status in _RETRY_WITH_GET:
+                method = "GET"
+                continue
+            return status, url
+
+    async def _check(self, url: str) -> Tuple[LinkVerdict, bool]:
+        """Request the URL, returning (verdict, whether the host does not exist in DNS)"""
+        now = time.time()
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            return LinkVerdict(url=url, status=DEAD, reason="invalid url", checked_at=now), False
+
+        try:
+            status, final_url = await asyncio.wait_for(self._fetch_status(url), self.timeout)
+        except HostNotAllowed:
+            return LinkVerdict(url=url, status=DEAD, reason="host not allowed", checked_at=now,
+                               host_level=True), False
+        except socket.gaierror as e:
+            if is_unknown_host(e):
+                return LinkVerdict(url=url, status=DEAD, reason="unknown host", checked_at=now,
+                                   host_level=True), True
+            # Temporary DNS failure: says nothing about the link
+            return LinkVerdict(url=url, status=UNKNOWN, reason="dns error", checked_at=now), False
+        except asyncio.TimeoutError:
+            return LinkVerdict(url=url, status=UNKNOWN, reason="timeout", checked_at=now), False
+        except _RedirectLoop:
+            return LinkVerdict(url=url, status=DEAD, reason="redirect loop", checked_at=now), False
+        except aiohttp.ClientError as e:
+            # Refused connections, TLS errors and resets are often transient
+            return LinkVerdict(url=url, status=UNKNOWN, reason=f"error: {e.__class__.__name__}",
+                               checked_at=now), False
+
+        if status in _DEAD_STATUSES:
+            verdict_status, reason = DEAD, f"http {status}"
+        elif 200 <= status < 400:
+            verdict_status, reason = ALIVE, "ok"
+        elif status in _BLOCKED_STATUSES or status >= 500:
+            verdict_status, reason = UNKNOWN, f"http {status}"
+        else:
+            verdict_status, reason = DEAD, f"http {status}"
+
+        return LinkVerdict(
+            url=url,
+            status=verdict_status,
+            http_status=status,
+            final_url=final_url if final_url != url else None,
+            reason=reason,
+            checked_at=now
+        ), False
+
+    async def verify_many(self, urls: Iterable[str]) -> Dict[str, LinkVerdict]:
+        """Check several URLs concurrently, returning {url: verdict}"""
+        urls = list(dict.fromkeys(urls))
+        verdicts = await asyncio.gather(*(self.verify(url) for url in urls))
+        return dict(zip(urls, verdicts))
+
+    async def iter_verify(self, urls: Iterable[str]) -> AsyncIterator[LinkVerdict]:
+        """Check several URLs concurrently, yielding verdicts as they complete"""
+        tasks = [asyncio.ensure_future(self.verify(url)) for url in dict.fromkeys(urls)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def filter_products(
+        self,
+        products: List[dict],
+        annotate: bool = False,
+        on_dead: Optional[Callable[[List[str]], Any]] = None
+    ) -> List[dict]:
+        """
+        Drop products whose link is dead
+
+        Kept products keep their URL as returned by the search (affiliate and
+        shop parameters included); with annotate, the redirect target is
+        added as "final_url".
+
+        Args:
+            products: Product dictionaries with a "url" key
+            annotate: Add a "link_status" key to each kept product
+            on_dead: Called with the dropped URLs whose page itself is dead (e.g.
+                     HTTP 404); links dropped because of their host are not passed
+
+        Returns:
+            Usable products in their original order
+        """
+        verdicts = await self.verify_many(p['url'] for p in products if p.get('url'))
+        kept = []
+        dead = []
+        for product in products:
+            verdict = verdicts.get(product.get('url'))
+            if verdict is None or not verdict.usable:
+                if verdict is not None and not verdict.host_level:
+                    dead.append(verdict.url)
+                continue
+            product = dict(product)
+            if annotate:
+                product['link_status'] = verdict.status
+                product['final_url'] = verdict.final_url
+            kept.append(product)
+        if dead and on_dead:
+            on_dead(dead)
+        return kept
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get verifier statistics"""
+        stats = dict(self.stats)
+        stats['cached_urls'] = len(self._url_cache)
+        stats['dead_hosts'] = sum(1 for expires, _ in self._dead_hosts.values() if expires > time.time())
+        return stats
+
+
+async def _demo():
+    """Verify links against a local stub server covering each verdict"""
+    from aiohttp import web
+
+    async def ok(request):
+        return web.Response(text="product page")
+
+    async def gone(request):
+        return web.Response(status=404)
+
+    async def moved(request):
+        raise web.HTTPMovedPermanently("/product/canonical")
+
+    async def head_refused(request):
+        if request.method == "HEAD":
+            return web.Response(status=405)
+        return web.Response(text="product page")
+
+    async def slow(request):
+        await asyncio.sleep(2)
+        return web.Response(text="too late")
+
+    app = web.Application()
+    app.router.add_route("*", "/product/ok", ok)
+    app.router.add_route("*", "/product/canonical", ok)
+    app.router.add_route("*", "/product/gone", gone)
+    app.router.add_route("*", "/product/moved", moved)
+    app.router.add_route("*", "/product/head-refused", head_refused)
+    app.router.add_route("*", "/product/slow", slow)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    base = f"http://127.0.0.1:{port}"
+
+    # The stub server is on loopback, which real checks refuse
+    verifier = LinkVerifier(timeout=0.5, allow_private_hosts=True, dead_host_failures=2)
+    urls = [
+        f"{base}/product/ok",
+        f"{base}/product/gone",
+        f"{base}/product/moved",
+        f"{base}/product/head-refused",
+        f"{base}/product/slow",
+        "http://127.0.0.1:1/product/refused",
+        "http://no-such-shop.invalid/product/a",
+        "http://no-such-shop.invalid/product/b",
+        "not a url"
+    ]
+
+    try:
+        print("=" * 70)
+        print("First pass (network)")
+        print("=" * 70)
+        start = time.perf_counter()
+        async for verdict in verifier.iter_verify(urls):
+            print(f"  {verdict.status:8} {verdict.reason:28} {verdict.url}"
+                  + (f" -> {verdict.final_url}" if verdict.final_url else ""))
+        print(f"  took {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        print("\nSecond pass (cached)")
+        start = time.perf_counter()
+        verdicts = await verifier.verify_many(urls)
+        print(f"  {sum(v.cached for v in verdicts.values())}/{len(verdicts)} cached, "
+              f"took {(time.perf_counter() - start) * 1000:.2f} ms")
+
+        products = [{"url": url, "title": url.rsplit('/', 1)[-1]} for url in urls]
+        kept = await verifier.filter_products(products, annotate=True)
+        print(f"\nfilter_products kept {len(kept)}/{len(products)}:")
+        for product in kept:
+            print(f"  {product['link_status']:8} {product['url']}"
+                  + (f" -> {product['final_url']}" if product['final_url'] else ""))
+
+        print(f"\nStats: {verifier.get_stats()}")
+    finally:
+        await verifier.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(_demo())
@@ -0,0 +1,262 @@
+"""
+Local Product Catalog
+
+Keeps every product returned by ClothesSearcher in a SQLite FTS5 index so
+searches can be answered locally:
+- Products are upserted by canonical URL key with the filters (brand, category, color) of
+  the search that found them; the link itself is stored and returned as found
+- Full-text search over title, description, brand, category and color with
+  porter stemming ("sneaker" matches "Sneakers") and BM25 ranking
+- Queries typically take about a millisecond, so the catalog can answer first
+  while a live search refreshes results in the background
+
+Falls back to LIKE matching when the SQLite build lacks FTS5.
+"""
+
+import os
+import re
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from typing import List, Dict, Optional, Any, Iterable
+
+try:
+    from .canonical_url import canonicalize_url
+except ImportError:
+    # Fallback for direct execution
+    import sys
+    sys.path.append(str(Path(__file__).parent.parent))
+    from ClothesSearch.canonical_url import canonicalize_url
+
+DEFAULT_DB_PATH = Path(__file__).parent / "product_catalog.sqlite3"
+
+# Words that say nothing about the product
+_STOPWORDS = {'a', 'an', 'and', 'the', 'for', 'with', 'in', 'of', 'singapore'}
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# BM25 column weights: title, description, brand, category, color
+_BM25_WEIGHTS = (10.0, 2.0, 5.0, 3.0, 3.0)
+
+
+def _tokens(*texts: Optional[str]) -> List[str]:
+    tokens = []
+    for text in texts:
+        for token in _TOKEN_RE.findall((text or '').lower()):
+            if token not in _STOPWORDS and token not in tokens:
+                tokens.append(token)
+    return tokens
+
+
+def _fts5_available(conn: sqlite3.Connection) -> bool:
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp._fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+class ProductCatalog:
+    """Thread-safe SQLite full-text catalog of products seen in past searches"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        """
+        Initialize the catalog
+
+        Args:
+            db_path: SQLite file (defaults to PRODUCT_CATALOG_PATH or the module directory,
+                     ":memory:" for a process-local catalog)
+        """
+        self.db_path = str(db_path or os.getenv("PRODUCT_CATALOG_PATH") or DEFAULT_DB_PATH)
+        self._lock = threading.Lock()
+        self.stats = {'searches': 0, 'hits': 0, 'misses': 0, 'upserts': 0}
+
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # Products are identified by their canonical URL key; url is the link as found
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS products (
+                id INTEGER PRIMARY KEY,
+                key TEXT NOT NULL UNIQUE,
+                url TEXT NOT NULL,
+                title TEXT NOT NULL,
+                description TEXT NOT NULL DEFAULT '',
+                brand TEXT NOT NULL DEFAULT '',
+                category TEXT NOT NULL DEFAULT '',
+                color TEXT NOT NULL DEFAULT '',
+                image TEXT,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                times_seen INTEGER NOT NULL DEFAULT 1
+            )
+        """)
+
+        self.fts_enabled = _fts5_available(self._conn)
+        if self.fts_enabled:
+            # External-content index kept in sync by triggers
+            self._conn.executescript("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+                    title, description, brand, category, color,
+                    content='products', content_rowid='id',
+                    tokenize='porter unicode61 remove_diacritics 2'
+                );
+                CREATE TRIGGER IF NOT EXISTS products_ai AFTER INSERT ON products BEGIN
+                    INSERT INTO products_fts (rowid, title, description, brand, category, color)
+                    VALUES (new.id, new.title, new.description, new.brand, new.category, new.color);
+                END;
+                CREATE TRIGGER IF NOT EXISTS products_ad AFTER DELETE ON products BEGIN
+                    INSERT INTO products_fts (products_fts, rowid, title, description, brand, category, color)
+                    VALUES ('delete', old.id, old.title, old.description, old.brand, old.category, old.color);
+                END;
+                CREATE TRIGGER IF NOT EXISTS products_au AFTER UPDATE ON products BEGIN
+                    INSERT INTO products_fts (products_fts, rowid, title, description, brand, category, color)
+                    VALUES ('delete', old.id, old.title, old.description, old.brand, old.category, old.color);
+                    INSERT INTO products_fts (rowid, title, description, brand, category, color)
+                    VALUES (new.id, new.title, new.description, new.brand, new.category, new.color);
+                END;
+            """)
+        else:
+            print("Warning: SQLite FTS5 not available, product catalog uses LIKE matching")
+        self._conn.commit()
+
+    # ==================== WRITES ====================
+
+    def add_products(
+        self,
+        products: Iterable[dict],
+        brand: Optional[str] = None,
+        category: Optional[str] = None,
+        color: Optional[str] = None
+    ) -> int:
+        """
+        Upsert products from a search result
+
+        Args:
+            products: Product dictionaries (url, image, title, description)
+            brand, category, color: Filters of the search that found them
+
+        Returns:
+            Number of products stored
+        """
+        now = time.time()
+        rows = [
+            (
+                canonicalize_url(p['url']), p['url'].strip(), p.get('title') or 'Unknown Product', p.get('description') or '',
+                brand or '', category or '', color or '', p.get('image'), now, now
+            )
+            for p in products if p.get('url')
+        ]
+        if not rows:
+            return 0
+
+        with self._lock:
+            # Newer results win, but attributes learned earlier are not erased
+            self._conn.executemany("""
+                INSERT INTO products (key, url, title, description, brand, category, color, image, first_seen, last_seen)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    url = excluded.url,
+                    title = excluded.title,
+                    description = CASE WHEN excluded.description != '' THEN excluded.description ELSE description END,
+                    brand = CASE WHEN excluded.brand != '' THEN excluded.brand ELSE brand END,
+                    category = CASE WHEN excluded.category != '' THEN excluded.category ELSE category END,
+                    color = CASE WHEN excluded.color != '' THEN excluded.color ELSE color END,
+                    image = COALESCE(excluded.image, image),
+                    last_seen = excluded.last_seen,
+                    times_seen = times_seen + 1
+            """, rows)
+            self._conn.commit()
+            self.stats['upserts'] += len(rows)
+        return len(rows)
+
+    # ==================== SEARCH ====================
+
+    def search(
+        self,
+        query: str,
+        n: int = 10,
+        size: Optional[str] = None,
+        color: Optional[str] = None,
+        brand: Optional[str] = None,
+        category: Optional[str] = None
+    ) -> List[dict]:
+        """
+        Find catalog products matching a search
+
+        Every query word and filter value must match (prefix match, any
+        column). Size is ignored: the catalog does not know stock per size.
+
+        Returns:
+            Up to n products, best match first
+        """
+        tokens = _tokens(query, brand, category, color)
+        if not tokens:
+            return []
+
+        with self._lock:
+            if self.fts_enabled:
+                match = ' '.join(f'"{token}"*' for token in tokens)
+                rows = self._conn.execute(f"""
+                    SELECT p.url, p.image, p.title, p.description
+                    FROM products_fts JOIN products p ON p.id = products_fts.rowid
+                    WHERE products_fts MATCH ?
+                    ORDER BY bm25(products_fts, {', '.join(map(str, _BM25_WEIGHTS))}), p.last_seen DESC
+                    LIMIT ?
+                """, (match, n)).fetchall()
+            else:
+                haystack = "lower(title || ' ' || description || ' ' || brand || ' ' || category || ' ' || color)"
+                where = ' AND '.join(f"{haystack} LIKE ?" for _ in tokens)
+                rows = self._conn.execute(
+                    f"SELECT url, image, title, description FROM products WHERE {where} "
+                    f"ORDER BY times_seen DESC, last_seen DESC LIMIT ?",
+                    [f"%{token}%" for token in tokens] + [n]
+                ).fetchall()
+
+            self.stats['searches'] += 1
+            self.stats['hits' if rows else 'misses'] += 1
+
+        return [
+            {'url': url, 'image': image, 'title': title, 'description': description}
+            for url, image, title, description in rows
+        ]
+
+    # ==================== MAINTENANCE ====================
+
+    def count(self) -> int:
+        """Number of products in the catalog"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    def remove(self, urls: Iterable[str]) -> int:
+        """Remove products (e.g. links found dead), returning the number removed"""
+        with self._lock:
+            cursor = self._conn.executemany(
+                "DELETE FROM products WHERE key = ?", [(canonicalize_url(url),) for url in urls]
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def purge_older_than(self, max_age_seconds: float) -> int:
+        """Remove products not seen in any search for max_age_seconds"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM products WHERE last_seen < ?", (time.time() - max_age_seconds,)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get catalog statistics"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['products'] = self._conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+        stats['fts_enabled'] = self.fts_enabled
+        stats['hit_rate'] = round(stats['hits'] / stats['searches'], 3) if stats['searches'] else 0.0
+        return stats
+
+    def close(self) -> None:
+        """Close the database"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,255 @@
+"""
+Search Response Parsing
+
+Turns Gemini product search responses into product dictionaries:
+- Structured output: the response is JSON following PRODUCTS_SCHEMA and is
+  validated in one pass by a compiled pydantic model
+- Fallbacks, tried in order when that fails: lenient JSON extraction (fenced
+  or truncated JSON), the line-oriented URL/IMAGE/TITLE/DESC format, and
+  finally any product-looking URLs in the text
+- Product URLs are canonicalized and repeated products dropped
+
+Benchmark the parsers on recorded responses with:
+    python benchmark_parser.py
+"""
+
+import re
+from typing import List, Optional, Tuple
+
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+try:
+    from ..Common.llm_json import extract_json, LLMOutputError
+    from .canonical_url import dedupe_products
+except ImportError:
+    # Fallback for direct execution
+    import sys
+    from pathlib import Path
+    sys.path.append(str(Path(__file__).parent.parent))
+    from Common.llm_json import extract_json, LLMOutputError
+    from ClothesSearch.canonical_url import dedupe_products
+
+
+# Response schema for Gemini structured output
+PRODUCTS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "products": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "url": {"type": "string"},
+                    "image": {"type": "string"},
+                    "title": {"type": "string"},
+                    "description": {"type": "string"}
+                },
+                "required": ["url", "title"]
+            }
+        }
+    },
+    "required": ["products"]
+}
+
+# Parse methods, in the order they are tried
+STRUCTURED = "structured"
+JSON = "json"
+TEXT = "text"
+SCRAPE = "scrape"
+EMPTY = "empty"
+
+_INVALID_URL_PATTERNS = (
+    'google.com/search',
+    'youtube.com',
+    'facebook.com',
+    'twitter.com',
+    'instagram.com',
+    '/category/',
+    '/categories/',
+)
+
+_URL_RE = re.compile(r'URL:\s*(.+?)(?:\n|$)', re.IGNORECASE)
+_IMAGE_RE = re.compile(r'IMAGE:\s*(.+?)(?:\n|$)', re.IGNORECASE)
+_TITLE_RE = re.compile(r'TITLE:\s*(.+?)(?:\n|$)', re.IGNORECASE)
+_DESC_RE = re.compile(r'DESC:\s*(.+?)(?:\n|$)', re.IGNORECASE | re.DOTALL)
+_FIELD_URL_RE = re.compile(r'https?://[^\s\[\]()<>"*]+')
+_MARKDOWN_RE = re.compile(r'^[\s*_`]+|[\s*_`]+$')
+_ANY_URL_RE = re.compile(r'https?://[^\s\)]+')
+
+
+def is_product_url(url: str) -> bool:
+    """Check if URL is valid and looks like a product page"""
+    if not url.startswith(('http://', 'https://')):
+        return False
+    lowered = url.lower()
+    return not any(pattern in lowered for pattern in _INVALID_URL_PATTERNS)
+
+
+class SearchProduct(BaseModel):
+    """One product in a structured search response"""
+    url: str
+    image: Optional[str] = None
+    title: str = "Unknown Product"
+    description: str = ""
+
+    @field_validator('url')
+    @classmethod
+    def _check_url(cls, value: str) -> str:
+        value = value.strip()
+        if not is_product_url(value):
+            raise ValueError("not a product page URL")
+        return value
+
+    @field_validator('image')
+    @classmethod
+    def _check_image(cls, value: Optional[str]) -> Optional[str]:
+        # A bad image URL is dropped rather than failing the product
+        value = (value or '').strip()
+        return value if value.startswith(('http://', 'https://')) else None
+
+    @field_validator('title', 'description', mode='before')
+    @classmethod
+    def _strip_text(cls, value) -> str:
+        return str(value or '').strip()
+
+
+class SearchResults(BaseModel):
+    """Structured search response"""
+    products: List[SearchProduct] = Field(default_factory=list)
+
+
+def parse_structured_products(response_text: str, max_results: Optional[int] = None) -> Optional[List[dict]]:
+    """
+    Validate a structured (schema-constrained) response
+
+    The whole response is validated in one pass; if some products are
+    invalid, the valid ones are kept.
+
+    Returns:
+        Product dictionaries, or None if the response is not valid JSON
+        in the expected shape
+    """
+    try:
+        results = SearchResults.model_validate_json(response_text)
+        products = results.products
+    except ValidationError:
+        # Salvage the valid items (of possibly fenced or truncated JSON)
+        raw = _json_products(response_text)
+        if raw is None:
+            return None
+        products = []
+        for entry in raw:
+            try:
+                products.append(SearchProduct.model_validate(entry))
+            except ValidationError:
+                continue
+
+    return [product.model_dump() for product in products[:max_results]]
+
+
+def _json_products(response_text: str) -> Optional[list]:
+    """Product entries of a JSON response (fenced or truncated JSON accepted), None if not JSON"""
+    if '{' not in response_text:
+        return None
+    try:
+        data = extract_json(response_text, expect=(list, dict))
+    except LLMOutputError:
+        return None
+    if isinstance(data, dict):
+        data = data.get('products', [])
+    return data if isinstance(data, list) else None
+
+
+def parse_json_products(response_text: str, max_results: Optional[int] = None) -> List[dict]:
+    """
+    Extract products from a JSON (possibly fenced or truncated) response
+
+    Returns:
+        List of product dictionaries, empty if the response is not JSON
+    """
+    products = []
+    for entry in _json_products(response_text) or []:
+        if not isinstance(entry, dict):
+            continue
+        url = str(entry.get('url') or '').strip()
+        if not is_product_url(url):
+            continue
+        image_url = entry.get('image') or entry.get('image_url')
+        if not isinstance(image_url, str) or not image_url.startswith(('http://', 'https://')):
+            image_url = None
+        products.append({
+            "url": url,
+            "image": image_url,
+            "title": str(entry.get('title') or "Unknown Product").strip(),
+            "description": str(entry.get('description') or entry.get('desc') or "").strip()
+        })
+
+    return products[:max_results]
+
+
+def parse_text_products(response_text: str, max_results: Optional[int] = None) -> List[dict]:
+    """Parse the line-oriented URL/IMAGE/TITLE/DESC format"""
+    products = []
+    for section in response_text.split('---')[:max_results]:
+        url_match = _URL_RE.search(section)
+        # First URL on the line, so markdown links and bold markers are ignored
+        url = _FIELD_URL_RE.search(url_match.group(1)) if url_match else None
+        if not url or not is_product_url(url.group(0)):
+            continue
+
+        image_match = _IMAGE_RE.search(section)
+        image_url = _FIELD_URL_RE.search(image_match.group(1)) if image_match else None
+
+        title_match = _TITLE_RE.search(section)
+        desc_match = _DESC_RE.search(section)
+        products.append({
+            "url": url.group(0),
+            "image": image_url.group(0) if image_url else None,
+            "title": _MARKDOWN_RE.sub('', title_match.group(1)) if title_match else "Unknown Product",
+            "description": _MARKDOWN_RE.sub('', desc_match.group(1)) if desc_match else ""
+        })
+
+    return products[:max_results]
+
+
+def scrape_urls(response_text: str, max_results: Optional[int] = None) -> List[dict]:
+    """Last resort: any product-looking URLs in the text"""
+    products = []
+    for url in _ANY_URL_RE.findall(response_text):
+        if is_product_url(url):
+            products.append({
+                "url": url,
+                "image": None,
+                "title": "Product Link",
+                "description": ""
+            })
+        if max_results and len(products) >= max_results:
+            break
+    return products
+
+
+def parse_products(response_text: str, max_results: int, structured: bool = False) -> Tuple[List[dict], str]:
+    """
+    Parse a search response with the best parser that yields products
+
+    Args:
+        response_text: Raw response from Gemini
+        max_results: Maximum number of results to return
+        structured: The response was requested as schema-constrained JSON
+
+    Products whose URLs share a canonical key are dropped (URLs are kept as
+    returned) before the result is cut to max_results.
+
+    Returns:
+        Tuple of (products, method) where method is structured, json, text,
+        scrape or empty
+    """
+    parsers = [(JSON, parse_json_products), (TEXT, parse_text_products), (SCRAPE, scrape_urls)]
+    if structured:
+        parsers.insert(0, (STRUCTURED, parse_structured_products))
+
+    for method, parser in parsers:
+        products = dedupe_products(parser(response_text) or [])
+        if products:
+            return products[:max_results], method
+    return [], EMPTY
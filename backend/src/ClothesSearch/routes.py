@@ -4,15 +4,30 @@ FastAPI Routes for Clothes Search
 Provides API endpoints for searching clothing products using Gemini API
 """
 
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse, Response
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional
 import os
+import json
+import asyncio
 
 try:
     from .clothes_search import ClothesSearcher, GEMINI_AVAILABLE
+    from .link_verifier import LinkVerifier, LinkVerdict, AIOHTTP_AVAILABLE
+    from .image_proxy import ImageProxy, ImageProxyError, proxy_url, ALLOWED_WIDTHS, DEFAULT_WIDTH
+    from ..Common.gemini_async import run_blocking
+    from ..Common.gemini_clients import get_model
 except ImportError:
-    from clothes_search import ClothesSearcher, GEMINI_AVAILABLE
+    # Fallback for direct execution
+    import sys
+    from pathlib import Path
+    sys.path.append(str(Path(__file__).parent.parent))
+    from ClothesSearch.clothes_search import ClothesSearcher, GEMINI_AVAILABLE
+    from ClothesSearch.link_verifier import LinkVerifier, LinkVerdict, AIOHTTP_AVAILABLE
+    from ClothesSearch.image_proxy import ImageProxy, ImageProxyError, proxy_url, ALLOWED_WIDTHS, DEFAULT_WIDTH
+    from Common.gemini_async import run_blocking
+    from Common.gemini_clients import get_model
 
 # Create router
 router = APIRouter(prefix="/api/search", tags=["Clothes Search"])
@@ -27,12 +42,20 @@ class SearchRequest(BaseModel):
     color: Optional[str] = Field(None, description="Color filter (e.g., 'black', 'blue')", example="black")
     brand: Optional[str] = Field(None, description="Brand filter (e.g., 'Nike', 'Adidas')", example="Nike")
     category: Optional[str] = Field(None, description="Category filter (e.g., 'Tops', 'Shoes')", example="Tops")
+    verify_links: bool = Field(True, description="Drop products whose link is dead and follow redirects")
+    instant: bool = Field(False, description="Answer from the local catalog right away and refresh in the background")
+    stream: bool = Field(False, description="Stream products before their links are checked, then the dead links (NDJSON)")
+    
+    def search_params(self) -> dict:
+        """Arguments for ClothesSearcher search methods"""
+        return self.dict(exclude={'verify_links', 'instant', 'stream'})
 
 
 class ProductResult(BaseModel):
     """Product information from search"""
     url: str = Field(..., description="Product page URL")
     image: Optional[str] = Field(None, description="Product image URL")
+    image_proxy: Optional[str] = Field(None, description="Resized WebP image served by /api/search/image")
     title: str = Field(..., description="Product name/title")
     description: Optional[str] = Field("", description="Product description")
 
@@ -42,6 +65,14 @@ class SearchResponse(BaseModel):
     query: str = Field(..., description="Original search query")
     count: int = Field(..., description="Number of results returned")
     products: List[ProductResult] = Field(..., description="List of product results")
+    source: str = Field("live", description="Where results came from: live, cache or catalog")
+    refreshing: bool = Field(False, description="A live search is running in the background")
+
+
+class BatchSearchRequest(BaseModel):
+    """Request model for batch clothes search"""
+    searches: List[SearchRequest] = Field(..., min_items=1, max_items=20, description="Searches to run (1-20)")
+    max_concurrency: int = Field(4, ge=1, le=8, description="Maximum searches running at once (1-8)")
 
 
 # Initialize searcher (singleton)
@@ -75,6 +106,125 @@ def get_searcher() -> ClothesSearcher:
     return _searcher
 
 
+# Link verifier (singleton, shares one HTTP connection pool)
+_link_verifier = None
+
+def get_link_verifier() -> Optional[LinkVerifier]:
+    """Get or create the LinkVerifier instance (None if aiohttp is missing)"""
+    global _link_verifier
+    if _link_verifier is None and AIOHTTP_AVAILABLE:
+        _link_verifier = LinkVerifier()
+    return _link_verifier
+
+
+def remove_from_catalog(urls: List[str]) -> None:
+    """Drop dead product pages from the catalog so instant results stay clean"""
+    catalog = _searcher.catalog if _searcher else None
+    if catalog and urls:
+        # SQLite write; runs on the default executor instead of the event loop
+        asyncio.get_running_loop().run_in_executor(None, catalog.remove, urls)
+
+
+async def verify_product_links(products: List[dict]) -> List[dict]:
+    """Drop dead product links; on verifier failure the products are returned unchecked"""
+    verifier = get_link_verifier()
+    if not verifier or not products:
+        return products
+    try:
+        return await verifier.filter_products(products, on_dead=remove_from_catalog)
+    except Exception as e:
+        print(f"Warning: Link verification failed: {e}")
+        return products
+
+
+async def iter_dead_links(products: List[dict]) -> AsyncIterator[LinkVerdict]:
+    """
+    Check product links concurrently, yielding the dead ones as they are found
+
+    Used by streamed searches, which send the products before their links are
+    checked. On verifier failure the remaining links are left as usable.
+    """
+    verifier = get_link_verifier()
+    if not verifier or not products:
+        return
+    dead_pages = []
+    try:
+        async for verdict in verifier.iter_verify(p['url'] for p in products if p.get('url')):
+            if verdict.usable:
+                continue
+            if not verdict.host_level:
+                dead_pages.append(verdict.url)
+            yield verdict
+    except Exception as e:
+        print(f"Warning: Link verification failed: {e}")
+    remove_from_catalog(dead_pages)
+
+
+def removal_line(verdict: LinkVerdict, **fields) -> str:
+    """NDJSON line telling a streaming client to drop a product whose link is dead"""
+    return json.dumps({**fields, "removed": verdict.url, "reason": verdict.reason}) + "\n"
+
+
+def stream_search(query: str, products: List[dict], source: str, verify: bool) -> StreamingResponse:
+    """Stream a search result right away, followed by the dead links as they are found"""
+    verify = verify and bool(get_link_verifier()) and bool(products)
+    
+    async def stream():
+        yield json.dumps({
+            "query": query,
+            "source": source,
+            "refreshing": source == "catalog",
+            "verifying": verify,
+            "count": len(products),
+            "products": [ProductResult(**p).dict() for p in with_proxy_images(products)]
+        }) + "\n"
+        removed = set()
+        if verify:
+            async for verdict in iter_dead_links(products):
+                removed.add(verdict.url)
+                yield removal_line(verdict)
+        count = sum(1 for p in products if p.get('url') not in removed)
+        yield json.dumps({"done": True, "count": count}) + "\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+# Image proxy (singleton, shares one HTTP connection pool and disk cache)
+_image_proxy = None
+
+def get_image_proxy() -> ImageProxy:
+    """Get or create the ImageProxy instance"""
+    global _image_proxy
+    if _image_proxy is None:
+        if not AIOHTTP_AVAILABLE:
+            raise HTTPException(
+                status_code=500,
+                detail="Image proxy not available. Install: pip install aiohttp"
+            )
+        try:
+            _image_proxy = ImageProxy()
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Failed to initialize image proxy: {str(e)}"
+            )
+    return _image_proxy
+
+
+def with_proxy_images(products: List[dict]) -> List[dict]:
+    """Add the proxied thumbnail URL to each product that has an image"""
+    return [{**p, 'image_proxy': proxy_url(p.get('image'))} for p in products]
+
+
+@router.on_event("shutdown")
+async def close_http_pools():
+    """Close the verifier's and image proxy's HTTP connection pools"""
+    if _link_verifier:
+        await _link_verifier.close()
+    if _image_proxy:
+        await _image_proxy.close()
+
+
 # API Endpoints
 @router.post("/clothes", response_model=SearchResponse)
 async def search_clothes(request: SearchRequest):
@@ -90,6 +240,16 @@ async def search_clothes(request: SearchRequest):
     - `brand`: Filter by brand (e.g., "Nike", "Adidas")
     - `category`: Filter by category (e.g., "Tops", "Shoes", "Dresses")
     
+    **Instant mode** (`"instant": true`): answered in milliseconds from the
+    result cache or the local catalog of products seen in past searches; on a
+    cache miss the live search runs in the background (`refreshing: true`) and
+    repeating the request shortly after returns its results.
+    
+    **Streaming** (`"stream": true`): instead of waiting for link verification,
+    the products are sent at once as the first line of an NDJSON response,
+    followed by one `{"removed": url, "reason": ...}` line per dead link and
+    `{"done": true, "count": n}` once every link is checked.
+    
     **Example queries:**
     - "red summer dress"
     - "nike running shoes"
@@ -108,19 +268,27 @@ async def search_clothes(request: SearchRequest):
     """
     try:
         searcher = get_searcher()
-        products = searcher.search_products(
-            query=request.query,
-            n=request.n,
-            size=request.size,
-            color=request.color,
-            brand=request.brand,
-            category=request.category
-        )
+        if request.instant:
+            # Local SQLite lookups only; kept off the Gemini executor so they never queue behind live searches
+            products, source = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: searcher.search_instant(**request.search_params())
+            )
+        else:
+            products = await run_blocking(searcher.search_products, **request.search_params())
+            source = "live"
+        
+        if request.stream:
+            return stream_search(request.query, products, source, request.verify_links)
+        
+        if request.verify_links:
+            products = await verify_product_links(products)
         
         return SearchResponse(
             query=request.query,
             count=len(products),
-            products=[ProductResult(**p) for p in products]
+            products=[ProductResult(**p) for p in with_proxy_images(products)],
+            source=source,
+            refreshing=source == "catalog"
         )
     
     except HTTPException:
@@ -139,7 +307,10 @@ async def search_clothes_get(
     size: Optional[str] = Query(None, description="Size filter (e.g., 'M', '32')"),
     color: Optional[str] = Query(None, description="Color filter (e.g., 'black', 'blue')"),
     brand: Optional[str] = Query(None, description="Brand filter (e.g., 'Nike')"),
-    category: Optional[str] = Query(None, description="Category filter (e.g., 'Tops', 'Shoes')")
+    category: Optional[str] = Query(None, description="Category filter (e.g., 'Tops', 'Shoes')"),
+    verify_links: bool = Query(True, description="Drop products whose link is dead"),
+    instant: bool = Query(False, description="Answer from the local catalog and refresh in the background"),
+    stream: bool = Query(False, description="Stream products before their links are checked (NDJSON)")
 ):
     """
     Search for clothing products (GET version)
@@ -158,11 +329,201 @@ async def search_clothes_get(
         size=size,
         color=color,
         brand=brand,
-        category=category
+        category=category,
+        verify_links=verify_links,
+        instant=instant,
+        stream=stream
     )
     return await search_clothes(request)
 
 
+@router.post("/clothes:batch")
+async def search_clothes_batch(request: BatchSearchRequest):
+    """
+    Run several searches concurrently and stream results per query
+    
+    Cached searches are returned first; the rest run concurrently (at most
+    `max_concurrency` at a time) and each result is streamed as soon as it is
+    ready. Searches with `instant` are answered from the cache or the local
+    catalog like POST /api/search/clothes. With `verify_links` (default) a
+    query's line is sent before its links are checked (`"verifying": true`);
+    each dead link follows as a removal line while the other searches keep
+    running, then a line marking the query verified. The response is
+    newline-delimited JSON (`application/x-ndjson`), in completion order,
+    followed by a summary line.
+    
+    **Result line:**
+    ```json
+    {"index": 0, "query": "white sneakers", "cached": true, "source": "cache", "refreshing": false,
+     "verifying": true, "count": 5, "products": [...], "error": null}
+    ```
+    
+    **Removal and verified lines:**
+    ```json
+    {"index": 0, "removed": "https://...", "reason": "HTTP 404"}
+    {"index": 0, "verified": true, "count": 4}
+    ```
+    
+    **Summary line:**
+    ```json
+    {"done": true, "total": 3, "failed": 0}
+    ```
+    """
+    searcher = get_searcher()
+    
+    def result_line(index: int, products: Optional[List[dict]], source: Optional[str],
+                    error: Optional[str] = None, verifying: bool = False) -> str:
+        products = products or []
+        return json.dumps({
+            "index": index,
+            "query": request.searches[index].query,
+            "cached": source == "cache",
+            "source": source,
+            "refreshing": source == "catalog",
+            "verifying": verifying,
+            "count": len(products),
+            "products": [ProductResult(**p).dict() for p in with_proxy_images(products)],
+            "error": error
+        }) + "\n"
+    
+    async def stream():
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(request.max_concurrency)
+        # Lines from all searches in the order they are produced; None marks a finished search
+        lines = asyncio.Queue()
+        failed = 0
+        
+        async def run(index: int):
+            nonlocal failed
+            search = request.searches[index]
+            source = None
+            try:
+                # Local lookups run on the default executor so they never queue
+                # behind live searches on the Gemini executor
+                if search.instant:
+                    products, source = await loop.run_in_executor(
+                        None, lambda: searcher.search_instant(**search.search_params())
+                    )
+                else:
+                    products = await loop.run_in_executor(
+                        None, lambda: searcher.get_cached(**search.search_params())
+                    )
+                    source = "cache"
+                    if products is None:
+                        source = "live"
+                        async with semaphore:
+                            products = await run_blocking(searcher.fetch_products, **search.search_params())
+            except Exception as e:
+                failed += 1
+                lines.put_nowait(result_line(index, None, source, error=f"Search failed: {str(e)}"))
+                return
+            
+            verify = search.verify_links and bool(get_link_verifier()) and bool(products)
+            lines.put_nowait(result_line(index, products, source, verifying=verify))
+            if verify:
+                # Links are checked while other searches are still running
+                removed = set()
+                async for verdict in iter_dead_links(products):
+                    removed.add(verdict.url)
+                    lines.put_nowait(removal_line(verdict, index=index))
+                count = sum(1 for p in products if p.get('url') not in removed)
+                lines.put_nowait(json.dumps({"index": index, "verified": True, "count": count}) + "\n")
+        
+        async def run_and_signal(index: int):
+            try:
+                await run(index)
+            finally:
+                lines.put_nowait(None)
+        
+        tasks = [asyncio.ensure_future(run_and_signal(index)) for index in range(len(request.searches))]
+        try:
+            finished = 0
+            while finished < len(tasks):
+                line = await lines.get()
+                if line is None:
+                    finished += 1
+                else:
+                    yield line
+        finally:
+            # Client went away: stop searches and link checks still running
+            for task in tasks:
+                task.cancel()
+        
+        yield json.dumps({"done": True, "total": len(request.searches), "failed": failed}) + "\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@router.get("/image")
+async def proxy_product_image(
+    request: Request,
+    url: str = Query(..., description="Original product image URL"),
+    w: int = Query(DEFAULT_WIDTH, ge=1, le=4096, description=f"Target width in pixels, rounded up to one of {list(ALLOWED_WIDTHS)}")
+):
+    """
+    Serve a product image resized and re-encoded as WebP
+    
+    The original is downloaded once, shrunk to the requested width (never
+    upscaled) and kept in a size-bounded disk cache, so product grids load
+    small, predictable images instead of hotlinking third-party originals.
+    Search results include a ready-made `image_proxy` URL for each product.
+    
+    **Example:**
+    ```
+    /api/search/image?url=https%3A%2F%2Fexample.com%2Fshoe.jpg&w=320
+    ```
+    """
+    proxy = get_image_proxy()
+    etag = f'"{proxy.cache_key(url, w)}"'
+    headers = {"Cache-Control": "public, max-age=604800", "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    
+    try:
+        data, cached = await proxy.get(url, w)
+    except ImageProxyError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Image proxy failed: {str(e)}")
+    
+    headers["X-Cache"] = "HIT" if cached else "MISS"
+    return Response(content=data, media_type="image/webp", headers=headers)
+
+
+@router.get("/cache/stats")
+async def search_cache_stats(
+    top: int = Query(20, ge=1, le=200, description="Number of most frequent queries to include")
+):
+    """
+    Get search result cache statistics
+    
+    Returns overall hit rates for the memory and SQLite tiers, the hit rate
+    of the most frequent normalized queries, and how many concurrent
+    identical searches were coalesced into one Gemini call.
+    """
+    searcher = get_searcher()
+    coalescing = searcher.single_flight.get_stats()
+    verifier = get_link_verifier()
+    links = verifier.get_stats() if verifier else None
+    images = _image_proxy.get_stats() if _image_proxy else None
+    catalog = await run_blocking(searcher.catalog.get_stats) if searcher.catalog else None
+    parser = dict(searcher.parse_stats)
+    if not searcher.cache:
+        return {"enabled": False, "coalescing": coalescing, "links": links, "images": images,
+                "catalog": catalog, "parser": parser}
+    
+    return {
+        "enabled": True,
+        "stats": await run_blocking(searcher.cache.get_stats),
+        "top_queries": await run_blocking(searcher.cache.get_query_stats, top),
+        "coalescing": coalescing,
+        "links": links,
+        "images": images,
+        "catalog": catalog,
+        "parser": parser
+    }
+
+
 @router.get("/health")
 async def search_health_check():
     """Check if the clothes search service is operational"""
@@ -180,13 +541,15 @@ async def search_health_check():
                 "message": "GEMINI_API_KEY not set in environment"
             }
         
-        # Try to initialize searcher
-        get_searcher()
+        # Reported from config; a health probe should not build the searcher.
+        # get_searcher() creates it with structured output.
+        structured = _searcher.structured_output if _searcher is not None else True
         
         return {
             "status": "operational",
             "message": "Clothes search service is ready",
-            "model": "gemini-2.0-flash-exp with google_search_retrieval"
+            "model": get_model('search'),
+            "mode": "structured" if structured else "text"
         }
     
     except Exception as e:
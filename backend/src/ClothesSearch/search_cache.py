@@ -0,0 +1,271 @@
+"""
+Search Result Cache
+
+Two-tier cache for ClothesSearcher results:
+- In-memory LRU for repeat searches within a process (microseconds)
+- SQLite tier with TTL shared across restarts and workers (milliseconds)
+
+Queries are keyed on a normalized form so "White  Sneakers" and
+"white sneakers singapore" hit the same entry, and hit rates are recorded
+per normalized query.
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from typing import List, Dict, Optional, Any, Tuple
+
+
+DEFAULT_DB_PATH = Path(__file__).parent / "search_cache.sqlite3"
+DEFAULT_TTL_SECONDS = 6 * 60 * 60
+DEFAULT_REGION = "singapore"
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_PUNCTUATION_RE = re.compile(r"[^\w\s&'+-]")
+
+# Flush per-query counters to SQLite after this many lookups
+_STATS_FLUSH_EVERY = 50
+
+
+def _normalize_text(text: Optional[str]) -> str:
+    if not text:
+        return ''
+    text = _PUNCTUATION_RE.sub(' ', str(text).lower())
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+
+def normalize_query(
+    query: str,
+    size: Optional[str] = None,
+    color: Optional[str] = None,
+    brand: Optional[str] = None,
+    category: Optional[str] = None,
+    region: str = DEFAULT_REGION
+) -> str:
+    """
+    Build the canonical cache key for a search
+
+    Lowercases and collapses whitespace, drops a trailing region word the
+    searcher adds anyway, and appends the filters in a fixed order.
+
+    Example:
+        normalize_query("White  Sneakers Singapore", color="White")
+        -> "white sneakers|color=white|region=singapore"
+    """
+    text = _normalize_text(query)
+    region = _normalize_text(region)
+    if region and text.endswith(' ' + region):
+        text = text[:-len(region) - 1]
+
+    parts = [text]
+    filters = {'brand': brand, 'category': category, 'color': color, 'size': size}
+    for name in sorted(filters):
+        value = _normalize_text(filters[name])
+        if value:
+            parts.append(f"{name}={value}")
+    if region:
+        parts.append(f"region={region}")
+    return '|'.join(parts)
+
+
+class SearchCache:
+    """Thread-safe LRU + SQLite cache for product search results"""
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        max_memory_entries: int = 512
+    ):
+        """
+        Initialize the cache
+
+        Args:
+            db_path: SQLite file (defaults to SEARCH_CACHE_PATH or the module directory,
+                     ":memory:" for a process-local second tier)
+            ttl_seconds: How long results stay fresh
+            max_memory_entries: Size of the in-memory LRU tier
+        """
+        self.db_path = str(db_path or os.getenv("SEARCH_CACHE_PATH") or DEFAULT_DB_PATH)
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_entries = max(1, max_memory_entries)
+
+        # key -> (expires_at, n, products)
+        self._memory: "OrderedDict[str, Tuple[float, int, List[dict]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # key -> [hits, misses] not yet flushed to SQLite
+        self._pending_stats: Dict[str, List[int]] = {}
+        self._lookups_since_flush = 0
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'writes': 0}
+
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS search_results (
+                key TEXT PRIMARY KEY,
+                n INTEGER NOT NULL,
+                products TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS query_stats (
+                key TEXT PRIMARY KEY,
+                hits INTEGER NOT NULL DEFAULT 0,
+                misses INTEGER NOT NULL DEFAULT 0,
+                last_seen REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    # ==================== LOOKUP ====================
+
+    def get(self, key: str, n: int) -> Optional[List[dict]]:
+        """
+        Get cached results for a normalized query
+
+        An entry stored for a larger `n` also serves smaller requests.
+
+        Returns:
+            Up to n products, or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and entry[0] > now and entry[1] >= n:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                self._record(key, hit=True)
+                return [dict(p) for p in entry[2][:n]]
+
+            row = self._conn.execute(
+                "SELECT n, products, expires_at FROM search_results WHERE key = ?",
+                (key,)
+            ).fetchone()
+            if row and row[2] > now and row[0] >= n:
+                products = json.loads(row[1])
+                self._remember(key, row[2], row[0], products)
+                self.stats['disk_hits'] += 1
+                self._record(key, hit=True)
+                return [dict(p) for p in products[:n]]
+
+            self.stats['misses'] += 1
+            self._record(key, hit=False)
+            return None
+
+    def set(self, key: str, n: int, products: List[dict]) -> None:
+        """Store results for a normalized query (empty results are not cached)"""
+        if not products:
+            return
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        with self._lock:
+            self._remember(key, expires_at, n, products)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_results (key, n, products, created_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, n, json.dumps(products), now, expires_at)
+            )
+            self._conn.commit()
+            self.stats['writes'] += 1
+
+    def _remember(self, key: str, expires_at: float, n: int, products: List[dict]) -> None:
+        """Put an entry in the LRU tier (caller holds the lock)"""
+        self._memory[key] = (expires_at, n, [dict(p) for p in products])
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    # ==================== STATISTICS ====================
+
+    def _record(self, key: str, hit: bool) -> None:
+        """Count a lookup for per-query hit rates (caller holds the lock)"""
+        counters = self._pending_stats.setdefault(key, [0, 0])
+        counters[0 if hit else 1] += 1
+        self._lookups_since_flush += 1
+        if self._lookups_since_flush >= _STATS_FLUSH_EVERY:
+            self._flush_stats()
+
+    def _flush_stats(self) -> None:
+        """Write pending per-query counters to SQLite (caller holds the lock)"""
+        if not self._pending_stats:
+            return
+        now = time.time()
+        self._conn.executemany(
+            "INSERT INTO query_stats (key, hits, misses, last_seen) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET hits = hits + excluded.hits, "
+            "misses = misses + excluded.misses, last_seen = excluded.last_seen",
+            [(key, hits, misses, now) for key, (hits, misses) in self._pending_stats.items()]
+        )
+        self._conn.commit()
+        self._pending_stats.clear()
+        self._lookups_since_flush = 0
+
+    def get_query_stats(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Get per-query hit rates, most frequent queries first
+
+        Returns:
+            List of {query, hits, misses, hit_rate}
+        """
+        with self._lock:
+            self._flush_stats()
+            rows = self._conn.execute(
+                "SELECT key, hits, misses FROM query_stats ORDER BY hits + misses DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [
+            {
+                'query': key,
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': round(hits / (hits + misses), 3) if hits + misses else 0.0
+            }
+            for key, hits, misses in rows
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get overall cache statistics"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['memory_entries'] = len(self._memory)
+            stats['disk_entries'] = self._conn.execute(
+                "SELECT COUNT(*) FROM search_results WHERE expires_at > ?", (time.time(),)
+            ).fetchone()[0]
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((lookups - stats['misses']) / lookups, 3) if lookups else 0.0
+        stats['ttl_seconds'] = self.ttl_seconds
+        return stats
+
+    # ==================== MAINTENANCE ====================
+
+    def purge_expired(self) -> int:
+        """Delete expired entries from both tiers, returning the number removed from SQLite"""
+        now = time.time()
+        with self._lock:
+            for key in [k for k, v in self._memory.items() if v[0] <= now]:
+                del self._memory[key]
+            cursor = self._conn.execute("DELETE FROM search_results WHERE expires_at <= ?", (now,))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def clear(self) -> None:
+        """Remove all cached results (hit statistics are kept)"""
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute("DELETE FROM search_results")
+            self._conn.commit()
+
+    def close(self) -> None:
+        """Flush statistics and close the database"""
+        with self._lock:
+            self._flush_stats()
+            self._conn.close()
@@ -0,0 +1,92 @@
+"""
+Common Module
+
+Shared infrastructure used by several Lovelace backend modules.
+"""
+
+from .rate_limiter import RateLimiter
+from .single_flight import SingleFlight
+from .disk_cache import DiskLRUCache, hash_key
+from .public_hosts import (
+    HostNotAllowed, is_public_address, is_unknown_host, check_public_url, check_public_url_async, fetch_public_url
+)
+from .image_prep import PreparedImage, prepare_image, get_prep_profile, get_prep_stats
+from .local_models import (
+    LocalModelUnavailable,
+    register_local_model,
+    get_local_model,
+    is_local_model_ready,
+    warmup_local_models,
+    get_local_model_status
+)
+from .llm_json import (
+    LLMOutputError,
+    extract_json,
+    parse_llm_json,
+    repair_json,
+    IncrementalJSONParser,
+    iter_json_array,
+    json_generation_config
+)
+from .gemini_async import (
+    run_blocking,
+    submit_blocking,
+    generate_content_async,
+    get_gemini_executor,
+    get_executor_stats,
+    shutdown_gemini_executor
+)
+from .gemini_clients import (
+    MODELS,
+    TIMEOUTS,
+    get_client,
+    get_model,
+    get_timeout,
+    request_options,
+    get_client_stats,
+    close_clients
+)
+
+__all__ = [
+    'RateLimiter',
+    'SingleFlight',
+    'DiskLRUCache',
+    'hash_key',
+    'HostNotAllowed',
+    'is_public_address',
+    'is_unknown_host',
+    'check_public_url',
+    'check_public_url_async',
+    'fetch_public_url',
+    'PreparedImage',
+    'prepare_image',
+    'get_prep_profile',
+    'get_prep_stats',
+    'LocalModelUnavailable',
+    'register_local_model',
+    'get_local_model',
+    'is_local_model_ready',
+    'warmup_local_models',
+    'get_local_model_status',
+    'LLMOutputError',
+    'extract_json',
+    'parse_llm_json',
+    'repair_json',
+    'IncrementalJSONParser',
+    'iter_json_array',
+    'json_generation_config',
+    'run_blocking',
+    'submit_blocking',
+    'generate_content_async',
+    'get_gemini_executor',
+    'get_executor_stats',
+    'shutdown_gemini_executor',
+    'MODELS',
+    'TIMEOUTS',
+    'get_client',
+    'get_model',
+    'get_timeout',
+    'request_options',
+    'get_client_stats',
+    'close_clients'
+]
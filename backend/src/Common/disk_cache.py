@@ -0,0 +1,167 @@
+"""
+Disk LRU Cache
+
+Size-bounded, on-disk key/value cache for binary blobs (resized images,
+generated results):
+- One file per entry, sharded into subdirectories by key hash
+- Atomic writes (temp file + rename), safe to share between threads
+- Least recently used entries are evicted once the total size exceeds the
+  bound; recency survives restarts through file modification times
+
+Usage:
+    cache = DiskLRUCache(Path("image_cache"), max_bytes=500 * 1024 * 1024)
+    data = cache.get(key)
+    if data is None:
+        cache.set(key, build())
+"""
+
+import os
+import hashlib
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from typing import Dict, Optional, Any, Union
+
+
+def hash_key(*parts: Any) -> str:
+    """Build a cache key from arbitrary parts (sha256 hex)"""
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode()).hexdigest()
+
+
+class DiskLRUCache:
+    """Thread-safe, size-bounded LRU cache of files on disk"""
+
+    def __init__(self, directory: Union[str, Path], max_bytes: int = 512 * 1024 * 1024, suffix: str = ".bin"):
+        """
+        Initialize the cache, indexing entries left by previous runs
+
+        Args:
+            directory: Cache directory (created if missing)
+            max_bytes: Total size bound for all entries
+            suffix: File extension for entries
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+
+        self._lock = threading.Lock()
+        # key -> size in bytes, least recently used first
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+
+        self._load_index()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}{self.suffix}"
+
+    def _load_index(self) -> None:
+        """Rebuild the in-memory index from the files on disk"""
+        entries = []
+        for path in self.directory.glob(f"*/*{self.suffix}"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, path.name[:-len(self.suffix)], stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total_bytes += size
+        self._evict()
+
+    def _evict(self) -> None:
+        """Remove least recently used entries until within the size bound (caller holds the lock)"""
+        while self._total_bytes > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self._total_bytes -= size
+            self.stats['evictions'] += 1
+            try:
+                self._path(key).unlink()
+            except OSError:
+                pass
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Get an entry's bytes, or None on a miss"""
+        with self._lock:
+            if key not in self._index:
+                self.stats['misses'] += 1
+                return None
+            self._index.move_to_end(key)
+
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            # Persist recency for the next index rebuild
+            os.utime(path, None)
+        except OSError:
+            with self._lock:
+                size = self._index.pop(key, None)
+                if size is not None:
+                    self._total_bytes -= size
+                self.stats['misses'] += 1
+            return None
+
+        with self._lock:
+            self.stats['hits'] += 1
+        return data
+
+    def set(self, key: str, data: bytes) -> None:
+        """Store an entry, evicting old entries if needed"""
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            old_size = self._index.pop(key, None)
+            if old_size is not None:
+                self._total_bytes -= old_size
+            self._index[key] = len(data)
+            self._total_bytes += len(data)
+            self.stats['writes'] += 1
+            self._evict()
+
+    def delete(self, key: str) -> bool:
+        """Remove an entry, returning whether it existed"""
+        with self._lock:
+            size = self._index.pop(key, None)
+            if size is None:
+                return False
+            self._total_bytes -= size
+        try:
+            self._path(key).unlink()
+        except OSError:
+            pass
+        return True
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._index
+
+    def clear(self) -> None:
+        """Remove all entries"""
+        with self._lock:
+            keys = list(self._index)
+            self._index.clear()
+            self._total_bytes = 0
+        for key in keys:
+            try:
+                self._path(key).unlink()
+            except OSError:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._index)
+            stats['total_bytes'] = self._total_bytes
+        stats['max_bytes'] = self.max_bytes
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        return stats
@@ -0,0 +1,185 @@
+"""
+Async Gemini Access
+
+Keeps blocking Gemini SDK calls off the FastAPI event loop:
+- A dedicated, bounded thread pool for synchronous SDK calls, so one slow
+  image generation cannot freeze other requests or WebSockets on the worker
+- The pool size also caps how many Gemini calls a worker has in flight
+- Native async (`client.aio`) is used when the google-genai client offers it,
+  gated by a semaphore of the same size so the cap still holds
+
+Usage:
+    result = await run_blocking(recommender.generate_recommendations, user_id=user_id)
+    future = submit_blocking(generate, pose)      # from synchronous code
+    response = await generate_content_async(client, model="gemini-2.5-flash", contents=[...])
+
+Configure the pool size with the GEMINI_MAX_WORKERS environment variable.
+"""
+
+import os
+import asyncio
+import functools
+import threading
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+
+DEFAULT_MAX_WORKERS = 8
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+# One semaphore per event loop (asyncio primitives cannot be shared across loops)
+_async_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+_stats_lock = threading.Lock()
+_stats = {
+    'submitted': 0,
+    'in_flight': 0,
+    'completed': 0,
+    'failed': 0,
+    'cancelled': 0
+}
+
+
+def _max_workers() -> int:
+    return max(1, int(os.getenv("GEMINI_MAX_WORKERS", DEFAULT_MAX_WORKERS)))
+
+
+def get_gemini_executor() -> ThreadPoolExecutor:
+    """Get or create the shared executor for blocking Gemini calls"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=_max_workers(),
+                    thread_name_prefix="gemini"
+                )
+    return _executor
+
+
+def _async_semaphore() -> asyncio.Semaphore:
+    """Semaphore capping native async Gemini calls on the running loop"""
+    loop = asyncio.get_running_loop()
+    with _executor_lock:
+        semaphore = _async_slots.get(loop)
+        if semaphore is None:
+            semaphore = _async_slots[loop] = asyncio.Semaphore(_max_workers())
+    return semaphore
+
+
+def _tracked(func: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap a call so executor usage shows up in get_executor_stats()"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _stats_lock:
+            _stats['in_flight'] += 1
+        try:
+            result = func(*args, **kwargs)
+        except BaseException:
+            with _stats_lock:
+                _stats['failed'] += 1
+            raise
+        else:
+            with _stats_lock:
+                _stats['completed'] += 1
+            return result
+        finally:
+            with _stats_lock:
+                _stats['in_flight'] -= 1
+    return wrapper
+
+
+def _count_cancelled(future: Future) -> None:
+    if future.cancelled():
+        with _stats_lock:
+            _stats['cancelled'] += 1
+
+
+def submit_blocking(func: Callable[..., Any], *args, **kwargs) -> Future:
+    """
+    Submit a blocking function to the shared Gemini executor from synchronous code
+
+    Returns:
+        A concurrent.futures.Future; cancelling it before it starts frees the slot
+    """
+    with _stats_lock:
+        _stats['submitted'] += 1
+    future = get_gemini_executor().submit(_tracked(func), *args, **kwargs)
+    future.add_done_callback(_count_cancelled)
+    return future
+
+
+async def run_blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a blocking function on the shared Gemini executor
+
+    Calls beyond the pool size queue up instead of starting new threads;
+    cancelling the await (e.g. asyncio.wait_for) drops a call still queued.
+
+    Args:
+        func: Synchronous callable (SDK call or a method that makes SDK calls)
+        *args, **kwargs: Arguments passed to func
+
+    Returns:
+        The function's return value (exceptions propagate to the caller)
+    """
+    return await asyncio.wrap_future(submit_blocking(func, *args, **kwargs))
+
+
+async def generate_content_async(client: Any, **kwargs) -> Any:
+    """
+    Call `models.generate_content` on a google-genai client without blocking
+
+    Uses the client's native async API when present, with at most
+    GEMINI_MAX_WORKERS calls in flight per event loop, and falls back to the
+    shared executor otherwise.
+
+    Args:
+        client: google.genai.Client instance
+        **kwargs: Arguments for generate_content (model, contents, config)
+
+    Returns:
+        GenerateContentResponse
+    """
+    aio = getattr(client, 'aio', None)
+    if aio is not None:
+        with _stats_lock:
+            _stats['submitted'] += 1
+        async with _async_semaphore():
+            with _stats_lock:
+                _stats['in_flight'] += 1
+            try:
+                response = await aio.models.generate_content(**kwargs)
+            except BaseException:
+                with _stats_lock:
+                    _stats['failed'] += 1
+                raise
+            else:
+                with _stats_lock:
+                    _stats['completed'] += 1
+                return response
+            finally:
+                with _stats_lock:
+                    _stats['in_flight'] -= 1
+    return await run_blocking(client.models.generate_content, **kwargs)
+
+
+def get_executor_stats() -> Dict[str, Any]:
+    """Get executor usage statistics"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['max_workers'] = get_gemini_executor()._max_workers
+    stats['queued'] = max(
+        0, stats['submitted'] - stats['completed'] - stats['failed'] - stats['cancelled'] - stats['in_flight']
+    )
+    return stats
+
+
+def shutdown_gemini_executor(wait: bool = True) -> None:
+    """Shut down the shared executor (e.g. on application shutdown)"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+            _executor = None
@@ -0,0 +1,138 @@
+"""
+Gemini Client Registry
+
+One place to get Gemini clients, model IDs and request timeouts:
+- google-genai clients are created once per (API key, timeout) and reused
+  process-wide, so HTTP connection pools and TLS sessions stay warm instead of
+  being rebuilt on every image request
+- Model IDs and timeouts are defined per purpose and can be overridden with
+  environment variables, e.g. GEMINI_MODEL_IMAGE=... or GEMINI_TIMEOUT_IMAGE=180
+
+Usage:
+    client = get_client(purpose='image')
+    response = client.models.generate_content(model=get_model('image'), contents=[...])
+"""
+
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    from google import genai
+    from google.genai import types
+    GENAI_AVAILABLE = True
+except ImportError:
+    GENAI_AVAILABLE = False
+
+
+# Model IDs by purpose
+MODELS: Dict[str, str] = {
+    'text': 'gemini-2.0-flash-exp',     # recommendations, agents, analysis
+    'search': 'gemini-2.0-flash-exp',   # grounded product search
+    'vision': 'gemini-2.0-flash-exp',   # image understanding (garment analysis)
+    'image': 'gemini-2.5-flash-image',  # image generation (try-on, photobooth)
+    'live': 'gemini-2.0-flash-exp'      # Live API sessions
+}
+
+# Request timeouts in seconds by purpose (None = SDK default)
+TIMEOUTS: Dict[str, Optional[float]] = {
+    'text': 60,
+    'search': 60,
+    'vision': 60,
+    'image': 120,
+    'live': None
+}
+
+_clients: Dict[Tuple[str, Optional[int]], Any] = {}
+_lock = threading.Lock()
+_stats = {'created': 0, 'reused': 0}
+
+
+def get_model(purpose: str = 'text') -> str:
+    """Get the model ID for a purpose (GEMINI_MODEL_<PURPOSE> overrides)"""
+    if purpose not in MODELS:
+        raise ValueError(f"Unknown Gemini model purpose: {purpose}")
+    return os.getenv(f"GEMINI_MODEL_{purpose.upper()}", MODELS[purpose])
+
+
+def get_timeout(purpose: str = 'text') -> Optional[float]:
+    """Get the request timeout in seconds for a purpose (GEMINI_TIMEOUT_<PURPOSE> overrides)"""
+    override = os.getenv(f"GEMINI_TIMEOUT_{purpose.upper()}")
+    if override:
+        return float(override)
+    return TIMEOUTS.get(purpose)
+
+
+def request_options(purpose: str = 'text') -> Dict[str, Any]:
+    """`request_options` for google-generativeai generate_content calls"""
+    timeout = get_timeout(purpose)
+    return {'timeout': timeout} if timeout else {}
+
+
+def get_api_key(api_key: Optional[str] = None) -> str:
+    """Resolve the Gemini API key from the argument or the environment"""
+    api_key = api_key or os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY not found in environment variables")
+    return api_key
+
+
+def get_client(api_key: Optional[str] = None, purpose: str = 'text') -> Any:
+    """
+    Get a shared google-genai client
+
+    Clients are cached per API key and timeout, so every caller with the same
+    settings shares one connection pool.
+
+    Args:
+        api_key: Gemini API key (defaults to GEMINI_API_KEY / GOOGLE_API_KEY)
+        purpose: Model purpose, used to pick the request timeout
+
+    Returns:
+        google.genai.Client instance
+    """
+    if not GENAI_AVAILABLE:
+        raise ImportError("google-genai package not installed. Run: pip install google-genai")
+
+    api_key = get_api_key(api_key)
+    timeout = get_timeout(purpose)
+    timeout_ms = int(timeout * 1000) if timeout else None
+    key = (api_key, timeout_ms)
+
+    client = _clients.get(key)
+    if client is not None:
+        _stats['reused'] += 1
+        return client
+
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            http_options = types.HttpOptions(timeout=timeout_ms) if timeout_ms else None
+            client = genai.Client(api_key=api_key, http_options=http_options)
+            _clients[key] = client
+            _stats['created'] += 1
+        else:
+            _stats['reused'] += 1
+    return client
+
+
+def get_client_stats() -> Dict[str, Any]:
+    """Get registry statistics"""
+    return {
+        'clients': len(_clients),
+        'created': _stats['created'],
+        'reused': _stats['reused']
+    }
+
+
+def close_clients() -> None:
+    """Close and forget all cached clients (e.g. on application shutdown)"""
+    with _lock:
+        for client in _clients.values():
+            close = getattr(client, 'close', None)
+            if close:
+                try:
+                    close()
+                except Exception as e:
+                    print(f"Warning: Failed to close Gemini client: {e}")
+        _clients.clear()
@@ -0,0 +1,226 @@
+"""
+Image Upload Preparation
+
+Normalizes images before they are sent to Gemini. Phone photos are often
+8-12 MB while the models work at a fraction of that resolution, so uploads
+are dominated by pixels the model never sees:
+- EXIF orientation is applied, so the model gets the photo the right way up
+- The longest edge is capped per model purpose (JPEG is decoded at reduced
+  size directly when possible)
+- EXIF, GPS and other metadata are stripped
+- Opaque images are re-encoded as JPEG, images with transparency as WebP,
+  at a quality tuned per purpose
+- Small images that would not shrink are passed through unchanged
+
+Usage:
+    prepared = prepare_image(photo_bytes, purpose='image')
+    part = {"inline_data": {"mime_type": prepared.mime_type, "data": prepared.data}}
+    print(f"saved {prepared.bytes_saved} bytes")
+
+Limits can be overridden per purpose with environment variables, e.g.
+IMAGE_PREP_MAX_EDGE_IMAGE=2048 or IMAGE_PREP_QUALITY_VISION=80.
+
+Compare the settings on your own photos with:
+    python image_prep.py photo.jpg [more.jpg ...]
+"""
+
+import io
+import os
+import time
+import threading
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple, Union
+
+from PIL import Image, ImageOps
+
+
+# Upload limits per model purpose (see gemini_clients.MODELS)
+PREP_PROFILES: Dict[str, Dict[str, int]] = {
+    'text': {'max_edge': 1024, 'quality': 85},
+    'search': {'max_edge': 1024, 'quality': 85},
+    'vision': {'max_edge': 1024, 'quality': 85},  # garment analysis needs detail, not pixels
+    'image': {'max_edge': 1536, 'quality': 90},   # try-on / photobooth generation inputs
+    'live': {'max_edge': 768, 'quality': 80}
+}
+
+_MIME_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp'}
+# Formats Gemini accepts, for pass-through of images that need no changes
+_PASSTHROUGH_FORMATS = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'WEBP': 'image/webp'}
+
+_stats_lock = threading.Lock()
+_stats = {
+    'images': 0,
+    'resized': 0,
+    'passthrough': 0,
+    'bytes_in': 0,
+    'bytes_out': 0,
+    'seconds': 0.0
+}
+
+
+@dataclass
+class PreparedImage:
+    """An image ready to upload, with what preparation did to it"""
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_bytes: int
+    original_size: Tuple[int, int]
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - len(self.data)
+
+
+def get_prep_profile(purpose: str = 'image') -> Dict[str, int]:
+    """Get the upload limits for a purpose (IMAGE_PREP_<SETTING>_<PURPOSE> overrides)"""
+    if purpose not in PREP_PROFILES:
+        raise ValueError(f"Unknown image preparation purpose: {purpose}")
+    profile = dict(PREP_PROFILES[purpose])
+    for setting in profile:
+        override = os.getenv(f"IMAGE_PREP_{setting.upper()}_{purpose.upper()}")
+        if override:
+            profile[setting] = int(override)
+    return profile
+
+
+def _load(image: Union[bytes, bytearray, memoryview, str, Path, Image.Image]) -> Tuple[Any, bytes]:
+    """Open the input as a PIL image, returning (image, original bytes or b'')"""
+    if isinstance(image, Image.Image):
+        return image, b''
+    if isinstance(image, (str, Path)):
+        image = Path(image).read_bytes()
+    if not isinstance(image, (bytes, bytearray, memoryview)):
+        raise TypeError(f"Expected image bytes, PIL image or path, got {type(image).__name__}")
+    data = bytes(image)
+    try:
+        return Image.open(io.BytesIO(data)), data
+    except Exception as e:
+        raise ValueError("Unsupported image data: not a readable image file") from e
+
+
+def _has_alpha(image: Image.Image) -> bool:
+    return image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def prepare_image(
+    image: Union[bytes, bytearray, memoryview, str, Path, Image.Image],
+    purpose: str = 'image',
+    max_edge: Optional[int] = None,
+    quality: Optional[int] = None
+) -> PreparedImage:
+    """
+    Normalize an image for upload to a Gemini model
+
+    Args:
+        image: Image bytes, path or PIL image
+        purpose: Model purpose whose profile sets the limits (text, vision, image, ...)
+        max_edge: Longest edge in pixels (overrides the profile)
+        quality: JPEG/WebP quality 1-100 (overrides the profile)
+
+    Returns:
+        PreparedImage with the bytes to send and the sizes before and after
+
+    Raises:
+        ValueError: If the data is not a readable image
+    """
+    start = time.perf_counter()
+    profile = get_prep_profile(purpose)
+    max_edge = max_edge or profile['max_edge']
+    quality = quality or profile['quality']
+
+    img, original = _load(image)
+    original_size = img.size
+    source_format = img.format
+    needs_resize = max(original_size) > max_edge
+    try:
+        orientation = img.getexif().get(0x0112, 1)
+    except Exception:
+        orientation = 1
+    has_metadata = any(key in img.info for key in ('exif', 'icc_profile', 'xmp', 'comment'))
+    # Bytes that could be sent as they are, if re-encoding does not make them smaller
+    clean = (bool(original) and not needs_resize and orientation == 1 and not has_metadata
+             and source_format in _PASSTHROUGH_FORMATS)
+
+    if clean and len(original) <= 512 * 1024:
+        # Already small: re-encoding would only cost time and quality
+        result = PreparedImage(original, _PASSTHROUGH_FORMATS[source_format], *original_size,
+                               len(original), original_size)
+        _record(result, start, passthrough=True)
+        return result
+
+    try:
+        if needs_resize and source_format == 'JPEG':
+            # Let libjpeg decode at 1/2, 1/4 or 1/8 scale, still at least max_edge
+            img.draft('RGB', (max_edge, max_edge))
+        img = ImageOps.exif_transpose(img)
+        if needs_resize or max(img.size) > max_edge:
+            img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        if _has_alpha(img):
+            img = img.convert('RGBA')
+            pil_format = 'WEBP'
+        else:
+            img = img.convert('RGB')
+            pil_format = 'JPEG'
+
+        buffer = io.BytesIO()
+        if pil_format == 'JPEG':
+            img.save(buffer, format='JPEG', quality=quality, optimize=True, progressive=True)
+        else:
+            img.save(buffer, format='WEBP', quality=quality, method=4)
+    except Exception as e:
+        raise ValueError(f"Could not prepare image: {e}") from e
+    data = buffer.getvalue()
+
+    if clean and len(data) >= len(original):
+        data, mime_type = original, _PASSTHROUGH_FORMATS[source_format]
+    else:
+        mime_type = _MIME_TYPES[pil_format]
+
+    result = PreparedImage(data, mime_type, img.width, img.height, len(original) or len(data), original_size)
+    _record(result, start, passthrough=data is original)
+    return result
+
+
+def _record(result: PreparedImage, start: float, passthrough: bool) -> None:
+    with _stats_lock:
+        _stats['images'] += 1
+        _stats['resized'] += max(result.width, result.height) != max(result.original_size)
+        _stats['passthrough'] += passthrough
+        _stats['bytes_in'] += result.original_bytes
+        _stats['bytes_out'] += len(result.data)
+        _stats['seconds'] += time.perf_counter() - start
+
+
+def get_prep_stats() -> Dict[str, Any]:
+    """Get upload preparation statistics (bytes saved across all prepared images)"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['bytes_saved'] = stats['bytes_in'] - stats['bytes_out']
+    stats['saved_ratio'] = round(stats['bytes_saved'] / stats['bytes_in'], 3) if stats['bytes_in'] else 0.0
+    stats['avg_ms'] = round(stats.pop('seconds') * 1000 / stats['images'], 1) if stats['images'] else 0.0
+    return stats
+
+
+if __name__ == "__main__":
+    import sys
+
+    paths = sys.argv[1:]
+    if not paths:
+        print("Usage: python image_prep.py photo.jpg [more.jpg ...]")
+        sys.exit(1)
+
+    print(f"{'image':28} {'purpose':8} {'original':>18} {'prepared':>18} {'saved':>7} {'ms':>7}")
+    for path in paths:
+        for purpose in ('vision', 'image'):
+            start = time.perf_counter()
+            prepared = prepare_image(path, purpose=purpose)
+            ms = (time.perf_counter() - start) * 1000
+            before = f"{prepared.original_bytes // 1024} KB {prepared.original_size[0]}x{prepared.original_size[1]}"
+            after = f"{len(prepared.data) // 1024} KB {prepared.width}x{prepared.height}"
+            print(f"{Path(path).name[:28]:28} {purpose:8} {before:>18} {after:>18} "
+                  f"{prepared.bytes_saved / prepared.original_bytes:>7.0%} {ms:>7.1f}")
+    print(f"\nTotals: {get_prep_stats()}")
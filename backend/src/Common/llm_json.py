@@ -0,0 +1,481 @@
+"""
+LLM JSON Output Parsing
+
+Shared helpers for turning Gemini text output into JSON values:
+- Extracts JSON from markdown fences or prose-wrapped responses
+- Repairs common truncation (unterminated strings, missing closing brackets,
+  dangling commas or keys) instead of discarding the whole response
+- Parses incrementally from a token stream, emitting top-level array elements
+  as soon as they are complete
+- Builds structured-output generation configs (response_mime_type + schema)
+
+Usage:
+    data = parse_llm_json(response.text, expect=list)
+
+    parser = IncrementalJSONParser()
+    for chunk in response:
+        for item in parser.feed(chunk.text):
+            handle(item)
+"""
+
+import re
+import json
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+
+class LLMOutputError(ValueError):
+    """Raised when no usable JSON value can be recovered from model output"""
+
+
+_FENCE_RE = re.compile(r"```[a-zA-Z]*[ \t]*\n?(.*?)(?:```|\Z)", re.DOTALL)
+_TRAILING_COMMA_RE = re.compile(r",(\s*[\]}])")
+_CLOSERS = {'{': '}', '[': ']'}
+_LITERALS = ('true', 'false', 'null')
+
+# How many candidate start positions to try in prose-wrapped text
+_MAX_START_ATTEMPTS = 8
+
+
+def json_generation_config(schema: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Generation config asking Gemini for a JSON response
+
+    Works for both google-generativeai (`generation_config=`) and google-genai
+    (`config=`), which accept the same keys.
+
+    Args:
+        schema: Optional OpenAPI-style response schema
+
+    Returns:
+        Generation config dictionary
+    """
+    config: Dict[str, Any] = {"response_mime_type": "application/json"}
+    if schema:
+        config["response_schema"] = schema
+    return config
+
+
+def _strip_fences(text: str) -> str:
+    """Return the content of the first markdown code fence, or the text unchanged"""
+    match = _FENCE_RE.search(text)
+    if match and match.group(1).strip():
+        return match.group(1)
+    return text
+
+
+def _scan(text: str, start: int) -> Tuple[Optional[int], List[Tuple[int, Tuple[str, ...]]], List[str], bool]:
+    """
+    Scan a JSON value starting at `start`
+
+    Returns:
+        (end index, None if unterminated or -1 on a mismatched bracket,
+         safe cut points as (position, open-bracket stack),
+         open-bracket stack at the end of the text,
+         whether the text ends inside a string)
+    """
+    stack: List[str] = []
+    cuts: List[Tuple[int, Tuple[str, ...]]] = []
+    in_string = False
+    escaped = False
+
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+
+        if ch == '"':
+            in_string = True
+        elif ch in '{[':
+            stack.append(ch)
+            cuts.append((i + 1, tuple(stack)))
+        elif ch in '}]':
+            if not stack or _CLOSERS[stack[-1]] != ch:
+                return -1, cuts, stack, False
+            stack.pop()
+            if not stack:
+                return i + 1, cuts, stack, False
+        elif ch == ',':
+            cuts.append((i, tuple(stack)))
+
+    return None, cuts, stack, in_string
+
+
+def _plausible_start(text: str, start: int, final: bool = True) -> Optional[bool]:
+    """
+    Whether the bracket at `start` is followed by something that can begin JSON
+
+    Args:
+        final: Whether `text` is complete; for a partial stream buffer None is
+               returned when more text is needed to decide
+    """
+    rest = text[start + 1:].lstrip()
+    if not rest:
+        return True if final else None
+    if text[start] == '{':
+        return rest[0] in '"}'
+    if rest[0] in 'tfn':
+        # "[true" is JSON, "[note]" is prose
+        for literal in _LITERALS:
+            if rest.startswith(literal):
+                return True
+            if literal.startswith(rest):
+                return True if final else None
+        return False
+    return rest[0] in '"{[]-0123456789'
+
+
+def _loads(candidate: str) -> Any:
+    try:
+        return json.loads(candidate)
+    except ValueError:
+        return json.loads(_TRAILING_COMMA_RE.sub(r"\1", candidate))
+
+
+def repair_json(fragment: str) -> Any:
+    """
+    Parse a JSON value that may have been cut off mid-stream
+
+    The fragment must start with `{` or `[`. Incomplete trailing members are
+    dropped and the open containers are closed.
+
+    Raises:
+        LLMOutputError: If nothing parseable remains
+    """
+    end, cuts, stack, in_string = _scan(fragment, 0)
+    if end == -1:
+        raise LLMOutputError("Mismatched brackets in model output")
+    if end is not None:
+        return _loads(fragment[:end])
+
+    # First try keeping everything: close the open string and containers
+    closing = ''.join(_CLOSERS[c] for c in reversed(stack))
+    try:
+        return _loads(fragment + ('"' if in_string else '') + closing)
+    except ValueError:
+        pass
+
+    # Otherwise cut back to the last complete member and close from there,
+    # preferring cuts at commas so a half-written member is dropped entirely
+    # rather than left behind as an empty container
+    ordered = [c for c in reversed(cuts) if fragment[c[0]:c[0] + 1] == ',']
+    ordered += [c for c in reversed(cuts) if fragment[c[0]:c[0] + 1] != ',']
+    for pos, cut_stack in ordered:
+        candidate = fragment[:pos].rstrip().rstrip(',')
+        candidate += ''.join(_CLOSERS[c] for c in reversed(cut_stack))
+        try:
+            return _loads(candidate)
+        except ValueError:
+            continue
+
+    raise LLMOutputError("Could not repair truncated JSON")
+
+
+def extract_json(text: str, expect: Optional[Union[type, Tuple[type, ...]]] = None, repair: bool = True) -> Any:
+    """
+    Extract the first JSON value from model output
+
+    Handles markdown fences, prose before/after the JSON and (optionally)
+    truncated output.
+
+    Args:
+        text: Raw model output
+        expect: `list`, `dict` or a tuple of them to only accept those top-level types
+        repair: Attempt to repair truncated JSON
+
+    Returns:
+        Parsed JSON value
+
+    Raises:
+        LLMOutputError: If no JSON value could be recovered
+    """
+    if not text or not text.strip():
+        raise LLMOutputError("Empty model output")
+
+    body = _strip_fences(text).strip()
+
+    # Fast path: the whole body is valid JSON
+    try:
+        value = json.loads(body)
+        if expect is None or isinstance(value, expect):
+            return value
+    except ValueError:
+        pass
+
+    openers = '[' if expect is list else '{' if expect is dict else '[{'
+    # Lists of plain scalars ("[1]") are often citations in prose; keep one as a
+    # fallback but prefer any later value, complete or truncated
+    scalar_list: Optional[list] = None
+    truncated_start: Optional[int] = None
+    attempts = 0
+    pos = 0
+
+    while attempts < _MAX_START_ATTEMPTS:
+        starts = [body.find(c, pos) for c in openers]
+        starts = [s for s in starts if s != -1]
+        if not starts:
+            break
+        start = min(starts)
+        pos = start + 1
+        if not _plausible_start(body, start):
+            # A bracketed aside in prose such as "[1]" or "[see below]"
+            continue
+        attempts += 1
+
+        end, _, _, _ = _scan(body, start)
+        if end == -1:
+            # Mismatched brackets, not JSON: try the next bracket
+            continue
+        if end is not None:
+            try:
+                value = _loads(body[start:end])
+            except ValueError:
+                continue
+            if (isinstance(value, list) and expect is not dict
+                    and not any(isinstance(v, (dict, list)) for v in value)):
+                if scalar_list is None:
+                    scalar_list = value
+                continue
+            if expect is None or isinstance(value, expect):
+                return value
+        else:
+            # Unterminated: every later bracket is nested inside this value
+            truncated_start = start
+            break
+
+    if repair and truncated_start is not None:
+        value = repair_json(body[truncated_start:])
+        if expect is None or isinstance(value, expect):
+            return value
+
+    if scalar_list is not None:
+        return scalar_list
+
+    raise LLMOutputError("No JSON value found in model output")
+
+
+def parse_llm_json(text: str, expect: Optional[Union[type, Tuple[type, ...]]] = None, default: Any = None) -> Any:
+    """
+    Like extract_json but returns `default` instead of raising
+
+    Args:
+        text: Raw model output
+        expect: `list`, `dict` or a tuple of them to only accept those top-level types
+        default: Value returned when parsing fails
+
+    Returns:
+        Parsed JSON value or default
+    """
+    try:
+        return extract_json(text, expect=expect)
+    except LLMOutputError as e:
+        print(f"Warning: Could not parse model output as JSON: {e}")
+        return default
+
+
+class IncrementalJSONParser:
+    """
+    Incremental parser for streamed model output
+
+    Feed text chunks as they arrive. Elements of a top-level JSON array are
+    returned from feed() as soon as each one is complete, so callers can start
+    working on the first result while the rest is still being generated; a
+    top-level object is returned as a single item once it is complete.
+    Leading fences/prose are skipped with the same bracket checks as
+    extract_json, so asides such as "[note]" are not taken for the value.
+    """
+
+    def __init__(self):
+        self._buffer = ''
+        self._pos = 0
+        self._root_start: Optional[int] = None
+        self._root_items = 0
+        self._element_start: Optional[int] = None
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escaped = False
+        self._done = False
+        self.items: List[Any] = []
+        # Top-level array elements seen, including ones that failed to parse
+        self.element_count = 0
+
+    def feed(self, chunk: str) -> List[Any]:
+        """
+        Add a chunk of model output
+
+        Returns:
+            Top-level array elements (or the top-level object) completed by this chunk
+        """
+        if not chunk or self._done:
+            return []
+        self._buffer += chunk
+        completed: List[Any] = []
+
+        text = self._buffer
+        i = self._pos
+        while i < len(text):
+            ch = text[i]
+
+            if self._root_start is None:
+                if ch in '[{':
+                    plausible = _plausible_start(text, i, final=False)
+                    if plausible is None:
+                        # Wait for the next chunk to decide
+                        break
+                    if plausible:
+                        self._root_start = i
+                        self._root_items = len(self.items)
+                        self._stack.append(ch)
+                i += 1
+                continue
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == '\\':
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                i += 1
+                continue
+
+            at_array_top = len(self._stack) == 1 and self._stack[0] == '['
+
+            if at_array_top and self._element_start is None and not ch.isspace() and ch not in ',]':
+                self._element_start = i
+
+            if ch == '"':
+                self._in_string = True
+            elif ch in '{[':
+                self._stack.append(ch)
+            elif ch in '}]':
+                if _CLOSERS[self._stack[-1]] != ch:
+                    # Mismatched brackets, not JSON: look for the value after this bracket
+                    i = self._reset(completed)
+                    continue
+                self._stack.pop()
+                if len(self._stack) == 1 and self._stack[0] == '[' and self._element_start is not None:
+                    # A nested container element just closed
+                    self._emit(text[self._element_start:i + 1], completed)
+                elif not self._stack:
+                    if self._element_start is not None:
+                        # Scalar element terminated by the closing bracket
+                        self._emit(text[self._element_start:i], completed)
+                    try:
+                        value = _loads(text[self._root_start:i + 1])
+                    except ValueError:
+                        i = self._reset(completed)
+                        continue
+                    if isinstance(value, dict):
+                        self.items.append(value)
+                        completed.append(value)
+                    self._done = True
+                    self._pos = i + 1
+                    return completed
+            elif ch == ',' and at_array_top and self._element_start is not None:
+                # Scalar element terminated by a comma
+                self._emit(text[self._element_start:i], completed)
+            i += 1
+
+        self._pos = i
+        return completed
+
+    def _reset(self, completed: List[Any]) -> int:
+        """
+        Abandon a root bracket that turned out not to start JSON
+
+        Returns:
+            The position to continue scanning from
+        """
+        dropped = len(self.items) - self._root_items
+        if dropped:
+            del self.items[self._root_items:]
+            del completed[max(0, len(completed) - dropped):]
+        restart = self._root_start + 1
+        self._root_start = None
+        self._element_start = None
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+        self.element_count = 0
+        return restart
+
+    def _emit(self, raw: str, completed: List[Any]) -> None:
+        self._element_start = None
+        raw = raw.strip()
+        if not raw:
+            return
+        self.element_count += 1
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            return
+        self.items.append(value)
+        completed.append(value)
+
+    @property
+    def done(self) -> bool:
+        """Whether the top-level value has been closed"""
+        return self._done
+
+    @property
+    def is_object(self) -> bool:
+        """Whether the top-level value is an object rather than an array"""
+        return self._root_start is not None and self._buffer[self._root_start] == '{'
+
+    def result(self, repair: bool = True) -> Any:
+        """
+        Parse everything fed so far as one value
+
+        Returns:
+            The complete (or repaired) top-level value
+        """
+        if self._root_start is None:
+            # Possibly a bracket still waiting for lookahead when the stream ended
+            return extract_json(self._buffer[self._pos:], repair=repair)
+        fragment = self._buffer[self._root_start:]
+        if self._done:
+            return _loads(fragment[:self._pos - self._root_start])
+        if not repair:
+            raise LLMOutputError("Model output ended before the JSON value was complete")
+        return repair_json(fragment)
+
+
+def _array_of(value: Dict[str, Any]) -> List[Any]:
+    """The elements of an object wrapping a single array ({"items": [...]}), else the object"""
+    arrays = [v for v in value.values() if isinstance(v, list)]
+    return arrays[0] if len(arrays) == 1 else [value]
+
+
+def iter_json_array(chunks: Iterable[str]) -> Iterator[Any]:
+    """
+    Yield elements of a streamed top-level JSON array as they complete
+
+    An object wrapping a single array is unwrapped once it is complete; any
+    other object is yielded as one element. Elements still pending when the
+    stream ends (e.g. a truncated response) are recovered through repair.
+    """
+    parser = IncrementalJSONParser()
+    for chunk in chunks:
+        for item in parser.feed(chunk):
+            if parser.is_object:
+                yield from _array_of(item)
+            else:
+                yield item
+
+    if not parser.done:
+        try:
+            value = parser.result()
+        except (LLMOutputError, ValueError):
+            return
+        if isinstance(value, dict):
+            yield from _array_of(value)
+        elif isinstance(value, list):
+            # Skip elements already seen in the stream, whether or not they parsed
+            for item in value[parser.element_count:]:
+                yield item
@@ -0,0 +1,168 @@
+"""
+Local Model Registry
+
+Heavy ML models that run in-process (rembg / ONNX background removal) are
+registered here instead of being loaded at import time:
+- Registering only records a loader; importing a module stays fast and the
+  server can start without the model or even its package installed
+- A model is loaded once, on first use or by a background warmup started
+  after startup; concurrent first users wait for the same load
+- The load state of every model can be reported by readiness endpoints
+
+Usage:
+    register_local_model("rembg", lambda: new_session("u2net"), requires="rembg")
+    warmup_local_models(["rembg"])          # returns immediately
+    session = get_local_model("rembg")      # waits for the load if needed
+"""
+
+import time
+import threading
+import importlib.util
+from typing import Any, Callable, Dict, Iterable, Optional
+
+# Load states
+UNAVAILABLE = "unavailable"   # required package not installed
+NOT_LOADED = "not_loaded"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+class LocalModelUnavailable(RuntimeError):
+    """The model's package is missing or loading it failed"""
+
+
+class _Entry:
+    """One registered model and its load state"""
+
+    def __init__(self, loader: Callable[[], Any], requires: Optional[str]):
+        self.loader = loader
+        self.requires = requires
+        self.lock = threading.Lock()
+        self.model: Any = None
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.loaded_at: Optional[float] = None
+        available = requires is None or importlib.util.find_spec(requires) is not None
+        self.state = NOT_LOADED if available else UNAVAILABLE
+        if not available:
+            self.error = f"{requires} is not installed"
+
+
+_models: Dict[str, _Entry] = {}
+_lock = threading.Lock()
+
+
+def register_local_model(name: str, loader: Callable[[], Any], requires: Optional[str] = None) -> None:
+    """
+    Register a model without loading it
+
+    Args:
+        name: Registry name
+        loader: Function returning the loaded model (runs at most once)
+        requires: Top-level package the loader imports; the model is reported
+                  unavailable without loading if it is not installed
+    """
+    with _lock:
+        if name not in _models:
+            _models[name] = _Entry(loader, requires)
+
+
+def _entry(name: str) -> _Entry:
+    with _lock:
+        entry = _models.get(name)
+    if entry is None:
+        raise KeyError(f"Unknown local model: {name}")
+    return entry
+
+
+def get_local_model(name: str) -> Any:
+    """
+    Get a loaded model, loading it now if needed
+
+    Raises:
+        LocalModelUnavailable: If the package is missing or the load failed
+    """
+    entry = _entry(name)
+    if entry.state == READY:
+        return entry.model
+    if entry.state in (UNAVAILABLE, FAILED):
+        raise LocalModelUnavailable(f"Model {name} unavailable: {entry.error}")
+
+    with entry.lock:
+        # Another thread may have finished (or failed) the load while we waited
+        if entry.state == NOT_LOADED:
+            entry.state = LOADING
+            start = time.perf_counter()
+            try:
+                entry.model = entry.loader()
+                entry.state = READY
+                entry.loaded_at = time.time()
+                print(f"[OK] Loaded local model {name} in {time.perf_counter() - start:.1f}s")
+            except Exception as e:
+                entry.state = FAILED
+                entry.error = str(e)
+                print(f"[WARN] Failed to load local model {name}: {e}")
+            finally:
+                entry.load_seconds = round(time.perf_counter() - start, 2)
+
+    if entry.state != READY:
+        raise LocalModelUnavailable(f"Model {name} unavailable: {entry.error}")
+    return entry.model
+
+
+def is_local_model_ready(name: str) -> bool:
+    """Check whether a model is loaded, without loading it"""
+    return _entry(name).state == READY
+
+
+def warmup_local_models(names: Optional[Iterable[str]] = None, first_available: bool = False) -> threading.Thread:
+    """
+    Load models on a background thread (all registered models by default)
+
+    Args:
+        names: Models to load, in order
+        first_available: Stop after the first model that loads (for a
+                         fallback chain, where later models are only used
+                         when earlier ones are unavailable or fail)
+
+    Returns:
+        The warmup thread (a daemon, so it never delays shutdown)
+    """
+    with _lock:
+        names = list(names) if names is not None else list(_models)
+
+    def warmup():
+        for name in names:
+            try:
+                get_local_model(name)
+            except LocalModelUnavailable:
+                continue
+            if first_available:
+                return
+
+    thread = threading.Thread(target=warmup, name="local-model-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def get_local_model_status(names: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Get the load state of models (all registered models by default)
+
+    Returns:
+        Dictionary of name -> state (unavailable, not_loaded, loading, ready,
+        failed), error, load_seconds and loaded_at
+    """
+    with _lock:
+        names = list(names) if names is not None else list(_models)
+    status = {}
+    for name in names:
+        entry = _entry(name)
+        status[name] = {
+            'state': entry.state,
+            'error': entry.error,
+            'load_seconds': entry.load_seconds,
+            'loaded_at': entry.loaded_at
+        }
+    return status
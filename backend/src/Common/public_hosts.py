@@ -0,0 +1,118 @@
+"""
+Public Host Checks
+
+Guards for URLs the server fetches on behalf of users or model output
+(product links, product images, garment images):
+- Only http(s) URLs are accepted
+- The host must resolve, and only to public addresses, so a URL cannot
+  reach loopback, private networks or cloud metadata endpoints
+- NXDOMAIN (the name does not exist) is told apart from temporary DNS
+  failures, so callers can decide what to cache
+
+Callers that follow redirects check every hop, not just the first URL.
+
+Usage:
+    await check_public_url_async(url)      # raises HostNotAllowed / socket.gaierror
+    data = fetch_public_url(url, max_bytes=10 * 1024 * 1024)   # blocking, checks every redirect
+"""
+
+import socket
+import asyncio
+import ipaddress
+import urllib.request
+from typing import List, Tuple
+from urllib.parse import urlsplit
+
+# getaddrinfo errors meaning the name has no address (EAI_NODATA is not defined everywhere)
+_UNKNOWN_HOST_ERRORS = {socket.EAI_NONAME, getattr(socket, 'EAI_NODATA', socket.EAI_NONAME)}
+
+
+class HostNotAllowed(ValueError):
+    """The URL is not http(s) or its host resolves to a non-public address"""
+
+
+def is_public_address(address: str) -> bool:
+    """Whether an IP address is globally routable (not loopback, private, link-local...)"""
+    ip = ipaddress.ip_address(address.split('%', 1)[0])
+    return ip.is_global and not ip.is_multicast
+
+
+def is_unknown_host(error: socket.gaierror) -> bool:
+    """Whether a resolver error means the name does not exist (rather than a DNS hiccup)"""
+    return error.errno in _UNKNOWN_HOST_ERRORS
+
+
+def _target(url: str) -> Tuple[str, int]:
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise HostNotAllowed(f"Only http(s) URLs are allowed: {url[:100]}")
+    try:
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+    except ValueError:
+        raise HostNotAllowed(f"Invalid port in URL: {url[:100]}")
+    return parts.hostname, port
+
+
+def _check_addresses(host: str, infos: List[tuple]) -> None:
+    if not infos or not all(is_public_address(info[4][0]) for info in infos):
+        raise HostNotAllowed(f"Host is not public: {host}")
+
+
+def check_public_url(url: str, allow_private: bool = False) -> None:
+    """
+    Check a URL before fetching it (blocking DNS lookup)
+
+    Args:
+        url: URL about to be requested
+        allow_private: Skip the address check (local testing only); the host
+                       must still resolve
+
+    Raises:
+        HostNotAllowed: Not http(s), or the host resolves to a non-public address
+        socket.gaierror: The host does not resolve (see is_unknown_host)
+    """
+    host, port = _target(url)
+    infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    if not allow_private:
+        _check_addresses(host, infos)
+
+
+async def check_public_url_async(url: str, allow_private: bool = False) -> None:
+    """Like check_public_url, resolving on the event loop's resolver"""
+    host, port = _target(url)
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    if not allow_private:
+        _check_addresses(host, infos)
+
+
+class _CheckedRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Follows at most max_redirections redirects, checking each target's host"""
+
+    def __init__(self, max_redirects: int):
+        self.max_redirections = max_redirects
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_public_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def fetch_public_url(url: str, max_bytes: int, timeout: float = 15,
+                     max_redirects: int = 5, user_agent: str = 'Lovelace/1.0') -> bytes:
+    """
+    Download a URL into memory (blocking), refusing non-public hosts
+
+    The first URL and every redirect target go through check_public_url.
+
+    Raises:
+        HostNotAllowed: Not http(s), or a hop resolves to a non-public address
+        ValueError: The body is larger than max_bytes
+        OSError: Network and HTTP errors (urllib.error.URLError, socket.gaierror...)
+    """
+    check_public_url(url)
+    opener = urllib.request.build_opener(_CheckedRedirectHandler(max_redirects))
+    request = urllib.request.Request(url, headers={'User-Agent': user_agent})
+    with opener.open(request, timeout=timeout) as response:
+        data = response.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise ValueError(f"Response too large (over {max_bytes} bytes): {url[:100]}")
+    return data
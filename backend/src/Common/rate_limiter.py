@@ -0,0 +1,81 @@
+"""
+Rate Limiter - Shared request budget for LLM calls
+
+A thread-safe token bucket used to keep Gemini traffic under a global
+requests-per-minute budget. The same limiter instance can be shared by
+worker threads (batch jobs) and asyncio tasks (API routes).
+
+Usage:
+    limiter = RateLimiter(requests_per_minute=60)
+    limiter.acquire()          # blocks until a token is available
+    await limiter.acquire_async()
+"""
+
+import asyncio
+import threading
+import time
+from typing import Optional, Dict, Any
+
+
+class RateLimiter:
+    """Token bucket limiter with a requests-per-minute budget"""
+
+    def __init__(self, requests_per_minute: float = 60, burst: Optional[int] = None):
+        """
+        Initialize the limiter
+
+        Args:
+            requests_per_minute: Sustained request budget
+            burst: Maximum tokens that can accumulate (defaults to 1/6 of the
+                   per-minute budget, at least 1)
+        """
+        if requests_per_minute <= 0:
+            raise ValueError("requests_per_minute must be positive")
+
+        self.rate = requests_per_minute / 60.0  # tokens per second
+        self.capacity = burst or max(1, int(requests_per_minute / 6))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+        # Stats
+        self.acquired = 0
+        self.total_wait_seconds = 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _reserve(self) -> float:
+        """Take a token, returning how long the caller must wait before using it"""
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            self.acquired += 1
+            if self._tokens >= 0:
+                return 0.0
+            wait = -self._tokens / self.rate
+            self.total_wait_seconds += wait
+            return wait
+
+    def acquire(self) -> None:
+        """Block the current thread until a request may be sent"""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        """Wait (without blocking the event loop) until a request may be sent"""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get limiter statistics"""
+        return {
+            "requests_per_minute": self.rate * 60,
+            "burst": self.capacity,
+            "acquired": self.acquired,
+            "total_wait_seconds": round(self.total_wait_seconds, 2),
+        }
@@ -0,0 +1,107 @@
+"""
+Single-Flight Request Coalescing
+
+Deduplicates concurrent identical calls: the first caller for a key runs the
+function, callers arriving while it is in flight wait for and share its result
+(or its exception) instead of starting their own upstream call.
+
+Thread-based, so it works for the synchronous SDK calls that run on the
+Gemini executor and in batch worker pools alike.
+
+Usage:
+    flight = SingleFlight("search")
+    products = flight.do((query_key, n), search_fn, query, n)
+"""
+
+import copy
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class _Call:
+    """One in-flight call shared by its leader and waiters"""
+
+    __slots__ = ('event', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one execution"""
+
+    def __init__(self, name: str = "default", copy_results: bool = True):
+        """
+        Initialize the coalescer
+
+        Args:
+            name: Label used in statistics
+            copy_results: Give each waiter a deep copy of the shared result so
+                          callers can mutate what they receive
+        """
+        self.name = name
+        self.copy_results = copy_results
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.stats = {'calls': 0, 'executed': 0, 'coalesced': 0, 'errors': 0}
+
+    def do(self, key: Hashable, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run func, or wait for the identical in-flight call
+
+        Args:
+            key: Identity of the call (e.g. normalized query and result count)
+            func: Function to run if no call with this key is in flight
+            *args, **kwargs: Arguments passed to func
+
+        Returns:
+            The function's result (exceptions are re-raised to every waiter)
+        """
+        with self._lock:
+            self.stats['calls'] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.stats['coalesced'] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.stats['executed'] += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result) if self.copy_results else call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self.stats['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def in_flight(self) -> int:
+        """Number of distinct calls currently executing"""
+        with self._lock:
+            return len(self._calls)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get coalescing statistics"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['in_flight'] = len(self._calls)
+        stats['name'] = self.name
+        stats['coalesced_ratio'] = round(stats['coalesced'] / stats['calls'], 3) if stats['calls'] else 0.0
+        return stats
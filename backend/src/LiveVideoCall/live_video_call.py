@@ -32,6 +32,14 @@ except ImportError:
     print("Warning: Google GenAI library not installed.")
     print("Run: pip install google-genai")
 
+try:
+    from ..Common.gemini_clients import get_client, get_model
+except ImportError:
+    # Fallback for direct execution
+    import sys
+    sys.path.append(str(Path(__file__).parent.parent))
+    from Common.gemini_clients import get_client, get_model
+
 try:
     from dotenv import load_dotenv
     load_dotenv()
@@ -211,13 +219,13 @@ your partner feel confident and look amazing."""
             self.status = SessionStatus.CONNECTING
             
             # Initialize client
-            self.client = genai.Client(api_key=self.api_key)
+            self.client = get_client(self.api_key, purpose='live')
             
             # Build configuration
             config = self._build_live_config()
             
             # Use the native audio model
-            model = "gemini-2.0-flash-exp"
+            model = get_model('live')
             
             print(f"Connecting to Gemini Live API with model: {model}")
             print(f"Response modality: {self.config.response_modality.value}")
@@ -23,6 +23,13 @@ except ImportError:
     GENAI_AVAILABLE = False
     print("Warning: google-genai not available for video calls")
 
+try:
+    from ..Common.gemini_async import run_blocking
+    from ..Common.gemini_clients import get_client, get_model
+except ImportError:
+    from Common.gemini_async import run_blocking
+    from Common.gemini_clients import get_client, get_model
+
 router = APIRouter(prefix="/api/video-call")
 
 
@@ -51,8 +58,8 @@ class VideoCallManager:
             return None
         
         try:
-            # Create Gemini client
-            client = genai.Client(api_key=api_key)
+            # Shared Gemini client
+            client = get_client(api_key, purpose='live')
             
             # Configure for AUDIO responses (live voice)
             config = {
@@ -72,7 +79,7 @@ class VideoCallManager:
             
             # Connect to Gemini Live with proper model
             session = client.aio.live.connect(
-                model="gemini-2.0-flash-exp",
+                model=get_model('live'),
                 config=config
             )
             
@@ -335,7 +342,7 @@ async def test_connection():
         )
     
     try:
-        client = genai.Client(api_key=api_key)
+        client = await run_blocking(get_client, api_key, purpose='live')
         return {
             "status": "ready",
             "message": "Gemini API connection successful",
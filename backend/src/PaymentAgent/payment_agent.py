@@ -19,6 +19,8 @@ from dotenv import load_dotenv
 from .stripe_tools import StripeTools
 from .ucp_client import UCPClient, LineItem, BuyerInfo, Address
 from .browser_automation import BrowserAutomation
+from ..Common.gemini_async import run_blocking
+from ..Common.gemini_clients import get_model
 
 load_dotenv()
 
@@ -65,7 +67,7 @@ class PaymentAgent:
         
         genai.configure(api_key=gemini_key)
         self.model = genai.GenerativeModel(
-            model_name="gemini-2.0-flash-exp",
+            model_name=get_model('text'),
             generation_config={
                 "temperature": 0.7,
                 "top_p": 0.95,
@@ -229,7 +231,8 @@ class PaymentAgent:
         
         try:
             # Send message with tools
-            response = chat.send_message(
+            response = await run_blocking(
+                chat.send_message,
                 f"{system_prompt}\n\nUser: {user_message}",
                 tools=self._gemini_tools()
             )
@@ -241,7 +244,8 @@ class PaymentAgent:
                 )
                 
                 # Send function response back to model
-                response = chat.send_message(
+                response = await run_blocking(
+                    chat.send_message,
                     genai.types.Content(
                         parts=[genai.types.Part(
                             function_response=genai.types.FunctionResponse(
@@ -0,0 +1,232 @@
+"""
+Photobooth Background Cache
+
+Generating a background takes an image-model call of 10-30 seconds, and the
+same avatar is often asked for the same scene again. Generated backgrounds
+are kept in temp_backgrounds (so /api/photobooth/backgrounds/<file> keeps
+serving them) and tracked in a JSON index file:
+- Keyed by the avatar's content hash, the normalized scene description and
+  pose, the image model and the prompt version
+- Least recently used backgrounds are deleted once the cached files exceed
+  the size quota
+- Several backgrounds may share a key (forced regenerations for variation);
+  a lookup returns the newest one
+- Lookups only update last_used in memory; the index is written when a
+  background is added or evicted, at most every INDEX_SAVE_SECONDS after
+  lookups, and on flush(). Nothing is written while the cache is empty
+
+Files in the directory that are not in the index (e.g. pose backgrounds)
+are never touched.
+
+Example:
+    cache = BackgroundCache()
+    key = background_key(avatar_bytes, "sunset beach", "holding hands", model)
+    entry = cache.get(key)
+    if entry is None:
+        entry = cache.put(key, "abc123_ai_scene.png", png_bytes)
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+DEFAULT_DIRECTORY = Path(__file__).parent / "temp_backgrounds"
+INDEX_FILENAME = "background_index.json"
+DEFAULT_MAX_MB = 200
+# How often lookups alone (last_used updates) may rewrite the index
+INDEX_SAVE_SECONDS = 60
+
+# Bump when the background prompt changes, so old backgrounds are not reused
+BACKGROUND_PROMPT_VERSION = 1
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Lowercase and collapse whitespace, so trivially different inputs share a key"""
+    return " ".join((text or "").lower().split())
+
+
+def background_key(avatar: bytes, description: str, pose: str = "", model: str = "") -> str:
+    """Cache key for a background (sha256 hex)"""
+    parts = (
+        hashlib.sha256(avatar).hexdigest(), normalize_text(description), normalize_text(pose),
+        model, BACKGROUND_PROMPT_VERSION
+    )
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode()).hexdigest()
+
+
+class BackgroundCache:
+    """Thread-safe, size-bounded index of generated backgrounds"""
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        max_bytes: Optional[int] = None,
+        on_evict: Optional[Callable[[str], None]] = None
+    ):
+        """
+        Initialize the cache, loading the index left by previous runs
+
+        Args:
+            directory: Background directory (defaults to temp_backgrounds)
+            max_bytes: Size quota for cached backgrounds (defaults to
+                       PHOTOBOOTH_CACHE_MAX_MB, 200 MB)
+            on_evict: Called with the file name of every background deleted
+        """
+        self.directory = Path(directory or DEFAULT_DIRECTORY)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.directory / INDEX_FILENAME
+        self.max_bytes = max_bytes or int(os.getenv("PHOTOBOOTH_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024
+        self.on_evict = on_evict
+
+        self._lock = threading.Lock()
+        # filename -> {key, bytes, created_at, last_used, description, pose}
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        # Whether the index file is behind the entries, and when it was last written
+        self._dirty = False
+        self._saved_at = 0.0
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+
+        self._load_index()
+
+    # ==================== INDEX ====================
+
+    def _load_index(self) -> None:
+        """Read the index, dropping entries whose file is gone"""
+        try:
+            entries = json.loads(self.index_path.read_text()).get('backgrounds', {})
+        except FileNotFoundError:
+            entries = {}
+        except (OSError, ValueError) as e:
+            print(f"Warning: Background cache index unreadable, starting empty: {e}")
+            entries = {}
+
+        self._entries = {
+            filename: entry for filename, entry in entries.items()
+            if (self.directory / filename).exists()
+        }
+        with self._lock:
+            self._dirty = len(self._entries) != len(entries)
+            self._evict()
+            # Only rewritten if files were gone or over the quota
+            self._save_index()
+
+    def _save_index(self, force: bool = True) -> None:
+        """
+        Write the index atomically if it changed (caller holds the lock)
+
+        Args:
+            force: Write now; otherwise only if INDEX_SAVE_SECONDS have passed
+        """
+        if not self._dirty or (not force and time.time() - self._saved_at < INDEX_SAVE_SECONDS):
+            return
+        tmp_path = self.index_path.with_name(f"{self.index_path.name}.{threading.get_ident()}.tmp")
+        tmp_path.write_text(json.dumps({'version': 1, 'backgrounds': self._entries}, indent=1))
+        os.replace(tmp_path, self.index_path)
+        self._dirty = False
+        self._saved_at = time.time()
+
+    def _total_bytes(self) -> int:
+        return sum(entry['bytes'] for entry in self._entries.values())
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        """Delete least recently used backgrounds until within the quota (caller holds the lock)"""
+        total = self._total_bytes()
+        for filename in sorted(self._entries, key=lambda name: self._entries[name]['last_used']):
+            if total <= self.max_bytes:
+                break
+            if filename == keep:
+                continue
+            total -= self._entries.pop(filename)['bytes']
+            self._dirty = True
+            self.stats['evictions'] += 1
+            try:
+                (self.directory / filename).unlink()
+            except OSError:
+                pass
+            if self.on_evict:
+                self.on_evict(filename)
+
+    # ==================== API ====================
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the newest background stored for a key
+
+        Returns:
+            The index entry with its filename, or None on a miss
+        """
+        with self._lock:
+            matches = [
+                (entry['created_at'], filename) for filename, entry in self._entries.items()
+                if entry['key'] == key
+            ]
+            for _, filename in sorted(matches, reverse=True):
+                if not (self.directory / filename).exists():
+                    # Deleted behind our back
+                    del self._entries[filename]
+                    self._dirty = True
+                    continue
+                entry = self._entries[filename]
+                entry['last_used'] = time.time()
+                self._dirty = True
+                self.stats['hits'] += 1
+                self._save_index(force=False)
+                return dict(entry, filename=filename)
+            self.stats['misses'] += 1
+            return None
+
+    def put(self, key: str, filename: str, data: bytes, description: str = "", pose: str = "") -> Dict[str, Any]:
+        """
+        Write a generated background and add it to the index
+
+        Args:
+            key: Cache key (see background_key)
+            filename: File name inside the directory
+            data: Encoded image bytes
+            description, pose: What was asked for (kept for reference)
+
+        Returns:
+            The index entry with its filename
+        """
+        path = self.directory / filename
+        tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+        now = time.time()
+        entry = {
+            'key': key,
+            'bytes': len(data),
+            'created_at': now,
+            'last_used': now,
+            'description': description,
+            'pose': pose
+        }
+        with self._lock:
+            self._entries[filename] = entry
+            self._dirty = True
+            self.stats['writes'] += 1
+            # The new background is always kept, even if it alone exceeds the quota
+            self._evict(keep=filename)
+            self._save_index()
+        return dict(entry, filename=filename)
+
+    def flush(self) -> None:
+        """Write pending last_used updates to the index (e.g. on shutdown)"""
+        with self._lock:
+            self._save_index()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['backgrounds'] = len(self._entries)
+            stats['total_bytes'] = self._total_bytes()
+        stats['max_bytes'] = self.max_bytes
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        return stats
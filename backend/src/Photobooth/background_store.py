@@ -0,0 +1,216 @@
+"""
+Photobooth Background Store
+
+Keeps compositing from going back to the disk for every photo:
+- BackgroundFileIndex: the background files in temp_backgrounds, scanned
+  once and then updated by whoever writes or deletes a background, so
+  resolving a background URL is a dict lookup and listing the newest k
+  backgrounds does not stat and sort the whole directory
+- DecodedBackgroundCache: an LRU of decoded BGRA backgrounds bounded by
+  memory, so repeated composites onto the same background skip PNG
+  decoding (entries are invalidated when the file changes)
+
+Example:
+    index = BackgroundFileIndex(Path("temp_backgrounds"))
+    path = index.resolve("1_romantic_cafe.png")
+    background = get_decoded_backgrounds().load(path)   # writable BGRA copy
+"""
+
+import os
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+DEFAULT_DECODED_MAX_MB = 128
+
+# Regenerated pose backgrounds are saved as background_<n>_<name>.png but served as <n>_<name>.png
+_ALIAS_PREFIX = "background_"
+
+
+class BackgroundFileIndex:
+    """Thread-safe index of background image files, newest last"""
+
+    def __init__(self, directory: Union[str, Path], pattern: str = "*.png"):
+        """
+        Initialize the index with one scan of the directory
+
+        Args:
+            directory: Background directory (created if missing)
+            pattern: Files that are backgrounds
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.pattern = pattern
+        self._lock = threading.Lock()
+        # filename -> modification time, oldest first
+        self._files: "OrderedDict[str, float]" = OrderedDict()
+        self._aliases: Dict[str, str] = {}
+
+        entries = []
+        for path in self.directory.glob(pattern):
+            try:
+                entries.append((path.stat().st_mtime, path.name))
+            except OSError:
+                continue
+        for mtime, name in sorted(entries):
+            self._insert(name, mtime)
+
+    def _insert(self, filename: str, mtime: float) -> None:
+        """Add or move a file to the newest position (caller holds the lock, or is __init__)"""
+        self._files.pop(filename, None)
+        self._files[filename] = mtime
+        if filename.startswith(_ALIAS_PREFIX):
+            self._aliases[filename[len(_ALIAS_PREFIX):]] = filename
+
+    def add(self, filename: str) -> None:
+        """Record a background that was just written"""
+        try:
+            mtime = (self.directory / filename).stat().st_mtime
+        except OSError:
+            return
+        with self._lock:
+            self._insert(filename, mtime)
+
+    def remove(self, filename: str) -> None:
+        """Forget a background that was deleted"""
+        with self._lock:
+            self._files.pop(filename, None)
+            if filename.startswith(_ALIAS_PREFIX):
+                self._aliases.pop(filename[len(_ALIAS_PREFIX):], None)
+
+    def resolve(self, filename: str) -> Optional[Path]:
+        """
+        Find the file for a background name or URL file name
+
+        Files written by another process are picked up with a single stat.
+
+        Returns:
+            The file's path, or None if there is no such background
+        """
+        with self._lock:
+            name = filename if filename in self._files else self._aliases.get(filename)
+        if name is None:
+            path = self.directory / filename
+            if not path.is_file() or not path.match(self.pattern):
+                return None
+            self.add(filename)
+            return path
+
+        path = self.directory / name
+        if not path.exists():
+            # Deleted behind our back
+            self.remove(name)
+            return None
+        return path
+
+    def newest(self, limit: Optional[int] = None) -> List[str]:
+        """File names, newest first (at most limit)"""
+        with self._lock:
+            names = reversed(self._files)
+            if limit is None:
+                return list(names)
+            return [name for name, _ in zip(names, range(limit))]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._files)
+
+
+class DecodedBackgroundCache:
+    """Thread-safe LRU of decoded BGRA background images, bounded by memory"""
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        """
+        Initialize the cache
+
+        Args:
+            max_bytes: Memory bound for decoded pixels (defaults to
+                       PHOTOBOOTH_DECODED_CACHE_MB, 128 MB, about 30 backgrounds at 720p)
+        """
+        self.max_bytes = max_bytes or int(os.getenv("PHOTOBOOTH_DECODED_CACHE_MB", DEFAULT_DECODED_MAX_MB)) * 1024 * 1024
+        self._lock = threading.Lock()
+        # path -> (mtime, size, pixels), least recently used first
+        self._entries: "OrderedDict[str, Tuple[float, int, np.ndarray]]" = OrderedDict()
+        self._total_bytes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def load(self, path: Union[str, Path]) -> Optional[np.ndarray]:
+        """
+        Get a background as a BGRA array
+
+        Returns:
+            A writable copy (compositing draws into it), or None if the file
+            cannot be read as an image
+        """
+        key = str(path)
+        try:
+            stat = os.stat(key)
+        except OSError:
+            self.invalidate(key)
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == stat.st_mtime and entry[1] == stat.st_size:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry[2].copy()
+            self.stats['misses'] += 1
+
+        image = cv2.imread(key, cv2.IMREAD_UNCHANGED)
+        if image is None:
+            return None
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGRA)
+        elif image.shape[2] == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
+
+        if image.nbytes <= self.max_bytes:
+            pixels = image.copy()
+            pixels.setflags(write=False)
+            with self._lock:
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    self._total_bytes -= old[2].nbytes
+                self._entries[key] = (stat.st_mtime, stat.st_size, pixels)
+                self._total_bytes += pixels.nbytes
+                while self._total_bytes > self.max_bytes:
+                    _, (_, _, evicted) = self._entries.popitem(last=False)
+                    self._total_bytes -= evicted.nbytes
+                    self.stats['evictions'] += 1
+        return image
+
+    def invalidate(self, path: Union[str, Path]) -> None:
+        """Drop a background (e.g. after it was deleted)"""
+        with self._lock:
+            entry = self._entries.pop(str(path), None)
+            if entry is not None:
+                self._total_bytes -= entry[2].nbytes
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['backgrounds'] = len(self._entries)
+            stats['total_bytes'] = self._total_bytes
+        stats['max_bytes'] = self.max_bytes
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        return stats
+
+
+_decoded_backgrounds: Optional[DecodedBackgroundCache] = None
+_decoded_lock = threading.Lock()
+
+
+def get_decoded_backgrounds() -> DecodedBackgroundCache:
+    """Process-wide decoded background cache"""
+    global _decoded_backgrounds
+    with _decoded_lock:
+        if _decoded_backgrounds is None:
+            _decoded_backgrounds = DecodedBackgroundCache()
+        return _decoded_backgrounds
@@ -0,0 +1,127 @@
+"""
+Photobooth Compositing Benchmark
+
+Compares the float64 blending create_composite_photo used to do with the
+fixed-point NumPy and OpenCV paths in compositing.py, on 720p, 1080p and 4K
+backgrounds with a person-shaped cut-out: time per composite, throughput in
+blended megapixels per second, peak extra memory and the largest difference
+from exact rounding.
+
+Peak memory is measured with tracemalloc, which sees NumPy allocations but
+not OpenCV's own buffers; the OpenCV figure covers its NumPy-side scratch only.
+
+Usage:
+    python benchmark_compositing.py [--repeat 20]
+"""
+
+import sys
+import time
+import argparse
+import statistics
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, Tuple
+
+import numpy as np
+
+try:
+    from .compositing import blend_over, CV2_AVAILABLE
+except ImportError:
+    sys.path.append(str(Path(__file__).parent.parent))
+    from Photobooth.compositing import blend_over, CV2_AVAILABLE
+
+RESOLUTIONS = {
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+    '4K': (3840, 2160),
+}
+
+
+def make_images(width: int, height: int, seed: int = 0) -> Tuple[np.ndarray, np.ndarray, int, int]:
+    """A noisy opaque background and a cut-out with an elliptical soft-edged person mask"""
+    rng = np.random.default_rng(seed)
+    background = rng.integers(0, 256, (height, width, 4), dtype=np.uint8)
+    background[:, :, 3] = 255
+
+    u_h, u_w = int(height * 0.9), int(width * 0.4)
+    overlay = rng.integers(0, 256, (u_h, u_w, 4), dtype=np.uint8)
+    yy, xx = np.ogrid[:u_h, :u_w]
+    distance = ((yy - u_h * 0.6) / (u_h * 0.55)) ** 2 + ((xx - u_w / 2) / (u_w * 0.45)) ** 2
+    # Opaque inside, a soft ramp at the edge, transparent outside
+    overlay[:, :, 3] = np.clip((1.15 - distance) * 255 / 0.3, 0, 255).astype(np.uint8)
+    return background, overlay, width - u_w - 20, height - u_h
+
+
+def blend_float(background: np.ndarray, overlay: np.ndarray, x: int, y: int) -> np.ndarray:
+    """The float64 blending create_composite_photo used before compositing.py"""
+    u_h, u_w = overlay.shape[:2]
+    user_rgb = overlay[:, :, :3].astype(float)
+    user_alpha = (overlay[:, :, 3] / 255.0)[:, :, np.newaxis]
+    bg_roi = background[y:y + u_h, x:x + u_w, :3].astype(float)
+    blended = (user_alpha * user_rgb + (1 - user_alpha) * bg_roi).astype(np.uint8)
+    background[y:y + u_h, x:x + u_w, :3] = blended
+    return background
+
+
+def reference(background: np.ndarray, overlay: np.ndarray, x: int, y: int) -> np.ndarray:
+    """Exactly rounded blend, for accuracy"""
+    result = background.copy()
+    u_h, u_w = overlay.shape[:2]
+    alpha = overlay[:, :, 3:4].astype(np.int64)
+    total = overlay[:, :, :3] * alpha + background[y:y + u_h, x:x + u_w, :3] * (255 - alpha)
+    result[y:y + u_h, x:x + u_w, :3] = np.floor(total / 255 + 0.5).astype(np.uint8)
+    return result
+
+
+def measure(blend: Callable, width: int, height: int, repeat: int) -> Dict[str, float]:
+    background, overlay, x, y = make_images(width, height)
+    expected = reference(background, overlay, x, y)
+
+    timings = []
+    for _ in range(repeat):
+        target = background.copy()
+        start = time.perf_counter()
+        blend(target, overlay, x, y)
+        timings.append(time.perf_counter() - start)
+
+    target = background.copy()
+    tracemalloc.start()
+    blend(target, overlay, x, y)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    seconds = statistics.median(timings)
+    pixels = overlay.shape[0] * overlay.shape[1]
+    return {
+        'ms': seconds * 1000,
+        'mpx_per_s': pixels / seconds / 1e6,
+        'peak_mb': peak / 1024 / 1024,
+        'max_error': int(np.abs(target.astype(np.int16) - expected).max()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark photobooth alpha compositing")
+    parser.add_argument("--repeat", type=int, default=20, help="Composites per method and resolution")
+    args = parser.parse_args()
+
+    methods = {
+        'float64 (old)': blend_float,
+        'fixed numpy': lambda bg, ov, x, y: blend_over(bg, ov, x, y, method='numpy'),
+    }
+    if CV2_AVAILABLE:
+        methods['fixed opencv'] = lambda bg, ov, x, y: blend_over(bg, ov, x, y, method='opencv')
+
+    print("=" * 78)
+    print(f"{'background':12} {'method':15} {'ms':>9} {'MPx/s':>9} {'peak MB':>9} {'max error':>10}")
+    print("=" * 78)
+    for label, (width, height) in RESOLUTIONS.items():
+        for name, blend in methods.items():
+            result = measure(blend, width, height, args.repeat)
+            print(f"{label:12} {name:15} {result['ms']:>9.2f} {result['mpx_per_s']:>9.1f} "
+                  f"{result['peak_mb']:>9.2f} {result['max_error']:>10}")
+        print("-" * 78)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Background Removal Benchmark
+
+Compares the fast ONNX Runtime path (fast_matting.py) with the current
+remove_background output (rembg with isnet-general-use) on your photos:
+latency per photo, and how far each alpha mask is from rembg's
+(mean absolute alpha difference, 0-255, and IoU of the foreground).
+
+Each photo is scaled to 1080p first, the size webcam captures arrive at.
+
+Usage:
+    python benchmark_matting.py photo1.jpg photo2.jpg [--int8] [--threads 4]
+
+Without photos the photobooth avatar.jpg is used. Requires rembg (and the
+onnxruntime it installs).
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import cv2
+import numpy as np
+
+try:
+    from .fast_matting import FastMatting, MATTING_MODELS, DEFAULT_MODEL
+except ImportError:
+    sys.path.append(str(Path(__file__).parent.parent))
+    from Photobooth.fast_matting import FastMatting, MATTING_MODELS, DEFAULT_MODEL
+
+TARGET_EDGE = 1920
+
+
+def load_photo(path: str) -> np.ndarray:
+    image = cv2.imread(path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"Cannot read image: {path}")
+    scale = TARGET_EDGE / max(image.shape[:2])
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+    return cv2.resize(image, None, fx=scale, fy=scale, interpolation=interpolation)
+
+
+def time_call(func: Callable[[np.ndarray], np.ndarray], image: np.ndarray, repeat: int) -> Dict:
+    """Median milliseconds (after one warm-up call) and the last output's alpha"""
+    output = func(image)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = func(image)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {'ms': statistics.median(timings), 'alpha': output[:, :, 3]}
+
+
+def compare(alpha: np.ndarray, reference: np.ndarray) -> Dict[str, float]:
+    foreground, expected = alpha > 127, reference > 127
+    union = np.logical_or(foreground, expected).sum()
+    return {
+        'mae': float(np.abs(alpha.astype(np.int16) - reference).mean()),
+        'iou': float(np.logical_and(foreground, expected).sum() / union) if union else 1.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fast background removal against rembg")
+    parser.add_argument("photos", nargs="*", help="Photos of people (default: avatar.jpg)")
+    parser.add_argument("--models", nargs="+", default=[DEFAULT_MODEL, "u2net", "isnet-general-use"], choices=list(MATTING_MODELS),
+                        help="Networks for the fast path")
+    parser.add_argument("--int8", action="store_true", help="Also run the int8-quantized models")
+    parser.add_argument("--input-sizes", nargs="+", type=int, default=[None],
+                        help="Network input edges (models with dynamic axes only)")
+    parser.add_argument("--threads", type=int, default=None, help="ONNX Runtime intra-op threads")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per photo")
+    args = parser.parse_args()
+
+    photos = args.photos or [str(Path(__file__).parent / "avatar.jpg")]
+    images = [load_photo(path) for path in photos]
+
+    # The current path: remove_background with rembg, whatever PHOTOBOOTH_BG_REMOVAL says
+    os.environ["PHOTOBOOTH_BG_REMOVAL"] = "rembg"
+    try:
+        from .photobooth import remove_background, REMBG_AVAILABLE
+    except ImportError:
+        from Photobooth.photobooth import remove_background, REMBG_AVAILABLE
+    if not REMBG_AVAILABLE:
+        print("rembg is not installed: pip install rembg")
+        sys.exit(1)
+
+    configs: List[Dict] = []
+    for model_name in args.models:
+        for int8 in ([False, True] if args.int8 else [False]):
+            for input_size in args.input_sizes:
+                for refine in (True, False):
+                    configs.append({'model_name': model_name, 'int8': int8, 'input_size': input_size, 'refine': refine})
+
+    print(f"Photos: {len(images)} at {TARGET_EDGE}px, {args.repeat} timed runs each\n")
+    print("=" * 88)
+    print(f"{'method':44} {'ms':>9} {'speedup':>8} {'alpha MAE':>10} {'IoU':>7}")
+    print("=" * 88)
+
+    references = [time_call(lambda image: remove_background(image, method='auto'), image, args.repeat)
+                  for image in images]
+    reference_ms = statistics.mean(result['ms'] for result in references)
+    print(f"{'rembg (remove_background)':44} {reference_ms:>9.1f} {1:>7.1f}x {0:>10.2f} {1:>7.3f}")
+
+    for config in configs:
+        matting = FastMatting(threads=args.threads, **config)
+        results = [time_call(matting.remove_background, image, args.repeat) for image in images]
+        scores = [compare(result['alpha'], reference['alpha']) for result, reference in zip(results, references)]
+        ms = statistics.mean(result['ms'] for result in results)
+        label = (f"fast {config['model_name']}{' int8' if config['int8'] else ''} "
+                 f"{matting.input_size[0]}px{' refined' if config['refine'] else ''}")
+        print(f"{label[:44]:44} {ms:>9.1f} {reference_ms / ms:>7.1f}x "
+              f"{statistics.mean(s['mae'] for s in scores):>10.2f} {statistics.mean(s['iou'] for s in scores):>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
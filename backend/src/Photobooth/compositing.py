@@ -0,0 +1,125 @@
+"""
+Photobooth Alpha Compositing
+
+Blends a BGRA cut-out (the user with the background removed) onto a BGRA
+background in place, using integer arithmetic only:
+- Fixed-point "over" blending: each channel is (src * a + dst * (255 - a)),
+  i.e. the premultiplied foreground plus the attenuated background, divided
+  by 255 once with exact rounding - no float64 intermediates
+- Work is done in horizontal strips with reused uint16 buffers, so extra
+  memory stays a few MB however large the background is
+- Fully transparent strips of the cut-out are skipped
+- Optionally runs on OpenCV's vectorized (SIMD) multiply/add instead of NumPy
+
+The background's alpha channel is left as it is.
+
+Compare the methods with:
+    python benchmark_compositing.py
+"""
+
+import numpy as np
+
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+
+# Rows blended per strip; bounds the scratch buffers (about 2.5 MB for a 4K-wide strip)
+STRIP_ROWS = 128
+
+BLEND_METHODS = ('auto', 'numpy', 'opencv')
+
+
+def _blend_numpy(dst: np.ndarray, src: np.ndarray) -> None:
+    """Blend src (BGRA) over dst (BGRA view of the same size), writing into dst"""
+    h, w = src.shape[:2]
+    rows = min(STRIP_ROWS, h)
+    total = np.empty((rows, w, 3), dtype=np.uint16)
+    scratch = np.empty((rows, w, 3), dtype=np.uint16)
+    inverse = np.empty((rows, w, 1), dtype=np.uint8)
+
+    for r0 in range(0, h, rows):
+        r1 = min(r0 + rows, h)
+        n = r1 - r0
+        alpha = src[r0:r1, :, 3:4]
+        if not alpha.any():
+            continue
+        out, tmp, inv = total[:n], scratch[:n], inverse[:n]
+
+        # src * a + dst * (255 - a) <= 255 * 255, so uint16 cannot overflow
+        np.multiply(src[r0:r1, :, :3], alpha, out=out, dtype=np.uint16)
+        np.subtract(255, alpha, out=inv)
+        np.multiply(dst[r0:r1, :, :3], inv, out=tmp, dtype=np.uint16)
+        out += tmp
+
+        # Exact round(out / 255): (t + 128 + ((t + 128) >> 8)) >> 8
+        out += 128
+        np.right_shift(out, 8, out=tmp)
+        out += tmp
+        out >>= 8
+        np.copyto(dst[r0:r1, :, :3], out, casting='unsafe')
+
+
+def _blend_opencv(dst: np.ndarray, src: np.ndarray) -> None:
+    """OpenCV version of _blend_numpy (rounds the two products separately)"""
+    h, w = src.shape[:2]
+    rows = min(STRIP_ROWS, h)
+    zeros = np.zeros((rows, w), dtype=np.uint8)
+    full = np.full((rows, w), 255, dtype=np.uint8)
+    scale = 1.0 / 255
+
+    for r0 in range(0, h, rows):
+        r1 = min(r0 + rows, h)
+        n = r1 - r0
+        alpha = src[r0:r1, :, 3]
+        if not cv2.hasNonZero(alpha):
+            continue
+        inv = cv2.subtract(full[:n], alpha)
+        # Weight 0 for the cut-out's alpha and 255 for the background's keeps dst alpha
+        weights = cv2.merge((alpha, alpha, alpha, zeros[:n]))
+        inv_weights = cv2.merge((inv, inv, inv, full[:n]))
+
+        dst_strip = dst[r0:r1]
+        foreground = cv2.multiply(src[r0:r1], weights, scale=scale)
+        cv2.multiply(dst_strip, inv_weights, dst=dst_strip, scale=scale)
+        cv2.add(dst_strip, foreground, dst=dst_strip)
+
+
+def blend_over(background: np.ndarray, overlay: np.ndarray, x: int, y: int, method: str = 'auto') -> np.ndarray:
+    """
+    Alpha-blend a BGRA overlay onto a BGRA background in place
+
+    The overlay is clipped to the background.
+
+    Args:
+        background: uint8 BGRA image, modified in place
+        overlay: uint8 BGRA image (e.g. the user with background removed)
+        x, y: Position of the overlay's top-left corner
+        method: 'numpy', 'opencv', or 'auto' (OpenCV when installed)
+
+    Returns:
+        The background
+    """
+    if method not in BLEND_METHODS:
+        raise ValueError(f"Unknown blend method: {method} (use {', '.join(BLEND_METHODS)})")
+    if background.dtype != np.uint8 or overlay.dtype != np.uint8:
+        raise ValueError("Background and overlay must be uint8 images")
+    if background.ndim != 3 or background.shape[2] != 4 or overlay.ndim != 3 or overlay.shape[2] != 4:
+        raise ValueError("Background and overlay must have 4 channels (BGRA)")
+
+    bg_h, bg_w = background.shape[:2]
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + overlay.shape[1], bg_w), min(y + overlay.shape[0], bg_h)
+    if x1 <= x0 or y1 <= y0:
+        return background
+
+    dst = background[y0:y1, x0:x1]
+    src = overlay[y0 - y:y1 - y, x0 - x:x1 - x]
+    if method == 'opencv' and not CV2_AVAILABLE:
+        raise ValueError("OpenCV is not installed")
+    if method == 'opencv' or (method == 'auto' and CV2_AVAILABLE):
+        _blend_opencv(dst, src)
+    else:
+        _blend_numpy(dst, src)
+    return background
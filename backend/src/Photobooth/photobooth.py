@@ -16,6 +16,10 @@ import os
 import sys
 import base64
 import time
+import threading
+import asyncio
+import importlib.util
+from concurrent.futures import wait, FIRST_COMPLETED
 from pathlib import Path
 from typing import List, Tuple, Optional
 
@@ -58,43 +62,303 @@ except ImportError as e:
     print(f"[ERROR] Import error: {e}")
     print("Run: pip install google-genai pillow opencv-python numpy")
 
-# Optional: Background removal (rembg)
 try:
-    from rembg import remove, new_session
-    REMBG_AVAILABLE = True
-    print("[OK] Background removal (rembg) available")
+    from ..Common.gemini_clients import get_client, get_model
+    from ..Common.gemini_async import run_blocking, submit_blocking
+    from ..Common.image_prep import prepare_image
+    from ..Common.local_models import (
+        register_local_model, get_local_model, get_local_model_status, READY, UNAVAILABLE, FAILED
+    )
+except ImportError:
+    # Fallback for direct execution
+    sys.path.append(str(Path(__file__).parent.parent))
+    from Common.gemini_clients import get_client, get_model
+    from Common.gemini_async import run_blocking, submit_blocking
+    from Common.image_prep import prepare_image
+    from Common.local_models import (
+        register_local_model, get_local_model, get_local_model_status, READY, UNAVAILABLE, FAILED
+    )
+
+try:
+    from .compositing import blend_over
+    from .background_store import get_decoded_backgrounds
+    from .fast_matting import load_fast_matting
+except ImportError:
+    from Photobooth.compositing import blend_over
+    from Photobooth.background_store import get_decoded_backgrounds
+    from Photobooth.fast_matting import load_fast_matting
+
+# Optional: Background removal (rembg)
+# The model is loaded on first use or by a warmup after server startup, not at import
+REMBG_MODEL = "photobooth-rembg"
+
+
+def _load_rembg_session():
+    """Create the rembg session (isnet-general-use, or u2net if it cannot be loaded)"""
+    from rembg import new_session
     
-    # Pre-initialize sessions for better performance
     # 'isnet-general-use' is generally better for portraits/people than u2net
     try:
-        REMBG_SESSION = new_session("isnet-general-use")
+        session = new_session("isnet-general-use")
         print("[OK] Loaded high-quality background removal model (isnet-general-use)")
     except Exception as e:
         print(f"[WARN] Failed to load isnet-general-use model: {e}")
         print("[*] Falling back to default u2net model")
-        REMBG_SESSION = new_session("u2net")
-except ImportError:
-    REMBG_AVAILABLE = False
+        session = new_session("u2net")
+    return session
+
+
+REMBG_AVAILABLE = importlib.util.find_spec("rembg") is not None
+register_local_model(REMBG_MODEL, _load_rembg_session, requires="rembg")
+
+# Optimized CPU path on ONNX Runtime (see fast_matting.py); 'auto' uses it with PHOTOBOOTH_BG_REMOVAL=fast
+MATTING_MODEL = "photobooth-matting"
+register_local_model(MATTING_MODEL, load_fast_matting, requires="onnxruntime")
+
+
+def background_removal_model() -> str:
+    """Registry name of the model remove_background(method='auto') tries first"""
+    return MATTING_MODEL if os.getenv("PHOTOBOOTH_BG_REMOVAL", "rembg") == "fast" else REMBG_MODEL
+
+
+def background_removal_models() -> List[str]:
+    """Registry names remove_background(method='auto') tries, in order (then the simple method)"""
+    if background_removal_model() == MATTING_MODEL:
+        return [MATTING_MODEL, REMBG_MODEL]
+    return [REMBG_MODEL]
+
+
+def background_removal_status() -> dict:
+    """
+    Which model remove_background(method='auto') would use now, and whether it is loaded
+
+    Walks the fallback chain like remove_background: a model that is not
+    installed, or failed to load while another one follows, is skipped.
+
+    Returns:
+        Dictionary with ready, model (registry name, or None for the simple
+        method) and models (load state of every model in the chain)
+    """
+    names = background_removal_models()
+    models = get_local_model_status(names)
+    for i, name in enumerate(names):
+        state = models[name]['state']
+        if state == UNAVAILABLE or (state == FAILED and i < len(names) - 1):
+            continue
+        return {'ready': state == READY, 'model': name, 'models': models}
+    # Nothing installed: the simple method needs no model
+    return {'ready': True, 'model': None, 'models': models}
+if REMBG_AVAILABLE:
+    print("[OK] Background removal (rembg) available - model loads on first use")
+else:
     print("[WARN] rembg not installed - background removal will use simple method")
     print("      For better results: pip install rembg")
 
 
-def encode_image(image_path):
-    """Encode image to base64"""
-    with open(image_path, "rb") as f:
-        image_data = base64.b64encode(f.read()).decode()
+def encode_image(image_path, purpose='text'):
+    """
+    Encode image to base64, normalized for upload to the model
+    
+    The photo is oriented, downsized to the purpose's maximum edge and
+    stripped of metadata first (see Common.image_prep).
+    """
+    prepared = prepare_image(image_path, purpose=purpose)
+    image_data = base64.b64encode(prepared.data).decode()
+    
+    return image_data, prepared.mime_type
+
+
+# Couple's poses, one background each
+PHOTOBOOTH_POSES = [
+    {
+        "name": "romantic_cafe",
+        "prompt": """Create a romantic photobooth background showing this character sitting at a cozy café table with flowers, 
+with an empty chair next to them for their date. The character should be smiling warmly and gesturing welcomingly to the empty space. 
+Romantic lighting, soft bokeh background, café ambiance. The composition should have clear space on the right side for another person. 
+Photobooth style, high quality, warm tones."""
+    },
+    {
+        "name": "sunset_beach",
+        "prompt": """Create a romantic photobooth background showing this character standing on a beautiful sunset beach, 
+with their arm positioned as if around someone's shoulder (empty space for their date). Looking lovingly to the side with a warm smile. 
+Golden hour lighting, ocean waves, sandy beach. Clear space on the left side for another person. 
+Photobooth style, dreamy atmosphere, warm sunset colors."""
+    },
+    {
+        "name": "cozy_home",
+        "prompt": """Create a romantic photobooth background showing this character sitting on a cozy couch at home, 
+with space next to them for their date. They're holding what looks like they're offering something (hot chocolate or popcorn), 
+smiling warmly. Soft home lighting, fairy lights in background, comfortable living room setting. 
+Clear space on the right for another person. Photobooth style, cozy and intimate atmosphere."""
+    }
+]
+
+# Generations running at once, and how long to wait for one
+DEFAULT_BACKGROUND_WORKERS = 3
+DEFAULT_BACKGROUND_TIMEOUT = 90
+
+
+def describe_pose_background(client, avatar_data, avatar_mime, pose_info, cancelled=None):
+    """
+    Generate one pose background (default generator)
+    
+    Generators that save files or index entries must check `cancelled` (a
+    threading.Event set once the pose timed out or its caller went away)
+    before doing so; this one has no side effects.
+    
+    Returns:
+        tuple: (name, prompt, description)
+    """
+    response = client.models.generate_content(
+        model=get_model('text'),
+        contents=[
+            {"parts": [
+                {"inline_data": {"mime_type": avatar_mime, "data": avatar_data}},
+                {"text": pose_info['prompt']}
+            ]}
+        ]
+    )
+    
+    # Get description of what was generated
+    description = response.text if response.text else pose_info['name']
+    
+    # Note: For actual image generation, we'd need gemini-2.5-flash-image
+    # (see Photobooth/routes.py, which passes an image generator)
+    return (pose_info['name'], pose_info['prompt'], description)
+
+
+def _background_jobs(avatar, api_key, num_backgrounds, purpose):
+    """Shared setup: client, the avatar encoded once, and the poses to generate"""
+    if api_key is None:
+        api_key = os.getenv('GEMINI_API_KEY')
+        if not api_key:
+            raise ValueError("No API key provided. Set GEMINI_API_KEY environment variable or pass api_key parameter.")
+    
+    client = get_client(api_key, purpose=purpose)
+    avatar_data, avatar_mime = encode_image(avatar, purpose=purpose)
+    return client, avatar_data, avatar_mime, PHOTOBOOTH_POSES[:num_backgrounds]
+
+
+def iter_photobooth_backgrounds(avatar, api_key: str = None, num_backgrounds: int = 3,
+                                max_workers: int = DEFAULT_BACKGROUND_WORKERS,
+                                timeout: float = DEFAULT_BACKGROUND_TIMEOUT,
+                                generate=describe_pose_background, purpose: str = 'text'):
+    """
+    Generate pose backgrounds concurrently, yielding each as soon as it is done
+    
+    Generations run on the shared Gemini executor (GEMINI_MAX_WORKERS caps
+    them across all callers); max_workers only bounds this call's share.
+    
+    Args:
+        avatar: Avatar image path or bytes (encoded once for all poses)
+        api_key (str, optional): Gemini API key. If None, loads from environment.
+        num_backgrounds (int): Number of poses to generate
+        max_workers (int): Generations of this call running at the same time
+        timeout (float): Seconds to wait for each generation; a pose not
+            finished by then is reported as failed and its `cancelled` set
+        generate: Function (client, avatar_data, avatar_mime, pose_info, cancelled) -> result
+        purpose (str): Model purpose for the client and avatar upload size
+        
+    Yields:
+        tuple: (pose_info, result, error) in completion order; result is None
+        and error a message when a pose failed
+    """
+    client, avatar_data, avatar_mime, poses = _background_jobs(avatar, api_key, num_backgrounds, purpose)
+    pending = list(poses)
+    # future -> (pose_info, cancelled event, deadline)
+    running = {}
+    
+    def submit():
+        while pending and len(running) < max_workers:
+            pose_info = pending.pop(0)
+            cancelled = threading.Event()
+            future = submit_blocking(generate, client, avatar_data, avatar_mime, pose_info, cancelled)
+            running[future] = (pose_info, cancelled, time.monotonic() + timeout)
+    
+    def cancel(future):
+        pose_info, cancelled, _ = running.pop(future)
+        cancelled.set()
+        future.cancel()
+        return pose_info
+    
+    try:
+        submit()
+        while running:
+            next_deadline = min(deadline for _, _, deadline in running.values())
+            done, _ = wait(list(running), timeout=max(0.0, next_deadline - time.monotonic()),
+                           return_when=FIRST_COMPLETED)
+            for future in done:
+                pose_info = running.pop(future)[0]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    yield pose_info, None, str(e)
+                    continue
+                yield pose_info, result, None
+            now = time.monotonic()
+            for future in [f for f, (_, _, deadline) in running.items() if deadline <= now]:
+                yield cancel(future), None, f"Timed out after {timeout:g}s"
+            submit()
+    finally:
+        # Don't wait for stragglers; they see `cancelled` and discard their result
+        for future in list(running):
+            cancel(future)
+
+
+async def aiter_photobooth_backgrounds(avatar, api_key: str = None, num_backgrounds: int = 3,
+                                       max_workers: int = DEFAULT_BACKGROUND_WORKERS,
+                                       timeout: float = DEFAULT_BACKGROUND_TIMEOUT,
+                                       generate=describe_pose_background, purpose: str = 'text'):
+    """
+    Async version of iter_photobooth_backgrounds for request handlers
     
-    ext = Path(image_path).suffix.lower()
-    mime_map = {'.png': 'image/png', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.webp': 'image/webp'}
-    mime_type = mime_map.get(ext, 'image/jpeg')
+    Generations run on the shared Gemini executor, so the event loop stays
+    free and GEMINI_MAX_WORKERS holds across requests; a semaphore bounds
+    this request's fan-out to max_workers. Each pose gets its own timeout,
+    after which (or when the caller stops iterating) its `cancelled` event
+    is set. Yields (pose_info, result, error) in completion order.
+    """
+    loop = asyncio.get_running_loop()
+    client, avatar_data, avatar_mime, poses = await loop.run_in_executor(
+        None, _background_jobs, avatar, api_key, num_backgrounds, purpose
+    )
+    if not poses:
+        return
     
-    return image_data, mime_type
+    slots = asyncio.Semaphore(max_workers)
+    
+    async def run(pose_info):
+        cancelled = threading.Event()
+        async with slots:
+            try:
+                result = await asyncio.wait_for(
+                    run_blocking(generate, client, avatar_data, avatar_mime, pose_info, cancelled), timeout
+                )
+                return pose_info, result, None
+            except asyncio.TimeoutError:
+                return pose_info, None, f"Timed out after {timeout:g}s"
+            except Exception as e:
+                return pose_info, None, str(e)
+            finally:
+                # Set on timeout and cancellation (harmless once finished)
+                cancelled.set()
+    
+    tasks = [asyncio.ensure_future(run(pose_info)) for pose_info in poses]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # The client went away: drop poses still queued
+        for task in tasks:
+            task.cancel()
 
 
-def generate_photobooth_backgrounds(avatar_path: str, api_key: str = None, num_backgrounds: int = 3, verbose: bool = True) -> List[Tuple[Image.Image, str]]:
+def generate_photobooth_backgrounds(avatar_path: str, api_key: str = None, num_backgrounds: int = 3, verbose: bool = True) -> List[Tuple[str, str, str]]:
     """
     Generate photobooth backgrounds with avatar in couple's poses.
     
+    The poses are generated concurrently (see iter_photobooth_backgrounds).
+    
     Args:
         avatar_path (str): Path to avatar image
         api_key (str, optional): Gemini API key. If None, loads from environment.
@@ -102,98 +366,34 @@ def generate_photobooth_backgrounds(avatar_path: str, api_key: str = None, num_b
         verbose (bool): Whether to print progress messages
         
     Returns:
-        List[Tuple[PIL.Image, str]]: List of (image, description) tuples
+        List[Tuple[str, str, str]]: (name, prompt, description) per generated pose, in pose order
         
     Example:
         >>> backgrounds = generate_photobooth_backgrounds("avatar.jpg")
-        >>> for img, desc in backgrounds:
-        ...     img.save(f"background_{desc}.png")
+        >>> for name, prompt, description in backgrounds:
+        ...     print(name, description[:80])
     """
-    
-    # Load API key if not provided
-    if api_key is None:
-        api_key = os.getenv('GEMINI_API_KEY')
-        if not api_key:
-            raise ValueError("No API key provided. Set GEMINI_API_KEY environment variable or pass api_key parameter.")
-    
     if verbose:
         print("\n" + "="*70)
         print("[*] Photobooth Background Generation")
         print("="*70 + "\n")
+        print(f"[*] Generating {min(num_backgrounds, len(PHOTOBOOTH_POSES))} backgrounds in parallel "
+              f"(10-30 seconds)...")
     
-    # Initialize Gemini client
-    client = genai.Client(api_key=api_key)
-    
-    # Load avatar image
-    avatar_data, avatar_mime = encode_image(avatar_path)
-    
-    # Define couple's poses
-    poses = [
-        {
-            "name": "romantic_cafe",
-            "prompt": """Create a romantic photobooth background showing this character sitting at a cozy café table with flowers, 
-with an empty chair next to them for their date. The character should be smiling warmly and gesturing welcomingly to the empty space. 
-Romantic lighting, soft bokeh background, café ambiance. The composition should have clear space on the right side for another person. 
-Photobooth style, high quality, warm tones."""
-        },
-        {
-            "name": "sunset_beach",
-            "prompt": """Create a romantic photobooth background showing this character standing on a beautiful sunset beach, 
-with their arm positioned as if around someone's shoulder (empty space for their date). Looking lovingly to the side with a warm smile. 
-Golden hour lighting, ocean waves, sandy beach. Clear space on the left side for another person. 
-Photobooth style, dreamy atmosphere, warm sunset colors."""
-        },
-        {
-            "name": "cozy_home",
-            "prompt": """Create a romantic photobooth background showing this character sitting on a cozy couch at home, 
-with space next to them for their date. They're holding what looks like they're offering something (hot chocolate or popcorn), 
-smiling warmly. Soft home lighting, fairy lights in background, comfortable living room setting. 
-Clear space on the right for another person. Photobooth style, cozy and intimate atmosphere."""
-        }
-    ]
-    
-    # Generate only requested number of backgrounds
-    poses = poses[:num_backgrounds]
-    
-    backgrounds = []
-    
-    for i, pose_info in enumerate(poses, 1):
-        if verbose:
-            print(f"[{i}/{len(poses)}] Generating {pose_info['name']} background...")
-            print(f"         This may take 10-30 seconds...")
-        
-        try:
-            response = client.models.generate_content(
-                model="gemini-2.0-flash-exp",
-                contents=[
-                    {"parts": [
-                        {"inline_data": {"mime_type": avatar_mime, "data": avatar_data}},
-                        {"text": pose_info['prompt']}
-                    ]}
-                ]
-            )
-            
-            # Get description of what was generated
-            description = response.text if response.text else pose_info['name']
-            
+    backgrounds = {}
+    for pose_info, result, error in iter_photobooth_backgrounds(avatar_path, api_key, num_backgrounds):
+        if error:
             if verbose:
-                print(f"         [OK] Generated: {pose_info['name']}")
-            
-            # Note: For actual image generation, we'd need gemini-2.5-flash-image
-            # For now, we'll create a placeholder approach
-            # In production, you'd generate the actual backgrounds
-            
-            backgrounds.append((pose_info['name'], pose_info['prompt'], description))
-            
-        except Exception as e:
-            if verbose:
-                print(f"         [ERROR] Failed to generate {pose_info['name']}: {e}")
+                print(f"         [ERROR] Failed to generate {pose_info['name']}: {error}")
             continue
+        if verbose:
+            print(f"         [OK] Generated: {pose_info['name']}")
+        backgrounds[pose_info['name']] = result
     
     if verbose:
         print(f"\n[OK] Generated {len(backgrounds)} backgrounds")
     
-    return backgrounds
+    return [backgrounds[pose['name']] for pose in PHOTOBOOTH_POSES if pose['name'] in backgrounds]
 
 
 def remove_background(image: np.ndarray, method: str = 'auto') -> np.ndarray:
@@ -202,24 +402,33 @@ def remove_background(image: np.ndarray, method: str = 'auto') -> np.ndarray:
     
     Args:
         image (np.ndarray): Input image in BGR format (OpenCV)
-        method (str): 'auto' (use rembg if available), 'simple' (color-based), or 'none'
+        method (str): 'auto' (use rembg if available, or the fast path with
+            PHOTOBOOTH_BG_REMOVAL=fast), 'fast' (downscaled ONNX Runtime
+            inference, see fast_matting.py), 'simple' (color-based), or 'none'
         
     Returns:
         np.ndarray: Image with transparent background (BGRA format)
     """
     
+    if method == 'fast' or (method == 'auto' and background_removal_model() == MATTING_MODEL):
+        try:
+            return get_local_model(MATTING_MODEL).remove_background(image)
+        except Exception as e:
+            print(f"[MATTING ERROR] {e} - falling back to {'rembg' if method == 'auto' else 'simple method'}")
+            if method == 'fast':
+                method = 'simple'
+    
     if method == 'auto' and REMBG_AVAILABLE:
         try:
+            # Loaded once, on the first call unless warmed up already
+            session = get_local_model(REMBG_MODEL)
+            from rembg import remove
+            
             # Convert BGR to RGB for rembg
             image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
             pil_image = Image.fromarray(image_rgb)
             
-            # Remove background using pre-initialized session
-            # If session is available, use it, otherwise fall back to basic remove
-            if 'REMBG_SESSION' in globals():
-                result_pil = remove(pil_image, session=REMBG_SESSION)
-            else:
-                result_pil = remove(pil_image)
+            result_pil = remove(pil_image, session=session)
             
             # Convert back to OpenCV format (BGRA)
             result_rgb = np.array(result_pil)
@@ -378,21 +587,22 @@ def capture_webcam_photo(background_removal: bool = True, countdown_seconds: int
 
 
 def create_composite_photo(background_path: str, user_photo: np.ndarray, output_path: str, 
-                          user_position: str = 'right', user_scale: float = 1.0, verbose: bool = True) -> str:
+                          user_position: str = 'right', user_scale: float = 1.0, verbose: bool = True,
+                          blend_method: str = 'auto') -> str:
     """
     Create composite photo of user + background with avatar.
+    
+    Blending is fixed-point and in place (see compositing.blend_over);
+    blend_method picks 'numpy', 'opencv' or 'auto'.
     """
     if verbose:
         print(f"[*] Creating composite photo...")
     
-    # Load background
-    background = cv2.imread(background_path, cv2.IMREAD_UNCHANGED)
+    # Load background (decoded BGRA copy, cached across composites)
+    background = get_decoded_backgrounds().load(background_path)
     if background is None:
         raise ValueError(f"Failed to load background image from: {background_path}")
     
-    if background.shape[2] == 3:
-        background = cv2.cvtColor(background, cv2.COLOR_BGR2BGRA)
-    
     # Ensure user photo has 4 channels
     if user_photo.shape[2] == 3:
         user_photo = cv2.cvtColor(user_photo, cv2.COLOR_BGR2BGRA)
@@ -427,28 +637,14 @@ def create_composite_photo(background_path: str, user_photo: np.ndarray, output_
     if verbose:
         print(f"[DEBUG] Composite positions: x={x_offset}, y={y_offset}, size={u_w}x{u_h}")
     
-    # Vectorized alpha blending
+    # Fixed-point alpha blending, written into the background in place
     try:
-        # Extract channels
-        user_rgb = user_photo[:, :, :3].astype(float)
-        user_alpha = (user_photo[:, :, 3] / 255.0)[:, :, np.newaxis]
-        
-        # Get Roi dimensions
-        roi_h = min(u_h, bg_h - y_offset)
-        roi_w = min(u_w, bg_w - x_offset)
-        
         if verbose:
+            roi_h = min(u_h, bg_h - y_offset)
+            roi_w = min(u_w, bg_w - x_offset)
             print(f"[DEBUG] Final ROI: {roi_w}x{roi_h} at {x_offset},{y_offset}")
-            
-        bg_roi = background[y_offset:y_offset+roi_h, x_offset:x_offset+roi_w, :3].astype(float)
-        u_rgb_roi = user_rgb[:roi_h, :roi_w, :]
-        u_alpha_roi = user_alpha[:roi_h, :roi_w, :]
-        
-        # Blend
-        blended_roi = (u_alpha_roi * u_rgb_roi + (1 - u_alpha_roi) * bg_roi).astype(np.uint8)
         
-        # Place back
-        background[y_offset:y_offset+roi_h, x_offset:x_offset+roi_w, :3] = blended_roi
+        blend_over(background, user_photo, x_offset, y_offset, method=blend_method)
     except Exception as e:
         print(f"[ERROR] Blending failure: {e}")
         import traceback
@@ -4,28 +4,57 @@ FastAPI routes for Photobooth feature
 Provides endpoints for:
 - Generating photobooth backgrounds with avatar
 - Regenerating specific backgrounds
+- Generating all pose backgrounds concurrently, streamed as they complete
 - Compositing user photos with backgrounds
+- Reporting whether the background removal model is loaded
 """
 
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Query
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
 from pathlib import Path
 import os
+import json
 import base64
+import hashlib
 import tempfile
+import io
+import asyncio
+import functools
 import time
-from typing import List
+from typing import List, Optional
 import sys
 
 # Add parent directory to path for imports
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+try:
+    from ..Common.gemini_async import generate_content_async
+    from ..Common.gemini_clients import get_client, get_model
+    from ..Common.image_prep import prepare_image
+    from ..Common.local_models import warmup_local_models
+except ImportError:
+    from Common.gemini_async import generate_content_async
+    from Common.gemini_clients import get_client, get_model
+    from Common.image_prep import prepare_image
+    from Common.local_models import warmup_local_models
+
+try:
+    from .background_cache import BackgroundCache, background_key
+    from .background_store import BackgroundFileIndex, get_decoded_backgrounds
+except ImportError:
+    from Photobooth.background_cache import BackgroundCache, background_key
+    from Photobooth.background_store import BackgroundFileIndex, get_decoded_backgrounds
+
 try:
     # Use full path for robust importing regardless of working directory
     from src.Photobooth.photobooth import (
         generate_photobooth_backgrounds,
+        aiter_photobooth_backgrounds,
         create_composite_photo,
-        remove_background
+        remove_background,
+        PHOTOBOOTH_POSES,
+        background_removal_models,
+        background_removal_status
     )
     import cv2
     import numpy as np
@@ -34,7 +63,11 @@ except ImportError as e:
     print(f"Warning: Photobooth module imports failed: {e}")
     # Try alternative relative import if above fails
     try:
-        from .photobooth import generate_photobooth_backgrounds, create_composite_photo, remove_background
+        from .photobooth import (
+            generate_photobooth_backgrounds, aiter_photobooth_backgrounds,
+            create_composite_photo, remove_background, PHOTOBOOTH_POSES,
+            background_removal_models, background_removal_status
+        )
         import cv2
         import numpy as np
         PHOTOBOOTH_AVAILABLE = True
@@ -44,39 +77,192 @@ except ImportError as e:
 
 router = APIRouter(prefix="/api/photobooth", tags=["Photobooth"])
 
+BACKGROUNDS_DIR = Path(__file__).parent / "temp_backgrounds"
+
+# Appended to every scene prompt sent to the image model
+BACKGROUND_REQUIREMENTS = """- IMPORTANT: The avatar person MUST be positioned on the LEFT side of the composition.
+- IMPORTANT: Leave the RIGHT side of the scene empty/open for another person to be added later.
+- Create a couple's photobooth aesthetic - romantic, cute, fun.
+- The scene should look like a real high-end photobooth background with professional lighting.
+- Resolution: 1280x720 pixels (landscape).
+- High quality, photorealistic style.
+- The avatar should look like they are waiting for their partner to join them in the photo."""
+
+
+def _response_image(response):
+    """Extract the generated image from a Gemini response as a PIL image"""
+    result_image = None
+    for part in response.parts:
+        if part.inline_data:
+            result_image = part.as_image()
+            break
+    
+    if not result_image:
+        raise Exception("No image in response from Gemini")
+    
+    # Convert to PIL Image
+    if hasattr(result_image, '_pil_image'):
+        return result_image._pil_image
+    return result_image
+
+
+def _save_background(bg_img, bg_id: str, name: str) -> dict:
+    """Save a generated background and describe it for the frontend"""
+    BACKGROUNDS_DIR.mkdir(exist_ok=True)
+    bg_filename = f"{bg_id}_{name}.png"
+    bg_img.save(BACKGROUNDS_DIR / bg_filename)
+    get_background_index().add(bg_filename)
+    return {
+        "id": bg_id,
+        "name": name.replace("_", " ").title(),
+        "url": f"/api/photobooth/backgrounds/{bg_filename}"
+    }
+
+
+def _generate_pose_image(client, avatar_data, avatar_mime, pose_info, cancelled=None):
+    """
+    Generate and save the background image for one pose (runs on a worker thread)
+    
+    Nothing is saved if the pose was given up on (timed out, or the client
+    left) while the model was working, so no orphan background is listed.
+    """
+    prompt = f"""{pose_info['prompt']}
+
+Requirements:
+- The person from the provided image (the avatar) should be naturally integrated into the scene.
+{BACKGROUND_REQUIREMENTS}"""
+    
+    response = client.models.generate_content(
+        model=get_model('image'),
+        contents=[
+            {"parts": [
+                {"inline_data": {"mime_type": avatar_mime, "data": avatar_data}},
+                {"text": prompt}
+            ]}
+        ]
+    )
+    if cancelled is not None and cancelled.is_set():
+        print(f"[*] Discarding {pose_info['name']} background finished after its request gave up")
+        return None
+    bg_id = hashlib.md5(f"{pose_info['name']}{time.time()}".encode()).hexdigest()[:8]
+    return _save_background(_response_image(response), bg_id, pose_info['name'])
+
+
+_background_index = None
+_background_cache = None
+
+
+def get_background_index() -> BackgroundFileIndex:
+    """Index of the background files (scanned on first use, then updated on every write)"""
+    global _background_index
+    if _background_index is None:
+        _background_index = BackgroundFileIndex(BACKGROUNDS_DIR)
+    return _background_index
+
+
+def _forget_background(filename: str) -> None:
+    get_background_index().remove(filename)
+    get_decoded_backgrounds().invalidate(BACKGROUNDS_DIR / filename)
+
+
+def get_background_cache() -> BackgroundCache:
+    """Cache of generated scene backgrounds (created on first use)"""
+    global _background_cache
+    if _background_cache is None:
+        _background_cache = BackgroundCache(BACKGROUNDS_DIR, on_evict=_forget_background)
+    return _background_cache
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.on_event("startup")
+async def warmup_background_removal():
+    """Load the background removal model in the background once the server is up (its fallback if it cannot load)"""
+    if PHOTOBOOTH_AVAILABLE and os.getenv("PHOTOBOOTH_WARMUP", "1") != "0":
+        warmup_local_models(background_removal_models(), first_available=True)
+
+
+@router.on_event("shutdown")
+def flush_background_cache():
+    """Write the background cache's pending last_used updates"""
+    if _background_cache is not None:
+        _background_cache.flush()
+
+
+@router.get("/ready")
+async def photobooth_ready():
+    """
+    Report whether background removal is ready to use
+    
+    Follows remove_background's fallback chain (with PHOTOBOOTH_BG_REMOVAL=fast:
+    the fast ONNX Runtime model, then rembg, then the simple method). Returns
+    200 when the model that would be used is loaded, or when none is installed
+    so the simple method is used; 503 while that model is not loaded yet or
+    still loading, or when the last model of the chain failed to load.
+    `model` names the model in use (null for the simple method).
+    
+    **Response:**
+    ```json
+    {
+        "ready": true,
+        "model": "photobooth-rembg",
+        "models": {"photobooth-rembg": {"state": "ready", "error": null, "load_seconds": 3.2, "loaded_at": 1700000000.0}}
+    }
+    ```
+    """
+    if not PHOTOBOOTH_AVAILABLE:
+        return JSONResponse(status_code=503, content={"ready": False, "models": {}, "error": "Photobooth module not available"})
+    
+    status = background_removal_status()
+    return JSONResponse(status_code=200 if status['ready'] else 503, content=status)
+
 
 @router.post("/generate-background")
 async def generate_single_background(
     description: str = Form(..., description="User's description of the background scene"),
     pose: str = Form("", description="User's description of the avatar's pose"),
-    avatar: UploadFile = File(..., description="Avatar image file")
+    avatar: UploadFile = File(..., description="Avatar image file"),
+    force_regenerate: bool = Form(False, description="Generate a new variation even if this scene is cached")
 ):
     """
     Generate a single photobooth background with avatar based on user description and pose
     
+    The same avatar, description and pose (ignoring case and spacing) return
+    the cached background instead of generating a new one, unless
+    `force_regenerate` is set; the new variation then becomes the cached one.
+    
     Args:
         description: User's description of the background scene
         avatar: Avatar image file
+        force_regenerate: Skip the cache lookup
         
     Returns:
-        Background image URL
+        Background image URL, and whether it came from the cache
     """
     try:
         print(f"[DEBUG] Received request - description: {description}, avatar: {avatar.filename}")
         
-        # Save uploaded avatar temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp_avatar:
-            content = await avatar.read()
-            temp_avatar.write(content)
-            avatar_path = temp_avatar.name
-        
-        from PIL import Image
-        import hashlib
-        import google.genai as genai
-        import base64
+        content = await avatar.read()
         
-        output_dir = Path(__file__).parent / "temp_backgrounds"
-        output_dir.mkdir(exist_ok=True)
+        # The cache reads and writes its index and files: keep it off the event loop
+        loop = asyncio.get_running_loop()
+        cache = await loop.run_in_executor(None, get_background_cache)
+        cache_key = background_key(content, description, pose, get_model('image'))
+        if not force_regenerate:
+            cached = await loop.run_in_executor(None, cache.get, cache_key)
+            if cached:
+                print(f"[OK] Cached background: {cached['filename']}")
+                return {
+                    "success": True,
+                    "cached": True,
+                    "background": {
+                        "id": cached['filename'].split('_', 1)[0],
+                        "name": description,
+                        "url": f"/api/photobooth/backgrounds/{cached['filename']}"
+                    }
+                }
         
         # Create a unique ID for this background
         bg_id = hashlib.md5(f"{description}{time.time()}".encode()).hexdigest()[:8]
@@ -88,18 +274,14 @@ async def generate_single_background(
         
         print(f"[*] Generating AI photobooth background...")
         
-        # Initialize Gemini client
-        client = genai.Client(api_key=api_key)
-        
-        # Load and encode avatar image
-        avatar_img = Image.open(avatar_path)
+        # Shared Gemini client (connection pool reused across requests)
+        client = get_client(api_key, purpose='image')
         
-        # Convert avatar to base64
-        from io import BytesIO
-        buffer = BytesIO()
-        avatar_img.save(buffer, format='PNG')
-        avatar_data = base64.b64encode(buffer.getvalue()).decode('utf-8')
-        avatar_mime = 'image/png'
+        # Normalize the avatar for upload (oriented, downsized, metadata stripped)
+        prepared = prepare_image(content, purpose='image')
+        avatar_data = base64.b64encode(prepared.data).decode('utf-8')
+        avatar_mime = prepared.mime_type
+        print(f"[*] Avatar upload: {len(prepared.data) // 1024} KB ({prepared.bytes_saved // 1024} KB saved)")
         
         # Create prompt for photobooth background
         pose_prompt = f"The avatar should be {pose}." if pose else "The avatar should be naturally integrated into the scene, posing for a photo."
@@ -109,19 +291,14 @@ async def generate_single_background(
 Requirements:
 - The person from the provided image (the avatar) should be naturally integrated into the scene.
 - {pose_prompt}
-- IMPORTANT: The avatar person MUST be positioned on the LEFT side of the composition.
-- IMPORTANT: Leave the RIGHT side of the scene empty/open for another person to be added later.
-- Create a couple's photobooth aesthetic - romantic, cute, fun.
-- The scene should look like a real high-end photobooth background with professional lighting.
-- Resolution: 1280x720 pixels (landscape).
-- High quality, photorealistic style.
-- The avatar should look like they are waiting for their partner to join them in the photo.
+{BACKGROUND_REQUIREMENTS}
 
 Scene description: {description}"""
         
-        # Generate image using Gemini
-        response = client.models.generate_content(
-            model="gemini-2.5-flash-image",
+        # Generate image using Gemini (async so other requests keep being served)
+        response = await generate_content_async(
+            client,
+            model=get_model('image'),
             contents=[
                 {"parts": [
                     {"inline_data": {"mime_type": avatar_mime, "data": avatar_data}},
@@ -130,34 +307,20 @@ Scene description: {description}"""
             ]
         )
         
-        # Extract result image
-        result_image = None
-        for part in response.parts:
-            if part.inline_data:
-                result_image = part.as_image()
-                break
-        
-        if not result_image:
-            raise Exception("No image in response from Gemini")
-        
-        # Convert to PIL Image
-        if hasattr(result_image, '_pil_image'):
-            bg_img = result_image._pil_image
-        else:
-            bg_img = result_image
-        
-        # Save background
+        # Extract result image and store it in the cache
+        buffer = io.BytesIO()
+        _response_image(response).save(buffer, format='PNG')
         bg_filename = f"{bg_id}_ai_scene.png"
-        bg_path = output_dir / bg_filename
-        bg_img.save(bg_path)
+        await loop.run_in_executor(
+            None, functools.partial(cache.put, cache_key, bg_filename, buffer.getvalue(), description=description, pose=pose)
+        )
+        get_background_index().add(bg_filename)
         
         print(f"[OK] Generated background: {bg_filename}")
         
-        # Cleanup
-        os.unlink(avatar_path)
-        
         return {
             "success": True,
+            "cached": False,
             "background": {
                 "id": bg_id,
                 "name": description,
@@ -171,6 +334,74 @@ Scene description: {description}"""
         raise HTTPException(status_code=500, detail=f"Failed to generate background: {str(e)}")
 
 
+@router.post("/generate-backgrounds/stream")
+async def generate_backgrounds_stream(
+    avatar: UploadFile = File(..., description="Avatar image file"),
+    num_backgrounds: int = Form(3, ge=1, le=3, description="Number of pose backgrounds to generate"),
+    timeout: float = Form(90, ge=10, le=300, description="Seconds to wait for each background")
+):
+    """
+    Generate the couple's pose backgrounds concurrently and stream each as it completes
+    
+    The avatar is prepared for upload once and shared by every pose. All
+    poses are generated at the same time, so the wait is that of the slowest
+    background instead of the sum of all of them; a pose that takes longer
+    than `timeout` is reported as failed.
+    
+    The response is a Server-Sent Events stream (`text/event-stream`), one
+    `background` event per pose in completion order, then a `done` event.
+    
+    **Background event:**
+    ```
+    event: background
+    data: {"index": 0, "name": "romantic_cafe", "background": {"id": "...", "name": "Romantic Cafe", "url": "/api/photobooth/backgrounds/..."}, "error": null}
+    ```
+    
+    **Done event:**
+    ```
+    event: done
+    data: {"total": 3, "failed": 0}
+    ```
+    """
+    if not PHOTOBOOTH_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Photobooth module not available")
+    
+    api_key = os.getenv('GEMINI_API_KEY')
+    if not api_key:
+        raise HTTPException(status_code=500, detail="GEMINI_API_KEY not set")
+    
+    try:
+        # Rejected before the stream starts; the prepared bytes then pass through unchanged
+        prepared = prepare_image(await avatar.read(), purpose='image')
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    pose_index = {pose['name']: index for index, pose in enumerate(PHOTOBOOTH_POSES)}
+    
+    async def stream():
+        failed = 0
+        async for pose_info, background, error in aiter_photobooth_backgrounds(
+            prepared.data, api_key, num_backgrounds, timeout=timeout,
+            generate=_generate_pose_image, purpose='image'
+        ):
+            if error:
+                failed += 1
+                print(f"[ERROR] Failed to generate {pose_info['name']}: {error}")
+            yield _sse("background", {
+                "index": pose_index[pose_info['name']],
+                "name": pose_info['name'],
+                "background": background,
+                "error": f"Failed to generate background: {error}" if error else None
+            })
+        
+        yield _sse("done", {"total": num_backgrounds, "failed": failed})
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.post("/regenerate-background/{background_index}")
 async def regenerate_background(background_index: int, avatar: UploadFile = File(...)):
     """
@@ -231,6 +462,7 @@ async def regenerate_background(background_index: int, avatar: UploadFile = File
         
         bg_path = output_dir / f"background_{background_index+1}_{name}.png"
         bg.save(bg_path)
+        get_background_index().add(bg_path.name)
         
         os.unlink(avatar_path)
         
@@ -247,6 +479,23 @@ async def regenerate_background(background_index: int, avatar: UploadFile = File
         raise HTTPException(status_code=500, detail=f"Failed to regenerate background: {str(e)}")
 
 
+@router.get("/cache/stats")
+async def get_background_cache_stats():
+    """
+    Get background cache statistics: generated backgrounds (hits, misses,
+    evictions, size against the quota), decoded backgrounds kept in memory
+    for compositing, and the number of indexed background files
+    """
+    def collect():
+        return {
+            "success": True,
+            "backgrounds": get_background_cache().get_stats(),
+            "decoded": get_decoded_backgrounds().get_stats(),
+            "files": len(get_background_index())
+        }
+    return await asyncio.get_running_loop().run_in_executor(None, collect)
+
+
 @router.get("/backgrounds/{filename}")
 async def get_background_image(filename: str):
     """
@@ -279,8 +528,8 @@ async def remove_bg(image: UploadFile = File(...)):
         nparr = np.frombuffer(content, np.uint8)
         img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         
-        # Remove background
-        img_no_bg = remove_background(img, method='auto')
+        # Remove background (off the event loop; the first call may still be loading the model)
+        img_no_bg = await asyncio.get_running_loop().run_in_executor(None, remove_background, img, 'auto')
         
         # Encode to PNG with transparency
         _, buffer = cv2.imencode('.png', img_no_bg)
@@ -337,22 +586,13 @@ async def create_composite(
         print(f"[DEBUG] Raw URL: {background_url}")
         print(f"[DEBUG] Extracted filename: {filename}")
         
-        output_dir = Path(__file__).parent / "temp_backgrounds"
-        bg_path = output_dir / filename
-        
-        # Fallback: if filename doesn't exist, try to find a match in the directory
-        if not bg_path.exists():
-            print(f"[DEBUG] Exact path not found, searching in {output_dir}")
-            for existing_file in output_dir.glob("*"):
-                if existing_file.name in filename or filename in existing_file.name:
-                    bg_path = existing_file
-                    print(f"[DEBUG] Found potential match: {bg_path.name}")
-                    break
+        # Indexed lookup (also maps served names like 1_romantic_cafe.png to their file)
+        bg_path = get_background_index().resolve(filename)
         
         print(f"[DEBUG] Using background path: {bg_path}")
         
-        if not bg_path.exists():
-            print(f"[ERROR] Background file not found: {bg_path}")
+        if bg_path is None:
+            print(f"[ERROR] Background file not found: {filename}")
             raise HTTPException(status_code=404, detail=f"Background not found: {filename}")
         
         # Create composite
@@ -407,23 +647,17 @@ async def create_composite(
 
 
 @router.get("/saved-backgrounds")
-async def list_saved_backgrounds():
+async def list_saved_backgrounds(limit: Optional[int] = Query(None, ge=1, description="Return only the newest backgrounds")):
     """
-    List all generated backgrounds in the temp directory
+    List all generated backgrounds in the temp directory, newest first
     """
-    output_dir = Path(__file__).parent / "temp_backgrounds"
-    if not output_dir.exists():
-        return {"success": True, "backgrounds": []}
-    
     backgrounds = []
-    # Sort files by modification time (newest first)
-    files = sorted(output_dir.glob("*.png"), key=os.path.getmtime, reverse=True)
-    
-    for bg_file in files:
+    for filename in get_background_index().newest(limit):
+        stem = Path(filename).stem
         backgrounds.append({
-            "id": bg_file.stem,
-            "url": f"/api/photobooth/backgrounds/{bg_file.name}",
-            "name": bg_file.stem.replace("_", " ").title()
+            "id": stem,
+            "url": f"/api/photobooth/backgrounds/{filename}",
+            "name": stem.replace("_", " ").title()
         })
     
     return {"success": True, "backgrounds": backgrounds}
@@ -0,0 +1,312 @@
+"""
+Garment Description Cache
+
+Describing a garment costs a Gemini vision call, and the same wardrobe item
+is tried on again and again. Descriptions are stored in a local SQLite file
+keyed by the clothing image:
+- Exact match on the SHA-256 of the image bytes
+- Image URLs (e.g. wardrobe uploads) are mapped to their content hash, so a
+  description precomputed for a URL is not fetched and analyzed again
+- Optionally (near_match=True or GARMENT_NEAR_MATCH=1) a near match, so a
+  re-encoded or resized copy of the same photo finds the description too: a
+  64-bit difference hash (dHash) at most 2 bits apart and an almost identical
+  color histogram. Off by default: catalog shots of different garments of
+  the same cut (a black and a navy tee, a plain and a striped one) hash
+  alike, and a wrong description ends up in the try-on prompt
+
+Example:
+    cache = GarmentDescriptionCache()
+    description = cache.get(clothing_bytes)
+    if description is None:
+        description = analyze(clothing_bytes)
+        cache.set(clothing_bytes, description)
+"""
+
+import io
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from array import array
+from typing import Dict, Optional, Any, Tuple
+
+from PIL import Image
+
+DEFAULT_DB_PATH = Path(__file__).parent / "garment_descriptions.sqlite3"
+
+# Near matching (opt-in): differing dHash bits still treated as the same photo (out of 64)
+DEFAULT_MAX_DISTANCE = 2
+# Maximum difference of any average color channel (0-255), a cheap prefilter
+DEFAULT_MAX_COLOR_DELTA = 8
+# Maximum L1 distance between normalized color histograms (0-2)
+DEFAULT_MAX_HISTOGRAM_DELTA = 0.03
+
+# Color histogram: levels per RGB channel (8 -> 512 bins) over a 32x32 thumbnail
+_HISTOGRAM_LEVELS = 8
+_HISTOGRAM_SIZE = 32
+
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 of the image bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def image_fingerprint(data: bytes) -> Tuple[int, Tuple[int, int, int], array]:
+    """
+    Perceptual fingerprint of an image
+
+    Returns:
+        Tuple of (64-bit dHash, average RGB color, color histogram as pixel
+        counts per bin)
+
+    Raises:
+        ValueError: If the bytes are not a readable image
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            # JPEG can decode at reduced size, which is all the fingerprint needs
+            img.draft('RGB', (_HISTOGRAM_SIZE, _HISTOGRAM_SIZE))
+            if img.mode in ('RGBA', 'LA', 'P'):
+                # Transparent (background-removed) garments are hashed on white
+                rgba = img.convert('RGBA')
+                img = Image.new('RGB', rgba.size, (255, 255, 255))
+                img.paste(rgba, mask=rgba.getchannel('A'))
+            else:
+                img = img.convert('RGB')
+    except Exception as e:
+        raise ValueError("Unsupported image data: not a readable image file") from e
+
+    pixels = list(img.convert('L').resize((9, 8), Image.LANCZOS).getdata())
+    dhash = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            dhash = (dhash << 1) | (left > right)
+
+    color = img.resize((1, 1), Image.BOX).getpixel((0, 0))
+
+    shift = 8 - (_HISTOGRAM_LEVELS - 1).bit_length()
+    histogram = array('H', bytes(2 * _HISTOGRAM_LEVELS ** 3))
+    for r, g, b in img.resize((_HISTOGRAM_SIZE, _HISTOGRAM_SIZE), Image.BOX).getdata():
+        histogram[((r >> shift) * _HISTOGRAM_LEVELS + (g >> shift)) * _HISTOGRAM_LEVELS + (b >> shift)] += 1
+    return dhash, tuple(color), histogram
+
+
+def histogram_distance(a: array, b: array) -> float:
+    """L1 distance between two color histograms, normalized to 0-2"""
+    total = _HISTOGRAM_SIZE * _HISTOGRAM_SIZE
+    return sum(abs(x - y) for x, y in zip(a, b)) / total
+
+
+class GarmentDescriptionCache:
+    """Thread-safe SQLite store of garment descriptions keyed by image hash"""
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        near_match: Optional[bool] = None,
+        max_distance: int = DEFAULT_MAX_DISTANCE,
+        max_color_delta: int = DEFAULT_MAX_COLOR_DELTA,
+        max_histogram_delta: float = DEFAULT_MAX_HISTOGRAM_DELTA
+    ):
+        """
+        Initialize the cache
+
+        Args:
+            db_path: SQLite file (defaults to GARMENT_CACHE_PATH or the module directory,
+                     ":memory:" for a process-local cache)
+            near_match: Also match re-encoded/resized copies of a stored image
+                        (defaults to GARMENT_NEAR_MATCH=1, off otherwise)
+            max_distance: dHash bits that may differ for a near match
+            max_color_delta: Maximum average color difference per channel for a near match
+            max_histogram_delta: Maximum color histogram distance (0-2) for a near match
+        """
+        self.db_path = str(db_path or os.getenv("GARMENT_CACHE_PATH") or DEFAULT_DB_PATH)
+        if near_match is None:
+            near_match = os.getenv("GARMENT_NEAR_MATCH", "0") == "1"
+        self.near_match = near_match
+        self.max_distance = max_distance
+        self.max_color_delta = max_color_delta
+        self.max_histogram_delta = max_histogram_delta
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'near_hits': 0, 'misses': 0, 'writes': 0}
+
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS garments (
+                sha256 TEXT PRIMARY KEY,
+                dhash TEXT NOT NULL,
+                red INTEGER NOT NULL,
+                green INTEGER NOT NULL,
+                blue INTEGER NOT NULL,
+                description TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                uses INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS garment_urls (
+                url TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL
+            );
+        """)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(garments)")]
+        if 'histogram' not in columns:
+            # Garments stored before histograms were kept only match exactly
+            self._conn.execute("ALTER TABLE garments ADD COLUMN histogram BLOB")
+        self._conn.commit()
+
+        # Fingerprints are kept in memory so near matching is a linear scan
+        self._fingerprints: Dict[str, Tuple[int, Tuple[int, int, int], Optional[array]]] = {
+            sha: (int(dhash, 16), (red, green, blue), array('H', histogram) if histogram else None)
+            for sha, dhash, red, green, blue, histogram in self._conn.execute(
+                "SELECT sha256, dhash, red, green, blue, histogram FROM garments"
+            )
+        }
+
+    # ==================== LOOKUP ====================
+
+    def _find(self, data: bytes) -> Optional[str]:
+        """Key of the stored garment matching the image, or None"""
+        sha = content_hash(data)
+        if sha in self._fingerprints:
+            return sha
+        if not self.near_match or not self._fingerprints:
+            return None
+
+        try:
+            dhash, color, histogram = image_fingerprint(data)
+        except ValueError:
+            return None
+        best, best_distance = None, (self.max_distance + 1, 0.0)
+        for key, (other_hash, other_color, other_histogram) in self._fingerprints.items():
+            bits = (dhash ^ other_hash).bit_count()
+            if bits > self.max_distance or other_histogram is None:
+                continue
+            if any(abs(a - b) > self.max_color_delta for a, b in zip(color, other_color)):
+                continue
+            delta = histogram_distance(histogram, other_histogram)
+            if delta <= self.max_histogram_delta and (bits, delta) < best_distance:
+                best, best_distance = key, (bits, delta)
+        return best
+
+    def get(self, data: bytes) -> Optional[str]:
+        """
+        Get the description of a clothing image
+
+        Args:
+            data: Image bytes
+
+        Returns:
+            The stored description, or None if the garment is unknown
+        """
+        with self._lock:
+            key = self._find(data)
+            if key is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['hits' if key == content_hash(data) else 'near_hits'] += 1
+            row = self._conn.execute(
+                "SELECT description FROM garments WHERE sha256 = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                "UPDATE garments SET last_used = ?, uses = uses + 1 WHERE sha256 = ?", (time.time(), key)
+            )
+            self._conn.commit()
+        return row[0] if row else None
+
+    def contains(self, data: bytes) -> bool:
+        """Check for a stored description without counting a hit or miss"""
+        with self._lock:
+            return self._find(data) is not None
+
+    def add_url(self, url: str, data: bytes) -> bool:
+        """
+        Remember the URL of an image whose garment is already stored
+
+        Returns:
+            True if a stored garment matched and the URL was recorded
+        """
+        with self._lock:
+            key = self._find(data)
+            if key is None:
+                return False
+            self._conn.execute("INSERT OR REPLACE INTO garment_urls (url, sha256) VALUES (?, ?)", (url, key))
+            self._conn.commit()
+        return True
+
+    def get_by_url(self, url: str) -> Optional[str]:
+        """Get the description stored for an image URL, or None"""
+        with self._lock:
+            row = self._conn.execute("""
+                SELECT g.description FROM garment_urls u JOIN garments g ON g.sha256 = u.sha256
+                WHERE u.url = ?
+            """, (url,)).fetchone()
+        return row[0] if row else None
+
+    # ==================== WRITES ====================
+
+    def set(self, data: bytes, description: str, url: Optional[str] = None) -> None:
+        """
+        Store the description of a clothing image
+
+        Args:
+            data: Image bytes
+            description: Garment description
+            url: Where the image was fetched from (optional)
+        """
+        sha = content_hash(data)
+        dhash, color, histogram = image_fingerprint(data)
+        now = time.time()
+
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO garments (sha256, dhash, red, green, blue, histogram, description, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(sha256) DO UPDATE SET
+                    description = excluded.description,
+                    histogram = excluded.histogram,
+                    last_used = excluded.last_used
+            """, (sha, f"{dhash:016x}", *color, histogram.tobytes(), description, now, now))
+            if url:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO garment_urls (url, sha256) VALUES (?, ?)", (url, sha)
+                )
+            self._conn.commit()
+            self._fingerprints[sha] = (dhash, color, histogram)
+            self.stats['writes'] += 1
+
+    def purge_unused(self, max_age_seconds: float) -> int:
+        """Remove descriptions not used for max_age_seconds, returning the number removed"""
+        cutoff = time.time() - max_age_seconds
+        with self._lock:
+            stale = [row[0] for row in self._conn.execute(
+                "SELECT sha256 FROM garments WHERE last_used < ?", (cutoff,)
+            )]
+            self._conn.executemany("DELETE FROM garments WHERE sha256 = ?", [(sha,) for sha in stale])
+            self._conn.executemany("DELETE FROM garment_urls WHERE sha256 = ?", [(sha,) for sha in stale])
+            self._conn.commit()
+            for sha in stale:
+                self._fingerprints.pop(sha, None)
+        return len(stale)
+
+    # ==================== STATS ====================
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['garments'] = len(self._fingerprints)
+        stats['near_match'] = self.near_match
+        lookups = stats['hits'] + stats['near_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['hits'] + stats['near_hits']) / lookups, 3) if lookups else 0.0
+        return stats
+
+    def close(self) -> None:
+        """Close the database"""
+        with self._lock:
+            self._conn.close()
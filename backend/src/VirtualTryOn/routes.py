@@ -6,21 +6,91 @@ Provides endpoints for:
 - Image upload and processing
 """
 
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
-from fastapi.responses import JSONResponse
-from typing import Optional
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Header
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from typing import List, Optional
+import threading
+import asyncio
 import base64
+import json
 import os
-from pathlib import Path
-import tempfile
-from PIL import Image
-import io
 
-from .virtual_try_on import apply_virtual_tryon
+from .virtual_try_on import (
+    virtual_tryon_bytes,
+    tryon_cache_key,
+    fetch_clothing_image,
+    get_garment_cache,
+    get_result_cache,
+    OUTPUT_FORMATS
+)
+from .tryon_jobs import TryOnJobQueue, FINISHED, DONE
+from ..Common.gemini_async import run_blocking
+from ..Common.image_prep import prepare_image, get_prep_stats
+from ..Common.rate_limiter import RateLimiter
 
 # Initialize router
 router = APIRouter(prefix="/api/virtual-tryon", tags=["Virtual Try-On"])
 
+# Batch try-on limits
+MAX_BATCH_GARMENTS = 10
+DEFAULT_BATCH_CONCURRENCY = int(os.getenv('TRYON_BATCH_CONCURRENCY', '3'))
+
+# Shared budget for try-on generations started by batch requests and jobs
+tryon_limiter = RateLimiter(requests_per_minute=float(os.getenv('TRYON_REQUESTS_PER_MINUTE', '10')))
+
+# Job queue, created (and its workers started) on first use
+_job_queue: Optional[TryOnJobQueue] = None
+_job_queue_lock = threading.Lock()
+
+# How often job event streams check for a status change, and how long they stay open
+JOB_EVENTS_POLL_SECONDS = 0.5
+JOB_EVENTS_MAX_SECONDS = 600
+
+
+def get_job_queue() -> TryOnJobQueue:
+    """Get the try-on job queue, starting its workers on first use"""
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                queue = TryOnJobQueue(rate_limiter=tryon_limiter)
+                queue.start()
+                _job_queue = queue
+    return _job_queue
+
+
+@router.on_event("shutdown")
+def stop_job_workers():
+    """Stop the job workers; queued jobs stay in the queue file for the next start"""
+    if _job_queue is not None:
+        _job_queue.close()
+
+
+def _job_response(job: dict) -> dict:
+    job = dict(job)
+    job["result_url"] = f"/api/virtual-tryon/jobs/{job['id']}/result" if job["status"] == DONE else None
+    return job
+
+
+async def _tryon_data_url(person_data: bytes, clothing_data: bytes) -> dict:
+    """Run the try-on in memory and wrap the PNG result in the JSON response"""
+    result_data, mime_type = await run_blocking(
+        virtual_tryon_bytes,
+        person_data,
+        clothing_data,
+        api_key=os.getenv('GEMINI_API_KEY'),
+        output_format='png',
+        analyze=False,
+        background_analysis=True
+    )
+    img_base64 = base64.b64encode(result_data).decode()
+    
+    return {
+        "success": True,
+        "image": f"data:{mime_type};base64,{img_base64}",
+        "message": "Virtual try-on completed successfully"
+    }
+
 
 @router.post("")
 async def process_virtual_tryon(
@@ -33,54 +103,321 @@ async def process_virtual_tryon(
     Args:
         person_image: Image of the person
         clothing_image: Image of the clothing item
-        
+    
     Returns:
         JSON with base64 encoded result image
+    
+    Use POST /api/virtual-tryon/image to receive the image as binary instead.
+    """
+    try:
+        return await _tryon_data_url(await person_image.read(), await clothing_image.read())
+    
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Virtual try-on failed: {str(e)}"
+        )
+
+
+@router.post("/image")
+async def process_virtual_tryon_image(
+    person_image: UploadFile = File(..., description="Person image file"),
+    clothing_image: UploadFile = File(..., description="Clothing image file"),
+    output_format: str = Form("webp", description="Result format: webp, jpeg or png"),
+    quality: int = Form(90, ge=1, le=100, description="Quality for webp/jpeg (1-100)"),
+):
     """
+    Process virtual try-on and return the result as a binary image
+    
+    Uploads are processed in memory and the result is sent as raw
+    `image/webp` (default), `image/jpeg` or `image/png` bytes, without the
+    temporary files and base64 JSON wrapping of the other endpoints.
+    
+    **Example:**
+    ```bash
+    curl -X POST http://localhost:8000/api/virtual-tryon/image \
+      -F person_image=@person.jpg -F clothing_image=@clothing.jpg \
+      -F output_format=jpeg -o result.jpg
+    ```
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported output_format: {output_format} (use {', '.join(OUTPUT_FORMATS)})"
+        )
+    
     try:
-        # Create temporary directory for processing
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_path = Path(temp_dir)
-            
-            # Save uploaded images
-            person_path = temp_path / f"person_{person_image.filename}"
-            clothing_path = temp_path / f"clothing_{clothing_image.filename}"
-            
-            # Read and save person image
-            person_content = await person_image.read()
-            with open(person_path, "wb") as f:
-                f.write(person_content)
-            
-            # Read and save clothing image
-            clothing_content = await clothing_image.read()
-            with open(clothing_path, "wb") as f:
-                f.write(clothing_content)
-            
-            # Process virtual try-on
-            result_image, _ = apply_virtual_tryon(
-                person_path=str(person_path),
-                clothing_path=str(clothing_path),
-                api_key=os.getenv('GEMINI_API_KEY'),
-                output_path=None,  # Don't save to disk
-                verbose=False
-            )
-            
-            # Convert PIL Image to base64
-            buffered = io.BytesIO()
-            result_image.save(buffered, format="PNG")
-            img_base64 = base64.b64encode(buffered.getvalue()).decode()
-            
-            return {
-                "success": True,
-                "image": f"data:image/png;base64,{img_base64}",
-                "message": "Virtual try-on completed successfully"
-            }
-            
+        result_data, mime_type = await run_blocking(
+            virtual_tryon_bytes,
+            await person_image.read(),
+            await clothing_image.read(),
+            api_key=os.getenv('GEMINI_API_KEY'),
+            output_format=output_format,
+            quality=quality,
+            analyze=False,
+            background_analysis=True
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Virtual try-on failed: {str(e)}"
         )
+    
+    return Response(content=result_data, media_type=mime_type)
+
+
+async def _wardrobe_item_images(item_ids: List[str], authorization: Optional[str]) -> List[str]:
+    """Resolve WardrobeDB item IDs to their primary image URLs (owner only)"""
+    try:
+        from ..WardrobeDB.routes import wardrobe_db, verify_firebase_token
+    except ImportError:
+        raise HTTPException(status_code=503, detail="Wardrobe not available")
+    if not wardrobe_db:
+        raise HTTPException(status_code=500, detail="Database not initialized")
+    
+    current_user = await verify_firebase_token(authorization)
+    loop = asyncio.get_running_loop()
+    urls = []
+    for item_id in item_ids:
+        item = await loop.run_in_executor(None, wardrobe_db.get_clothing_item, item_id)
+        if not item or not item.images:
+            raise HTTPException(status_code=404, detail=f"Item not found or has no image: {item_id}")
+        if current_user != item.user_id and os.getenv('ENVIRONMENT') != 'development':
+            raise HTTPException(status_code=403, detail="Access denied")
+        urls.append(item.images[0])
+    return urls
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/batch")
+async def process_virtual_tryon_batch(
+    person_image: UploadFile = File(..., description="Person image file"),
+    clothing_images: List[UploadFile] = File([], description="Clothing image files"),
+    item_ids: List[str] = Form([], description="WardrobeDB clothing item IDs"),
+    output_format: str = Form("webp", description="Result format: webp, jpeg or png"),
+    quality: int = Form(90, ge=1, le=100, description="Quality for webp/jpeg (1-100)"),
+    max_concurrency: int = Form(DEFAULT_BATCH_CONCURRENCY, ge=1, le=5, description="Generations run at the same time"),
+    authorization: Optional[str] = Header(None),
+):
+    """
+    Try several garments on one person and stream each result as it completes
+    
+    Garments are uploaded files and/or WardrobeDB item IDs (their primary
+    image; requires the owner's Authorization header), at most 10 in total.
+    The person image is prepared for upload once and reused for every
+    garment. Cached pairs are answered first; the rest run concurrently (at
+    most `max_concurrency` at a time) within the server-wide try-on rate
+    limit (TRYON_REQUESTS_PER_MINUTE).
+    
+    The response is a Server-Sent Events stream (`text/event-stream`), one
+    `result` event per garment in completion order, then a `done` event.
+    Garments are numbered in request order: uploaded files first, then item IDs.
+    
+    **Result event:**
+    ```
+    event: result
+    data: {"index": 0, "item_id": null, "cached": false, "image": "data:image/webp;base64,...", "error": null}
+    ```
+    
+    **Done event:**
+    ```
+    event: done
+    data: {"total": 3, "failed": 0}
+    ```
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported output_format: {output_format} (use {', '.join(OUTPUT_FORMATS)})"
+        )
+    item_ids = [item_id for item_id in item_ids if item_id]
+    total = len(clothing_images) + len(item_ids)
+    if total == 0:
+        raise HTTPException(status_code=400, detail="Provide clothing_images and/or item_ids")
+    if total > MAX_BATCH_GARMENTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_GARMENTS} garments per batch")
+    
+    loop = asyncio.get_running_loop()
+    try:
+        # Prepared once; every generation reuses the same upload bytes
+        person = await loop.run_in_executor(None, prepare_image, await person_image.read())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    garments = [(None, await upload.read()) for upload in clothing_images]
+    if item_ids:
+        garments += list(zip(item_ids, await _wardrobe_item_images(item_ids, authorization)))
+    
+    api_key = os.getenv('GEMINI_API_KEY')
+    
+    async def stream():
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def run(index: int):
+            item_id, clothing = garments[index]
+            cached = False
+            try:
+                if item_id is not None:
+                    clothing = await loop.run_in_executor(None, fetch_clothing_image, clothing)
+                clothing = await loop.run_in_executor(None, prepare_image, clothing)
+                # Cached pairs skip the concurrency queue and the rate limit
+                cached = tryon_cache_key(person.data, clothing.data) in get_result_cache()
+                if cached:
+                    result = await run_blocking(
+                        virtual_tryon_bytes, person, clothing, api_key=api_key,
+                        output_format=output_format, quality=quality, analyze=False
+                    )
+                else:
+                    async with semaphore:
+                        await tryon_limiter.acquire_async()
+                        result = await run_blocking(
+                            virtual_tryon_bytes, person, clothing, api_key=api_key,
+                            output_format=output_format, quality=quality,
+                            analyze=False, background_analysis=True
+                        )
+                return index, item_id, cached, result, None
+            except Exception as e:
+                return index, item_id, cached, None, f"Virtual try-on failed: {str(e)}"
+        
+        failed = 0
+        for next_done in asyncio.as_completed([run(index) for index in range(total)]):
+            index, item_id, cached, result, error = await next_done
+            image = None
+            if result:
+                data, mime_type = result
+                image = f"data:{mime_type};base64,{base64.b64encode(data).decode()}"
+            else:
+                failed += 1
+            yield _sse("result", {
+                "index": index,
+                "item_id": item_id,
+                "cached": cached,
+                "image": image,
+                "error": error
+            })
+        
+        yield _sse("done", {"total": total, "failed": failed})
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/jobs", status_code=202)
+async def submit_virtual_tryon_job(
+    person_image: UploadFile = File(..., description="Person image file"),
+    clothing_image: UploadFile = File(..., description="Clothing image file"),
+    output_format: str = Form("webp", description="Result format: webp, jpeg or png"),
+    quality: int = Form(90, ge=1, le=100, description="Quality for webp/jpeg (1-100)"),
+):
+    """
+    Queue a virtual try-on and return immediately with a job ID
+    
+    Follow the job with `GET /jobs/{job_id}` (polling) or
+    `GET /jobs/{job_id}/events` (Server-Sent Events), then download the
+    image from `GET /jobs/{job_id}/result`. Jobs survive server restarts,
+    and finished results are kept for TRYON_JOB_TTL_HOURS (default 24);
+    submitting the same images again returns the existing job.
+    
+    **Response:**
+    ```json
+    {"id": "3f2c...", "status": "queued", "queue_position": 1, "result_url": null, ...}
+    ```
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported output_format: {output_format} (use {', '.join(OUTPUT_FORMATS)})"
+        )
+    
+    loop = asyncio.get_running_loop()
+    try:
+        person = await loop.run_in_executor(None, prepare_image, await person_image.read())
+        clothing = await loop.run_in_executor(None, prepare_image, await clothing_image.read())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    queue = await loop.run_in_executor(None, get_job_queue)
+    job = await loop.run_in_executor(None, queue.submit, person.data, clothing.data, output_format, quality)
+    return _job_response(job)
+
+
+@router.get("/jobs/{job_id}")
+async def get_virtual_tryon_job(job_id: str):
+    """Get a try-on job's status (queued, running, done or failed)"""
+    loop = asyncio.get_running_loop()
+    queue = await loop.run_in_executor(None, get_job_queue)
+    job = await loop.run_in_executor(None, queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return _job_response(job)
+
+
+@router.get("/jobs/{job_id}/result")
+async def get_virtual_tryon_job_result(job_id: str):
+    """Download a finished try-on job's image"""
+    loop = asyncio.get_running_loop()
+    queue = await loop.run_in_executor(None, get_job_queue)
+    result = await loop.run_in_executor(None, queue.get_result, job_id)
+    if result is None:
+        job = await loop.run_in_executor(None, queue.get, job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found or expired")
+        if job["status"] == "failed":
+            raise HTTPException(status_code=500, detail=job["error"])
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    
+    data, mime_type = result
+    return Response(content=data, media_type=mime_type, headers={"Cache-Control": "private, max-age=86400"})
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_virtual_tryon_job(job_id: str):
+    """
+    Stream a try-on job's progress as Server-Sent Events
+    
+    A `status` event is sent now and whenever the status or queue position
+    changes; the stream ends after the job is done or failed (the last event
+    carries `result_url` or `error`). Reconnecting is safe at any time.
+    
+    ```
+    event: status
+    data: {"id": "3f2c...", "status": "running", "queue_position": null, "result_url": null, ...}
+    ```
+    """
+    # The queue is SQLite-backed: every lookup runs off the event loop
+    loop = asyncio.get_running_loop()
+    queue = await loop.run_in_executor(None, get_job_queue)
+    if await loop.run_in_executor(None, queue.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    
+    async def stream():
+        last = None
+        deadline = loop.time() + JOB_EVENTS_MAX_SECONDS
+        while loop.time() < deadline:
+            job = await loop.run_in_executor(None, queue.get, job_id)
+            if job is None:
+                yield _sse("error", {"id": job_id, "error": "Job not found or expired"})
+                return
+            state = (job["status"], job["queue_position"])
+            if state != last:
+                last = state
+                yield _sse("status", _job_response(job))
+            if job["status"] in FINISHED:
+                return
+            await asyncio.sleep(JOB_EVENTS_POLL_SECONDS)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @router.post("/base64")
@@ -94,55 +431,22 @@ async def process_virtual_tryon_base64(
     Args:
         person_image_base64: Base64 encoded person image
         clothing_image_base64: Base64 encoded clothing image
-        
+    
     Returns:
         JSON with base64 encoded result image
     """
     try:
-        # Create temporary directory for processing
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_path = Path(temp_dir)
-            
-            # Decode base64 images
-            person_path = temp_path / "person.png"
-            clothing_path = temp_path / "clothing.png"
-            
-            # Remove data URL prefix if present
-            if "base64," in person_image_base64:
-                person_image_base64 = person_image_base64.split("base64,")[1]
-            if "base64," in clothing_image_base64:
-                clothing_image_base64 = clothing_image_base64.split("base64,")[1]
-            
-            # Decode and save person image
-            person_data = base64.b64decode(person_image_base64)
-            person_img = Image.open(io.BytesIO(person_data))
-            person_img.save(person_path)
-            
-            # Decode and save clothing image
-            clothing_data = base64.b64decode(clothing_image_base64)
-            clothing_img = Image.open(io.BytesIO(clothing_data))
-            clothing_img.save(clothing_path)
-            
-            # Process virtual try-on
-            result_image, _ = apply_virtual_tryon(
-                person_path=str(person_path),
-                clothing_path=str(clothing_path),
-                api_key=os.getenv('GEMINI_API_KEY'),
-                output_path=None,
-                verbose=False
-            )
-            
-            # Convert PIL Image to base64
-            buffered = io.BytesIO()
-            result_image.save(buffered, format="PNG")
-            img_base64 = base64.b64encode(buffered.getvalue()).decode()
-            
-            return {
-                "success": True,
-                "image": f"data:image/png;base64,{img_base64}",
-                "message": "Virtual try-on completed successfully"
-            }
-            
+        # Remove data URL prefix if present
+        if "base64," in person_image_base64:
+            person_image_base64 = person_image_base64.split("base64,")[1]
+        if "base64," in clothing_image_base64:
+            clothing_image_base64 = clothing_image_base64.split("base64,")[1]
+        
+        return await _tryon_data_url(
+            base64.b64decode(person_image_base64),
+            base64.b64decode(clothing_image_base64)
+        )
+    
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -150,6 +454,18 @@ async def process_virtual_tryon_base64(
         )
 
 
+@router.get("/cache/stats")
+async def cache_stats():
+    """Garment description and try-on result cache statistics"""
+    def collect():
+        return {
+            "garments": get_garment_cache().get_stats(),
+            "results": get_result_cache().get_stats(),
+            "jobs": _job_queue.get_stats() if _job_queue else None
+        }
+    return await asyncio.get_running_loop().run_in_executor(None, collect)
+
+
 @router.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -157,5 +473,7 @@ async def health_check():
     return {
         "status": "healthy",
         "service": "Virtual Try-On",
-        "api_key_configured": bool(api_key)
+        "api_key_configured": bool(api_key),
+        "rate_limit": tryon_limiter.get_stats(),
+        "upload_prep": get_prep_stats()
     }
@@ -0,0 +1,331 @@
+"""
+Virtual Try-On Job Queue
+
+Runs try-ons as background jobs so a client never has to hold an HTTP
+connection open for the 10-30 seconds a generation takes:
+- Jobs (with their prepared input images) are stored in a local SQLite
+  file, so queued work survives restarts; jobs left running by a process
+  that died are queued again once they are stale
+- A small pool of worker threads claims jobs in submission order; claiming
+  is atomic, so several server processes can share one queue file
+- Results are kept for a TTL, so a client that disconnects can poll again
+  or re-submit the same images and get the finished result for free
+
+Example:
+    queue = TryOnJobQueue(workers=2)
+    job = queue.submit(person_bytes, clothing_bytes)
+    ...
+    queue.get(job['id'])          # {'status': 'running', ...}
+    data, mime = queue.get_result(job['id'])
+"""
+
+import os
+import time
+import uuid
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+try:
+    from .virtual_try_on import virtual_tryon_bytes, tryon_cache_key
+except ImportError:
+    # Fallback for direct execution
+    import sys
+    sys.path.append(str(Path(__file__).parent.parent))
+    from VirtualTryOn.virtual_try_on import virtual_tryon_bytes, tryon_cache_key
+
+DEFAULT_DB_PATH = Path(__file__).parent / "tryon_jobs.sqlite3"
+DEFAULT_WORKERS = 2
+DEFAULT_RESULT_TTL_HOURS = 24
+# A running job not finished after this long belongs to a dead process (generations time out at 120 s)
+STALE_RUNNING_SECONDS = 600
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+FINISHED = (DONE, FAILED)
+
+
+def _default_runner(person: bytes, clothing: bytes, output_format: str, quality: int) -> Tuple[bytes, str]:
+    return virtual_tryon_bytes(
+        person, clothing, api_key=os.getenv('GEMINI_API_KEY'),
+        output_format=output_format, quality=quality,
+        analyze=False, background_analysis=True
+    )
+
+
+class TryOnJobQueue:
+    """Persistent try-on job queue with a worker thread pool"""
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        workers: Optional[int] = None,
+        result_ttl_hours: Optional[float] = None,
+        rate_limiter=None,
+        runner: Callable[[bytes, bytes, str, int], Tuple[bytes, str]] = _default_runner
+    ):
+        """
+        Initialize the queue (workers start with start())
+
+        Args:
+            db_path: SQLite file (defaults to TRYON_JOBS_PATH or the module directory)
+            workers: Worker threads (defaults to TRYON_JOB_WORKERS, 2)
+            result_ttl_hours: How long finished jobs are kept (defaults to TRYON_JOB_TTL_HOURS, 24)
+            rate_limiter: Optional shared RateLimiter applied before every generation
+            runner: Function (person, clothing, output_format, quality) -> (bytes, mime_type)
+        """
+        self.db_path = str(db_path or os.getenv("TRYON_JOBS_PATH") or DEFAULT_DB_PATH)
+        self.workers = workers or int(os.getenv("TRYON_JOB_WORKERS", DEFAULT_WORKERS))
+        ttl_hours = result_ttl_hours or float(os.getenv("TRYON_JOB_TTL_HOURS", DEFAULT_RESULT_TTL_HOURS))
+        self.result_ttl = ttl_hours * 3600
+        self.rate_limiter = rate_limiter
+        self.runner = runner
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+        # Jobs claimed by this process and not finished yet, re-queued on close
+        self._running: Set[str] = set()
+        self._closed = False
+        self.stats = {'submitted': 0, 'deduplicated': 0, 'completed': 0, 'failed': 0, 'recovered': 0}
+
+        # Autocommit mode; claims use explicit BEGIN IMMEDIATE transactions
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                pair_key TEXT NOT NULL,
+                status TEXT NOT NULL,
+                output_format TEXT NOT NULL,
+                quality INTEGER NOT NULL,
+                person BLOB,
+                clothing BLOB,
+                result BLOB,
+                mime_type TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+            CREATE INDEX IF NOT EXISTS jobs_pair ON jobs (pair_key);
+        """)
+
+        self.requeue_stale()
+
+    # ==================== WORKERS ====================
+
+    def start(self) -> None:
+        """Start the worker threads (no-op if already running)"""
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"tryon-job-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the workers; a job still running after the timeout is finished in the background"""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _claim(self) -> Optional[Tuple[str, bytes, bytes, str, int]]:
+        """Atomically take the oldest queued job"""
+        with self._lock:
+            if self._closed:
+                return None
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, person, clothing, output_format, quality FROM jobs "
+                    "WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, started_at = ? WHERE id = ?", (RUNNING, time.time(), row[0])
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            if row:
+                self._running.add(row[0])
+        return row
+
+    def _finish(self, job_id: str, result: Optional[bytes], mime_type: Optional[str], error: Optional[str]) -> None:
+        with self._lock:
+            if self._closed:
+                # close() already queued the job again for the next start
+                return
+            self._running.discard(job_id)
+            # Inputs are dropped once the job is finished; only the result is kept
+            self._conn.execute("""
+                UPDATE jobs SET status = ?, result = ?, mime_type = ?, error = ?, finished_at = ?,
+                                person = NULL, clothing = NULL
+                WHERE id = ?
+            """, (FAILED if error else DONE, result, mime_type, error, time.time(), job_id))
+            self.stats['failed' if error else 'completed'] += 1
+
+    def _work(self) -> None:
+        last_purge = 0.0
+        while not self._stopping.is_set():
+            if time.time() - last_purge > 600:
+                last_purge = time.time()
+                try:
+                    self.requeue_stale()
+                    self.purge_expired()
+                except Exception as e:
+                    print(f"Warning: Try-on job purge failed: {e}")
+
+            try:
+                job = self._claim()
+            except sqlite3.OperationalError as e:
+                print(f"Warning: Could not claim try-on job: {e}")
+                job = None
+            if job is None:
+                # Also wakes up periodically for jobs submitted by other processes
+                self._wakeup.wait(1.0)
+                self._wakeup.clear()
+                continue
+
+            job_id, person, clothing, output_format, quality = job
+            try:
+                if self.rate_limiter:
+                    self.rate_limiter.acquire()
+                data, mime_type = self.runner(person, clothing, output_format, quality)
+                self._finish(job_id, data, mime_type, None)
+            except Exception as e:
+                print(f"[ERROR] Try-on job {job_id} failed: {e}")
+                self._finish(job_id, None, None, f"Virtual try-on failed: {str(e)}")
+
+    # ==================== API ====================
+
+    def submit(self, person: bytes, clothing: bytes, output_format: str = 'webp', quality: int = 90) -> Dict[str, Any]:
+        """
+        Queue a try-on
+
+        Images should already be prepared for upload (see Common.image_prep).
+        If the same pair with the same output settings is queued, running or
+        finished (and not expired), that job is returned instead of a new one.
+
+        Returns:
+            The job status (see get)
+        """
+        pair_key = f"{tryon_cache_key(person, clothing)}:{output_format}:{quality}"
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("""
+                SELECT id FROM jobs WHERE pair_key = ? AND status != ? AND (finished_at IS NULL OR finished_at > ?)
+                ORDER BY created_at DESC LIMIT 1
+            """, (pair_key, FAILED, now - self.result_ttl)).fetchone()
+            if row:
+                self.stats['deduplicated'] += 1
+                job_id = row[0]
+            else:
+                job_id = uuid.uuid4().hex
+                self._conn.execute("""
+                    INSERT INTO jobs (id, pair_key, status, output_format, quality, person, clothing, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, (job_id, pair_key, QUEUED, output_format, quality, person, clothing, now))
+                self.stats['submitted'] += 1
+        self._wakeup.set()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a job's status
+
+        Returns:
+            Dictionary with id, status (queued, running, done, failed),
+            queue_position (queued jobs only), error and timestamps, or None
+            if the job is unknown or expired
+        """
+        with self._lock:
+            row = self._conn.execute("""
+                SELECT id, status, output_format, mime_type, error, created_at, started_at, finished_at
+                FROM jobs WHERE id = ?
+            """, (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = dict(zip(
+                ('id', 'status', 'output_format', 'mime_type', 'error', 'created_at', 'started_at', 'finished_at'),
+                row
+            ))
+            if job['finished_at'] and job['finished_at'] < time.time() - self.result_ttl:
+                return None
+            job['queue_position'] = None
+            if job['status'] == QUEUED:
+                job['queue_position'] = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?", (QUEUED, job['created_at'])
+                ).fetchone()[0] + 1
+        return job
+
+    def get_result(self, job_id: str) -> Optional[Tuple[bytes, str]]:
+        """Get a finished job's result as (bytes, mime_type), or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result, mime_type, finished_at FROM jobs WHERE id = ? AND status = ?", (job_id, DONE)
+            ).fetchone()
+        if row is None or row[2] < time.time() - self.result_ttl:
+            return None
+        return row[0], row[1]
+
+    def requeue_stale(self) -> int:
+        """Queue again jobs left running by a process that stopped, returning the number re-queued"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL WHERE status = ? AND started_at < ?",
+                (QUEUED, RUNNING, time.time() - STALE_RUNNING_SECONDS)
+            )
+            self.stats['recovered'] += cursor.rowcount
+            return cursor.rowcount
+
+    def purge_expired(self) -> int:
+        """Delete finished jobs older than the TTL, returning the number removed"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (time.time() - self.result_ttl,)
+            )
+            return cursor.rowcount
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get queue statistics"""
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        stats = dict(self.stats)
+        stats['jobs'] = {status: counts.get(status, 0) for status in (QUEUED, RUNNING, DONE, FAILED)}
+        stats['workers'] = len(self._threads)
+        return stats
+
+    def close(self, timeout: float = 5.0) -> None:
+        """
+        Stop the workers and close the database
+
+        Jobs still running after the timeout are queued again right away (not
+        only once stale); their results, if they still arrive, are discarded.
+        """
+        self.stop(timeout)
+        with self._lock:
+            if self._closed:
+                return
+            if self._running:
+                self._conn.executemany(
+                    "UPDATE jobs SET status = ?, started_at = NULL WHERE id = ? AND status = ?",
+                    [(QUEUED, job_id, RUNNING) for job_id in self._running]
+                )
+                print(f"[WARN] Re-queued {len(self._running)} unfinished try-on job(s) on shutdown")
+                self._running.clear()
+            self._closed = True
+            self._conn.close()
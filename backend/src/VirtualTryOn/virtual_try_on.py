@@ -5,9 +5,11 @@ Uses Google's Nano Banana API to apply clothing onto a person.
 Place person.jpg and clothing.jpg in the LiveVideoCall folder.
 """
 
+import io
 import os
 import sys
 import base64
+import threading
 from pathlib import Path
 
 # Load environment variables from .env file
@@ -23,9 +25,10 @@ except ImportError:
 
 print("Starting imports...")
 
+from PIL import Image
+
 try:
     from google import genai
-    from PIL import Image
     GENAI_AVAILABLE = True
     print("[OK] Libraries imported successfully")
 except ImportError as e:
@@ -33,45 +36,415 @@ except ImportError as e:
     print(f"[ERROR] Import error: {e}")
     print("Run: pip install google-genai pillow")
 
+try:
+    from ..Common.gemini_clients import get_client, get_model
+    from ..Common.gemini_async import get_gemini_executor
+    from ..Common.disk_cache import DiskLRUCache, hash_key
+    from ..Common.image_prep import PreparedImage, prepare_image
+    from ..Common.public_hosts import fetch_public_url
+    from .garment_cache import GarmentDescriptionCache, content_hash
+except ImportError:
+    # Fallback for direct execution
+    sys.path.append(str(Path(__file__).parent.parent))
+    from Common.gemini_clients import get_client, get_model
+    from Common.gemini_async import get_gemini_executor
+    from Common.disk_cache import DiskLRUCache, hash_key
+    from Common.image_prep import PreparedImage, prepare_image
+    from Common.public_hosts import fetch_public_url
+    from VirtualTryOn.garment_cache import GarmentDescriptionCache, content_hash
+
+
+# Output encodings for in-memory results
+OUTPUT_FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'png': ('PNG', 'image/png')
+}
+
+# Bump when TRYON_PROMPT changes so cached results from the old prompt are not served
+TRYON_PROMPT_VERSION = 1
+
+TRYON_PROMPT = """Perform virtual try-on: Apply the clothing from the second image onto the person in the first image.
+
+Clothing: {description}
+
+Requirements:
+- Keep person's pose, face, body EXACTLY the same
+- Keep background unchanged
+- Make clothing fit naturally
+- Match lighting and shadows
+- Photorealistic quality
+- Only change the clothing
+
+Result should look like the person naturally wearing the clothing."""
+
+GENERIC_CLOTHING_DESCRIPTION = "clothing item from image"
+
+# Largest clothing image fetched by URL for precomputing a description
+MAX_CLOTHING_FETCH_BYTES = 15 * 1024 * 1024
+
+# Try-on result cache (TRYON_CACHE_DIR / TRYON_CACHE_MAX_MB)
+DEFAULT_RESULT_CACHE_DIR = Path(__file__).parent / "tryon_cache"
+DEFAULT_RESULT_CACHE_MAX_MB = 256
+
+_garment_cache = None
+_garment_cache_lock = threading.Lock()
+_pending_analyses = set()
+_result_cache = None
+
 
 def encode_image(image_path):
-    """Encode image to base64"""
-    with open(image_path, "rb") as f:
-        image_data = base64.b64encode(f.read()).decode()
+    """Encode image to base64 (normalized for upload, see image_payload)"""
+    image_data, mime_type = image_payload(image_path)
+    return base64.b64encode(image_data).decode(), mime_type
+
+
+def image_payload(image, purpose='image'):
+    """
+    Get upload-ready bytes and MIME type for an image given as bytes, a PIL image or a path
     
-    ext = Path(image_path).suffix.lower()
-    mime_map = {'.png': 'image/png', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.webp': 'image/webp'}
-    mime_type = mime_map.get(ext, 'image/jpeg')
+    Images are normalized for the model (EXIF orientation applied, longest
+    edge capped, metadata stripped, re-encoded) by Common.image_prep; small
+    JPEG/PNG/WebP files that need none of that are passed through untouched.
+    An already prepared image (PreparedImage) is used as is, so an image sent
+    with several requests is only prepared once.
     
-    return image_data, mime_type
+    Returns:
+        tuple: (bytes, mime_type)
+    """
+    prepared = image if isinstance(image, PreparedImage) else prepare_image(image, purpose=purpose)
+    return prepared.data, prepared.mime_type
 
 
-def analyze_clothing(client, clothing_path):
-    """Analyze clothing image"""
-    print("[*] Analyzing clothing...")
+def encode_result(image, output_format='webp', quality=90):
+    """
+    Encode a PIL image to bytes
     
-    try:
-        clothing_data, mime_type = encode_image(clothing_path)
-        
-        prompt = """Analyze this clothing item briefly: type, color, style, material."""
+    Args:
+        image: PIL image
+        output_format: 'webp', 'jpeg' or 'png'
+        quality: Quality for lossy formats (1-100)
         
+    Returns:
+        tuple: (bytes, mime_type)
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format: {output_format} (use {', '.join(OUTPUT_FORMATS)})")
+    pil_format, mime_type = OUTPUT_FORMATS[output_format]
+    
+    if pil_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    
+    buffer = io.BytesIO()
+    if pil_format == 'PNG':
+        image.save(buffer, format='PNG')
+    else:
+        image.save(buffer, format=pil_format, quality=quality)
+    return buffer.getvalue(), mime_type
+
+
+def _inline_part(data, mime_type):
+    return {"inline_data": {"mime_type": mime_type, "data": data}}
+
+
+def analyze_clothing_bytes(client, clothing_data, mime_type):
+    """
+    Describe a clothing image given as raw bytes
+    
+    Returns:
+        str: Description, or a generic description if analysis fails
+    """
+    prompt = """Analyze this clothing item briefly: type, color, style, material."""
+    try:
         response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
+            model=get_model('vision'),
             contents=[
                 {"parts": [
-                    {"inline_data": {"mime_type": mime_type, "data": clothing_data}},
+                    _inline_part(clothing_data, mime_type),
                     {"text": prompt}
                 ]}
             ]
         )
+        return response.text or GENERIC_CLOTHING_DESCRIPTION
+    except Exception as e:
+        print(f"[WARN] Analysis failed: {e}")
+        return GENERIC_CLOTHING_DESCRIPTION
+
+
+def get_garment_cache():
+    """Get the shared garment description cache"""
+    global _garment_cache
+    if _garment_cache is None:
+        with _garment_cache_lock:
+            if _garment_cache is None:
+                _garment_cache = GarmentDescriptionCache()
+    return _garment_cache
+
+
+def get_result_cache():
+    """Get the shared try-on result cache (size-bounded LRU blob store on disk)"""
+    global _result_cache
+    if _result_cache is None:
+        with _garment_cache_lock:
+            if _result_cache is None:
+                max_mb = float(os.getenv("TRYON_CACHE_MAX_MB", DEFAULT_RESULT_CACHE_MAX_MB))
+                _result_cache = DiskLRUCache(
+                    os.getenv("TRYON_CACHE_DIR") or DEFAULT_RESULT_CACHE_DIR,
+                    max_bytes=int(max_mb * 1024 * 1024),
+                    suffix=".img"
+                )
+    return _result_cache
+
+
+def tryon_cache_key(person_data, clothing_data, clothing_description=None):
+    """
+    Result cache key for a person/clothing pair
+    
+    Covers both images (as sent to the model), the image model, the prompt
+    version and an explicitly given clothing description.
+    """
+    return hash_key(
+        content_hash(person_data), content_hash(clothing_data),
+        get_model('image'), TRYON_PROMPT_VERSION, clothing_description or ''
+    )
+
+
+def _sniff_mime(data):
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'image/png'
+    if data[:3] == b'\xff\xd8\xff':
+        return 'image/jpeg'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'image/png'
+
+
+def describe_clothing(client, clothing_data, mime_type, url=None):
+    """
+    Describe a clothing image, analyzing it only if no description is cached
+    
+    Args:
+        client: Gemini client
+        clothing_data: Image bytes
+        mime_type: Image MIME type
+        url (str, optional): Where the image came from, remembered with the description
+        
+    Returns:
+        str: Description (generic if analysis fails; failures are not cached)
+    """
+    cache = get_garment_cache()
+    description = cache.get(clothing_data)
+    if description is None:
+        description = analyze_clothing_bytes(client, clothing_data, mime_type)
+        if description != GENERIC_CLOTHING_DESCRIPTION:
+            cache.set(clothing_data, description, url=url)
+    return description
+
+
+def fetch_clothing_image(url):
+    """
+    Download a clothing image (e.g. a WardrobeDB item image) into memory
+
+    Only public hosts are fetched, including on redirects (HostNotAllowed otherwise).
+    """
+    return fetch_public_url(url, max_bytes=MAX_CLOTHING_FETCH_BYTES, timeout=15)
+
+
+def _is_url(value):
+    return isinstance(value, str) and value.startswith(('http://', 'https://'))
+
+
+def precompute_clothing_description(clothing, api_key=None, url=None):
+    """
+    Make sure a description of a clothing image is cached
+    
+    Args:
+        clothing: Clothing image as bytes, PIL image, path or http(s) URL
+        api_key (str, optional): Gemini API key. If None, loads from environment.
+        url (str, optional): Public URL of the image bytes, so a later lookup by URL needs no download
+        
+    Returns:
+        str: The cached (or newly generated) description
+    """
+    if _is_url(clothing):
+        url = clothing
+        description = get_garment_cache().get_by_url(url)
+        if description is not None:
+            return description
+        clothing = fetch_clothing_image(url)
+    
+    clothing_data, mime_type = image_payload(clothing)
+    return describe_clothing(get_client(api_key, purpose='vision'), clothing_data, mime_type, url=url)
+
+
+def schedule_clothing_analysis(clothing, api_key=None, url=None):
+    """
+    Precompute a clothing description in the background
+    
+    Runs on the shared Gemini executor; the same image (or URL) is only
+    queued once at a time.
+    
+    Args:
+        clothing: Clothing image as bytes, PIL image, path or http(s) URL
+        api_key (str, optional): Gemini API key. If None, loads from environment.
+        url (str, optional): Public URL of the image bytes
         
-        description = response.text
+    Returns:
+        bool: True if an analysis was queued
+    """
+    if _is_url(clothing):
+        key = clothing
+    else:
+        clothing, _ = image_payload(clothing)
+        cache = get_garment_cache()
+        if cache.add_url(url, clothing) if url else cache.contains(clothing):
+            return False
+        key = url or content_hash(clothing)
+    
+    with _garment_cache_lock:
+        if key in _pending_analyses:
+            return False
+        _pending_analyses.add(key)
+    
+    def run():
+        try:
+            precompute_clothing_description(clothing, api_key, url=url)
+        except Exception as e:
+            print(f"[WARN] Clothing precompute failed: {e}")
+        finally:
+            with _garment_cache_lock:
+                _pending_analyses.discard(key)
+    
+    get_gemini_executor().submit(run)
+    return True
+
+
+def analyze_clothing(client, clothing_path):
+    """Analyze clothing image"""
+    print("[*] Analyzing clothing...")
+    
+    clothing_data, mime_type = image_payload(clothing_path)
+    description = describe_clothing(client, clothing_data, mime_type)
+    if description != GENERIC_CLOTHING_DESCRIPTION:
         print(f"[OK] Analysis: {description[:100]}...")
-        return {'description': description, 'image_path': clothing_path}
+    return {'description': description, 'image_path': clothing_path}
+
+
+def _generate_tryon(person, clothing, api_key=None, clothing_description=None, analyze=True,
+                    background_analysis=False, use_cache=True):
+    """
+    Run the try-on model on in-memory images
     
-    except Exception as e:
-        print(f"[WARN] Analysis failed: {e}")
-        return {'description': "clothing item from image", 'image_path': clothing_path}
+    A result cached for the same person/clothing pair is returned without
+    calling the model. The clothing description comes from the garment cache
+    when the image was seen before; otherwise it is analyzed first (analyze)
+    or the generic description is used and, with background_analysis, the
+    analysis is queued for the next try-on of the same garment. Results made
+    with the generic description in place of an unknown (or unanalyzable)
+    garment are not cached, so a later try-on uses the real description.
+    
+    Returns:
+        tuple: (result bytes, result mime type) exactly as returned by the model
+    """
+    api_key = api_key or os.getenv('GEMINI_API_KEY')
+    if not api_key:
+        raise ValueError("No API key provided. Set GEMINI_API_KEY environment variable or pass api_key parameter.")
+    
+    person_data, person_mime = image_payload(person)
+    clothing_data, clothing_mime = image_payload(clothing)
+    
+    cache_key = tryon_cache_key(person_data, clothing_data, clothing_description)
+    if use_cache:
+        cached = get_result_cache().get(cache_key)
+        if cached is not None:
+            return cached, _sniff_mime(cached)
+    
+    client = get_client(api_key, purpose='image')
+    fallback = False
+    if clothing_description is None:
+        if analyze:
+            clothing_description = describe_clothing(client, clothing_data, clothing_mime)
+        else:
+            clothing_description = get_garment_cache().get(clothing_data)
+            if clothing_description is None:
+                clothing_description = GENERIC_CLOTHING_DESCRIPTION
+                if background_analysis:
+                    schedule_clothing_analysis(clothing_data, api_key)
+        fallback = clothing_description == GENERIC_CLOTHING_DESCRIPTION
+    
+    response = client.models.generate_content(
+        model=get_model('image'),
+        contents=[
+            {"parts": [
+                _inline_part(person_data, person_mime),
+                _inline_part(clothing_data, clothing_mime),
+                {"text": TRYON_PROMPT.format(description=clothing_description)}
+            ]}
+        ]
+    )
+    
+    for part in response.parts or []:
+        if part.inline_data and part.inline_data.data:
+            data = part.inline_data.data
+            if not fallback:
+                get_result_cache().set(cache_key, data)
+            return data, part.inline_data.mime_type or _sniff_mime(data)
+    raise Exception("No image in response")
+
+
+def generate_tryon_image(person, clothing, api_key=None, clothing_description=None, analyze=True,
+                         background_analysis=False, use_cache=True):
+    """
+    Apply virtual try-on to in-memory images
+    
+    Args:
+        person: Person image as bytes, PIL image or path
+        clothing: Clothing image as bytes, PIL image or path
+        api_key (str, optional): Gemini API key. If None, loads from environment.
+        clothing_description (str, optional): Known description; skips the analysis call
+        analyze (bool): Describe uncached clothing with the vision model first when no description is given
+        background_analysis (bool): Without analyze, describe uncached clothing in the background
+        use_cache (bool): Return a cached result for the same image pair if there is one
+        
+    Returns:
+        PIL.Image: The try-on result
+    """
+    data, _ = _generate_tryon(person, clothing, api_key, clothing_description, analyze,
+                              background_analysis, use_cache)
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
+
+
+def virtual_tryon_bytes(person, clothing, api_key=None, output_format='webp', quality=90,
+                        clothing_description=None, analyze=True, background_analysis=False, use_cache=True):
+    """
+    Apply virtual try-on without touching the disk: bytes (or PIL images) in, bytes out
+    
+    Args:
+        person: Person image as bytes, PIL image or path
+        clothing: Clothing image as bytes, PIL image or path
+        api_key (str, optional): Gemini API key. If None, loads from environment.
+        output_format (str): 'webp', 'jpeg' or 'png'; None returns the model's image unchanged
+        quality (int): Quality for lossy formats (1-100)
+        clothing_description (str, optional): Known description; skips the analysis call
+        analyze (bool): Describe uncached clothing with the vision model first when no description is given
+        background_analysis (bool): Without analyze, describe uncached clothing in the background
+        use_cache (bool): Return a cached result for the same image pair if there is one
+        
+    Returns:
+        tuple: (bytes, mime_type)
+        
+    Example:
+        >>> data, mime = virtual_tryon_bytes(person_bytes, clothing_bytes, output_format='jpeg')
+    """
+    data, mime_type = _generate_tryon(person, clothing, api_key, clothing_description, analyze,
+                                      background_analysis, use_cache)
+    if output_format is None or OUTPUT_FORMATS.get(output_format, (None, None))[1] == mime_type:
+        return data, mime_type
+    
+    with Image.open(io.BytesIO(data)) as image:
+        return encode_result(image, output_format, quality)
 
 
 def apply_virtual_tryon(person_path, clothing_path, api_key=None, output_path=None, verbose=True):
@@ -92,6 +465,9 @@ def apply_virtual_tryon(person_path, clothing_path, api_key=None, output_path=No
         >>> from virtual_try_on import apply_virtual_tryon
         >>> result_image, result_path = apply_virtual_tryon("person.jpg", "clothing.jpg")
         >>> print(f"Saved to: {result_path}")
+    
+    For request handlers, use virtual_tryon_bytes() instead: it works on
+    in-memory images and never writes to disk.
     """
     
     # Load API key if not provided
@@ -104,75 +480,21 @@ def apply_virtual_tryon(person_path, clothing_path, api_key=None, output_path=No
         print("\n" + "="*70)
         print("[*] Virtual Try-On Process")
         print("="*70 + "\n")
-    
-    # Initialize
-    if verbose:
         print("[*] Connecting to Gemini API...")
-    client = genai.Client(api_key=api_key)
     
-    # Analyze clothing
     if verbose:
-        print("[*] Analyzing clothing...")
-    clothing_info = analyze_clothing(client, clothing_path) if verbose else {
-        'description': 'clothing item from image',
-        'image_path': clothing_path
-    }
-    
-    # Load images
-    if verbose:
-        print("[*] Loading person image...")
-    person_data, person_mime = encode_image(person_path)
-    
-    if verbose:
-        print("[*] Loading clothing image...")
-    clothing_data, clothing_mime = encode_image(clothing_path)
-    
-    # Create prompt
-    prompt = f"""Perform virtual try-on: Apply the clothing from the second image onto the person in the first image.
-
-Clothing: {clothing_info['description']}
-
-Requirements:
-- Keep person's pose, face, body EXACTLY the same
-- Keep background unchanged
-- Make clothing fit naturally
-- Match lighting and shadows
-- Photorealistic quality
-- Only change the clothing
-
-Result should look like the person naturally wearing the clothing."""
-    
-    if verbose:
-        print("[*] Generating virtual try-on (this takes 10-30 seconds)...")
+        print("[*] Loading images...")
+        print("[*] Generating virtual try-on (this takes 10-30 seconds, instant for a cached pair)...")
     
     try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash-image",
-            contents=[
-                {"parts": [
-                    {"inline_data": {"mime_type": person_mime, "data": person_data}},
-                    {"inline_data": {"mime_type": clothing_mime, "data": clothing_data}},
-                    {"text": prompt}
-                ]}
-            ]
+        # Clothing is analyzed only in verbose mode, as before (descriptions are cached)
+        pil_image = generate_tryon_image(
+            Path(person_path),
+            Path(clothing_path),
+            api_key=api_key,
+            analyze=verbose
         )
         
-        # Extract result
-        result_image = None
-        for part in response.parts:
-            if part.inline_data:
-                result_image = part.as_image()
-                break
-        
-        if not result_image:
-            raise Exception("No image in response")
-        
-        # Convert to PIL Image for consistency
-        if hasattr(result_image, '_pil_image'):
-            pil_image = result_image._pil_image
-        else:
-            pil_image = result_image
-        
         # Determine output path
         if output_path is None:
             output_path = Path(__file__).parent / "virtual_tryon_result.png"
@@ -13,6 +13,9 @@ import google.generativeai as genai
 import os
 from dotenv import load_dotenv
 
+from ..Common.gemini_async import run_blocking
+from ..Common.gemini_clients import get_model
+
 load_dotenv()
 
 router = APIRouter(prefix="/voice-agent", tags=["Voice Agent"])
@@ -139,7 +142,7 @@ Be conversational, friendly, and helpful. Keep responses concise for voice inter
     try:
         # Initialize Gemini Live API session
         model = genai.GenerativeModel(
-            model_name="gemini-2.0-flash-exp",
+            model_name=get_model('text'),
             system_instruction=system_instruction,
             tools=NAVIGATION_TOOLS
         )
@@ -178,7 +181,7 @@ Be conversational, friendly, and helpful. Keep responses concise for voice inter
                     user_message = data.get("content")
                     
                     # Send to Gemini
-                    response = await asyncio.to_thread(
+                    response = await run_blocking(
                         chat.send_message,
                         user_message
                     )
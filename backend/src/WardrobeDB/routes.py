@@ -30,6 +30,13 @@ from .wardrobe_db import (
 )
 import os
 
+# Garment descriptions are precomputed for virtual try-on when items are added
+try:
+    from ..VirtualTryOn.virtual_try_on import schedule_clothing_analysis
+    GARMENT_PRECOMPUTE_AVAILABLE = True
+except ImportError:
+    GARMENT_PRECOMPUTE_AVAILABLE = False
+
 # Initialize router
 router = APIRouter(prefix="/api")
 
@@ -170,6 +177,17 @@ async def update_user_profile(
 
 # ==================== CLOTHING ITEM ROUTES ====================
 
+def precompute_garment_descriptions(images: List[str]):
+    """Queue the try-on description of an item's primary image"""
+    if not GARMENT_PRECOMPUTE_AVAILABLE or not os.getenv('GEMINI_API_KEY'):
+        return
+    for image_url in images[:1]:
+        try:
+            schedule_clothing_analysis(image_url)
+        except Exception as e:
+            print(f"Warning: Could not queue garment analysis: {e}")
+
+
 @router.post("/users/{user_id}/clothing")
 async def add_clothing_item(
     user_id: str,
@@ -190,6 +208,7 @@ async def add_clothing_item(
     )
     
     item_id = wardrobe_db.add_clothing_item(clothing_item)
+    precompute_garment_descriptions(clothing_item.images)
     return {"message": "Item added", "item_id": item_id, "item": clothing_item.to_dict()}
 
 
@@ -249,6 +268,8 @@ async def update_clothing_item(
     update_dict = {k: v for k, v in updates.dict().items() if v is not None}
     
     wardrobe_db.update_clothing_item(item_id, update_dict)
+    if update_dict.get('images'):
+        precompute_garment_descriptions(update_dict['images'])
     return {"message": "Item updated", "item_id": item_id}
 
 
@@ -8,6 +8,7 @@ Supports image processing, resizing, and background removal.
 import os
 import io
 import uuid
+import importlib.util
 from pathlib import Path
 from typing import Optional, List, Tuple
 from datetime import datetime, timedelta
@@ -22,12 +23,32 @@ except ImportError:
     print("Warning: Firebase libraries not installed. Run: pip install firebase-admin")
 
 try:
-    from rembg import remove
-    REMBG_AVAILABLE = True
+    from ..Common.local_models import register_local_model, get_local_model
 except ImportError:
-    REMBG_AVAILABLE = False
+    # Fallback for direct execution
+    import sys
+    sys.path.append(str(Path(__file__).parent.parent))
+    from Common.local_models import register_local_model, get_local_model
+
+
+def _load_rembg_session():
+    from rembg import new_session
+    return new_session("u2net")
+
+
+# rembg and its model are loaded on the first upload that removes a background
+REMBG_AVAILABLE = importlib.util.find_spec("rembg") is not None
+register_local_model("wardrobe-rembg", _load_rembg_session, requires="rembg")
+if not REMBG_AVAILABLE:
     print("Info: rembg not available. Background removal disabled. Run: pip install rembg")
 
+# Garment descriptions for virtual try-on are precomputed from uploaded images
+try:
+    from ..VirtualTryOn.virtual_try_on import schedule_clothing_analysis
+    GARMENT_PRECOMPUTE_AVAILABLE = True
+except ImportError:
+    GARMENT_PRECOMPUTE_AVAILABLE = False
+
 
 class FirebaseStorageManager:
     """
@@ -104,8 +125,10 @@ class FirebaseStorageManager:
                 image.save(output_buffer, format='PNG')
                 image_data = output_buffer.getvalue()
                 
-                # Remove background
-                image_data = remove(image_data)
+                # Remove background (one shared session instead of a new one per call)
+                session = get_local_model("wardrobe-rembg")
+                from rembg import remove
+                image_data = remove(image_data, session=session)
                 return image_data
             except Exception as e:
                 print(f"Warning: Background removal failed: {e}")
@@ -167,6 +190,14 @@ class FirebaseStorageManager:
         blob.make_public()
         
         print(f"✓ Uploaded clothing image: {blob_name}")
+        
+        # Describe the garment now, from the bytes just uploaded, so try-on skips the analysis call
+        if GARMENT_PRECOMPUTE_AVAILABLE and os.getenv('GEMINI_API_KEY'):
+            try:
+                schedule_clothing_analysis(processed_data, url=blob.public_url)
+            except Exception as e:
+                print(f"Warning: Could not queue garment analysis: {e}")
+        
         return blob.public_url
     
     def upload_multiple_images(self,
@@ -232,6 +232,10 @@ class WardrobeDB:
         print(f"User profile deleted: {user_id}")
         return True
 
+    def list_user_ids(self) -> List[str]:
+        """Get the IDs of all user profiles"""
+        return [doc.id for doc in self.db.collection('users').select([]).stream()]
+
     # ==================== CLOTHING ITEM OPERATIONS ====================
 
     def add_clothing_item(self, item: ClothingItem) -> str:
@@ -433,6 +437,21 @@ class WardrobeDB:
             print(f"Outfit {outfit_id} removed from collection {collection_id}")
         return True
 
+    # ==================== PRECOMPUTED RECOMMENDATIONS ====================
+
+    def save_precomputed_recommendations(self, user_id: str, data: Dict[str, Any]) -> bool:
+        """Store a precomputed recommendation result for a user"""
+        data['updated_at'] = datetime.utcnow().isoformat()
+        self.db.collection('precomputed_recommendations').document(user_id).set(data)
+        return True
+
+    def get_precomputed_recommendations(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Get the precomputed recommendation result for a user"""
+        doc = self.db.collection('precomputed_recommendations').document(user_id).get()
+        if doc.exists:
+            return doc.to_dict()
+        return None
+
     # ==================== UTILITY OPERATIONS ====================
 
     def get_wardrobe_stats(self, user_id: str) -> Dict[str, Any]:
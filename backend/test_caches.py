@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Smoke tests for the caches, stores and the local model registry
+
+Each test works in a temporary directory, so nothing is written next to the
+modules. Run from the backend directory:
+    python test_caches.py
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.append('.')
+
+
+def test_search_cache():
+    """Search results round-trip through SQLite and serve smaller n"""
+    from src.ClothesSearch.search_cache import SearchCache, normalize_query
+
+    with tempfile.TemporaryDirectory() as tmp:
+        key = normalize_query("White  Sneakers Singapore", color="White")
+        assert key == "white sneakers|color=white|region=singapore"
+
+        cache = SearchCache(db_path=str(Path(tmp) / "search.sqlite3"))
+        products = [{'url': f'https://shop.example/p/{i}', 'title': f'Sneaker {i}'} for i in range(5)]
+        assert cache.get(key, 5) is None
+        cache.set(key, 5, products)
+        cache.close()
+
+        # A fresh instance only has the SQLite tier
+        cache = SearchCache(db_path=str(Path(tmp) / "search.sqlite3"))
+        assert cache.get(key, 3) == products[:3]
+        assert cache.get(key, 10) is None
+        cache.close()
+    print("[OK] SearchCache")
+
+
+def test_image_proxy():
+    """Images are resized to WebP, cached on disk, and private hosts are refused"""
+    import io
+    import asyncio
+    from PIL import Image
+    from src.ClothesSearch.image_proxy import ImageProxy, ImageProxyError, resize_to_webp
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (1200, 800), (200, 30, 30)).save(buffer, format='JPEG')
+    webp = resize_to_webp(buffer.getvalue(), 320)
+    with Image.open(io.BytesIO(webp)) as img:
+        assert img.format == 'WEBP' and img.size == (320, 213)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        proxy = ImageProxy(cache_dir=tmp)
+        key = proxy.cache_key("https://shop.example/shoe.jpg?utm_source=x", 300)
+        assert key == proxy.cache_key("https://shop.example/shoe.jpg", 320)
+        proxy.cache.set(key, webp)
+        data, cached = asyncio.run(proxy.get("https://shop.example/shoe.jpg", 320))
+        assert cached and data == webp
+
+        async def fetch_private():
+            try:
+                await proxy.get("http://127.0.0.1/admin.png")
+            finally:
+                await proxy.close()
+
+        try:
+            asyncio.run(fetch_private())
+            raise AssertionError("loopback image was fetched")
+        except ImageProxyError as e:
+            assert e.status_code == 400
+    print("[OK] ImageProxy")
+
+
+def test_canonical_url():
+    """Mobile/desktop hosts, http/https and tracking parameters share a key; URLs are kept"""
+    from src.ClothesSearch.canonical_url import canonicalize_url, dedupe_products
+
+    key = canonicalize_url("https://m.zalora.sg/p/x")
+    assert key == canonicalize_url("https://www.zalora.sg/p/x?utm_source=a")
+    assert key == canonicalize_url("http://zalora.sg/p/x/#reviews")
+    assert key != canonicalize_url("https://zalora.sg/p/y")
+
+    products = dedupe_products([
+        {'url': 'https://m.zalora.sg/p/x?tag=aff-21', 'title': 'Shirt'},
+        {'url': 'https://www.zalora.sg/p/x', 'title': 'Shirt', 'image': 'https://zalora.sg/x.jpg'},
+    ])
+    assert products == [{'url': 'https://m.zalora.sg/p/x?tag=aff-21', 'title': 'Shirt', 'image': 'https://zalora.sg/x.jpg'}]
+    print("[OK] canonical URL keys")
+
+
+def test_product_catalog():
+    """Products found by searches are matched by words and filters, and removable"""
+    from src.ClothesSearch.product_catalog import ProductCatalog
+
+    with tempfile.TemporaryDirectory() as tmp:
+        catalog = ProductCatalog(db_path=str(Path(tmp) / "catalog.sqlite3"))
+        catalog.add_products([
+            {'url': 'https://shop.example/p/1', 'title': 'White Leather Sneakers', 'image': 'https://shop.example/1.jpg'},
+            {'url': 'https://shop.example/p/2', 'title': 'Blue Denim Jacket'},
+        ], brand='Acme')
+        assert catalog.count() == 2
+
+        results = catalog.search("white sneaker")
+        assert [p['url'] for p in results] == ['https://shop.example/p/1']
+        assert results[0]['image'] == 'https://shop.example/1.jpg'
+        assert catalog.search("denim", brand="acme")[0]['title'] == 'Blue Denim Jacket'
+        assert catalog.search("denim", brand="other") == []
+
+        # Variants of a link are one product, served with the URL as found
+        catalog.add_products([{'url': 'https://shop.example/p/2/?tag=aff-21', 'title': 'Blue Denim Jacket'}])
+        assert catalog.count() == 2
+        assert catalog.search("denim")[0]['url'] == 'https://shop.example/p/2/?tag=aff-21'
+
+        assert catalog.remove(['https://shop.example/p/2']) == 1
+        assert catalog.search("denim") == []
+        catalog.close()
+    print("[OK] ProductCatalog")
+
+
+def test_garment_cache():
+    """Descriptions match exact images and URLs; near matching is opt-in and strict"""
+    import io
+    from PIL import Image, ImageDraw
+    from src.VirtualTryOn.garment_cache import GarmentDescriptionCache
+    from src.Common.public_hosts import HostNotAllowed, fetch_public_url
+
+    def tee(color, stripe=False, quality=95):
+        img = Image.new('RGB', (400, 500), (255, 255, 255))
+        draw = ImageDraw.Draw(img)
+        draw.polygon([(125, 75), (275, 75), (350, 150), (310, 190), (290, 170), (290, 450),
+                      (110, 450), (110, 170), (90, 190), (50, 150)], fill=color)
+        if stripe:
+            draw.rectangle([110, 240, 290, 265], fill=(250, 250, 250))
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=quality)
+        return buffer.getvalue()
+
+    black, red = tee((15, 15, 18)), tee((180, 40, 40))
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = GarmentDescriptionCache(db_path=str(Path(tmp) / "garments.sqlite3"), near_match=False)
+        cache.set(black, "black tee", url="https://shop.example/black.jpg")
+        cache.set(red, "red tee")
+        assert cache.get(black) == "black tee"
+        assert cache.get_by_url("https://shop.example/black.jpg") == "black tee"
+        assert cache.get(tee((180, 40, 40), quality=80)) is None
+        cache.close()
+
+        cache = GarmentDescriptionCache(db_path=str(Path(tmp) / "garments.sqlite3"), near_match=True)
+        assert cache.get(tee((180, 40, 40), quality=80)) == "red tee"
+        assert cache.get(tee((20, 28, 58))) is None            # navy is not black
+        assert cache.get(tee((180, 40, 40), stripe=True)) is None
+        cache.close()
+
+    for url in ("http://127.0.0.1/item.jpg", "file:///etc/passwd"):
+        try:
+            fetch_public_url(url, max_bytes=1024)
+            raise AssertionError(f"{url} was fetched")
+        except HostNotAllowed:
+            pass
+    print("[OK] GarmentDescriptionCache")
+
+
+def test_tryon_result_cache():
+    """Try-on results are keyed by both images and the description, and evicted by size"""
+    from src.Common.disk_cache import DiskLRUCache
+    from src.VirtualTryOn.virtual_try_on import tryon_cache_key
+
+    key = tryon_cache_key(b'person', b'clothing')
+    assert key == tryon_cache_key(b'person', b'clothing')
+    assert key != tryon_cache_key(b'person', b'other clothing')
+    assert key != tryon_cache_key(b'person', b'clothing', "red cotton tee")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = DiskLRUCache(Path(tmp) / "tryon_cache", max_bytes=2500, suffix=".img")
+        for i in range(3):
+            cache.set(f"result-{i}", bytes([i]) * 1000)
+        assert cache.get("result-0") is None
+        assert cache.get("result-2") == bytes([2]) * 1000
+
+        # A fresh instance finds the results left on disk
+        cache = DiskLRUCache(Path(tmp) / "tryon_cache", max_bytes=2500, suffix=".img")
+        assert "result-1" in cache and "result-0" not in cache
+    print("[OK] Try-on result cache")
+
+
+def test_tryon_jobs():
+    """Jobs run on the workers, are deduplicated, and survive a shutdown mid-generation"""
+    import time
+    import threading
+    from src.VirtualTryOn.tryon_jobs import TryOnJobQueue, QUEUED, DONE
+
+    release = threading.Event()
+
+    def runner(person, clothing, output_format, quality):
+        if clothing == b'slow':
+            release.wait(10)
+        return person + clothing, 'image/webp'
+
+    def wait_for(queue, job_id, status):
+        for _ in range(100):
+            if queue.get(job_id)['status'] == status:
+                return
+            time.sleep(0.05)
+        raise AssertionError(f"job {job_id} never became {status}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = str(Path(tmp) / "jobs.sqlite3")
+        queue = TryOnJobQueue(db_path=db_path, workers=1, runner=runner)
+        queue.start()
+        job = queue.submit(b'person', b'shirt')
+        assert queue.submit(b'person', b'shirt')['id'] == job['id']
+        wait_for(queue, job['id'], DONE)
+        assert queue.get_result(job['id']) == (b'personshirt', 'image/webp')
+
+        # A job still generating when the server stops is queued again, not left running
+        slow = queue.submit(b'person', b'slow')
+        wait_for(queue, slow['id'], 'running')
+        queue.close(timeout=0.1)
+        release.set()
+        time.sleep(0.1)
+
+        queue = TryOnJobQueue(db_path=db_path, workers=1, runner=runner)
+        assert queue.get(slow['id'])['status'] == QUEUED
+        queue.start()
+        wait_for(queue, slow['id'], DONE)
+        queue.close()
+    print("[OK] TryOnJobQueue")
+
+
+def test_background_cache():
+    """Generated backgrounds: newest per key, LRU eviction over the quota, on_evict"""
+    import os
+    import time
+    from src.Photobooth.background_cache import BackgroundCache, background_key
+
+    key = background_key(b'avatar', "Sunset  Beach", "holding hands", "image-model")
+    assert key == background_key(b'avatar', "sunset beach", "Holding Hands", "image-model")
+    assert key != background_key(b'other avatar', "sunset beach", "holding hands", "image-model")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        evicted = []
+        cache = BackgroundCache(tmp, max_bytes=2500, on_evict=evicted.append)
+        assert cache.get(key) is None
+        assert os.listdir(tmp) == []        # nothing written until there is something to save
+
+        cache.put(key, "a_scene.png", b'a' * 1000)
+        time.sleep(0.01)
+        cache.put(key, "b_scene.png", b'b' * 1000)     # force_regenerate: a newer variation
+        assert cache.get(key)['filename'] == "b_scene.png"
+
+        other = background_key(b'avatar', "rainy city")
+        time.sleep(0.01)
+        cache.put(other, "c_scene.png", b'c' * 1000)
+        # a_scene.png is the least recently used
+        assert evicted == ["a_scene.png"] and not (Path(tmp) / "a_scene.png").exists()
+        cache.flush()
+
+        # The index survives a restart
+        cache = BackgroundCache(tmp, max_bytes=2500)
+        assert cache.get(key)['filename'] == "b_scene.png"
+        assert cache.get(other)['filename'] == "c_scene.png"
+        assert cache.get_stats()['total_bytes'] == 2000
+    print("[OK] BackgroundCache")
+
+
+def test_background_store():
+    """Background file index (aliases, newest) and the decoded background cache"""
+    import os
+    import time
+    import numpy as np
+    import cv2
+    from src.Photobooth.background_store import BackgroundFileIndex, DecodedBackgroundCache
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp)
+        for i, name in enumerate(["old.png", "background_1_romantic_cafe.png"]):
+            cv2.imwrite(str(directory / name), np.full((20, 30, 3), 40 * (i + 1), np.uint8))
+            os.utime(directory / name, (1000 + i, 1000 + i))
+
+        index = BackgroundFileIndex(directory)
+        assert index.resolve("1_romantic_cafe.png") == directory / "background_1_romantic_cafe.png"
+        assert index.resolve("missing.png") is None
+        cv2.imwrite(str(directory / "new.png"), np.zeros((20, 30, 3), np.uint8))
+        index.add("new.png")
+        assert index.newest(2) == ["new.png", "background_1_romantic_cafe.png"]
+        assert len(index) == 3
+        index.remove("background_1_romantic_cafe.png")
+        assert index.newest() == ["new.png", "old.png"]
+
+        # Each decoded background is 20x30 BGRA = 2400 bytes; room for two
+        decoded = DecodedBackgroundCache(max_bytes=5000)
+        first = decoded.load(directory / "old.png")
+        assert first.shape == (20, 30, 4) and first.flags.writeable
+        first[:] = 0                                    # callers draw into their copy
+        assert decoded.load(directory / "old.png")[0, 0, 0] == 40
+        assert decoded.stats['hits'] == 1
+
+        # A rewritten file is decoded again
+        cv2.imwrite(str(directory / "old.png"), np.full((20, 30, 3), 200, np.uint8))
+        os.utime(directory / "old.png", (time.time() + 5, time.time() + 5))
+        assert decoded.load(directory / "old.png")[0, 0, 0] == 200
+
+        decoded.load(directory / "new.png")
+        decoded.load(directory / "background_1_romantic_cafe.png")
+        stats = decoded.get_stats()
+        assert stats['backgrounds'] == 2 and stats['evictions'] == 1 and stats['total_bytes'] <= 5000
+    print("[OK] BackgroundFileIndex / DecodedBackgroundCache")
+
+
+def test_local_models():
+    """Local models load once, report their state, and missing packages are unavailable"""
+    import threading
+    from src.Common import local_models
+
+    loads = []
+
+    def loader():
+        loads.append(threading.current_thread().name)
+        return object()
+
+    local_models.register_local_model("test-model", loader)
+    local_models.register_local_model("test-missing", loader, requires="no_such_package_for_tests")
+    local_models.register_local_model("test-broken", lambda: 1 / 0)
+
+    assert local_models.get_local_model_status(["test-model"])["test-model"]["state"] == local_models.NOT_LOADED
+    assert local_models.get_local_model_status(["test-missing"])["test-missing"]["state"] == local_models.UNAVAILABLE
+
+    # The fallback chain stops at the first model that loads
+    local_models.warmup_local_models(["test-missing", "test-model", "test-broken"], first_available=True).join()
+    status = local_models.get_local_model_status(["test-model", "test-broken"])
+    assert status["test-model"]["state"] == local_models.READY
+    assert status["test-broken"]["state"] == local_models.NOT_LOADED
+
+    model = local_models.get_local_model("test-model")
+    assert local_models.get_local_model("test-model") is model and len(loads) == 1
+    for name in ("test-missing", "test-broken"):
+        try:
+            local_models.get_local_model(name)
+            raise AssertionError(f"{name} loaded")
+        except local_models.LocalModelUnavailable:
+            pass
+    assert local_models.get_local_model_status(["test-broken"])["test-broken"]["state"] == local_models.FAILED
+    print("[OK] local models")
+
+
+TESTS = [
+    test_search_cache,
+    test_image_proxy,
+    test_canonical_url,
+    test_product_catalog,
+    test_garment_cache,
+    test_tryon_result_cache,
+    test_tryon_jobs,
+    test_background_cache,
+    test_background_store,
+    test_local_models,
+]
+
+
+if __name__ == "__main__":
+    failed = 0
+    for test in TESTS:
+        try:
+            test()
+        except Exception as e:
+            failed += 1
+            print(f"[FAIL] {test.__name__}: {e!r}")
+    print(f"\n{len(TESTS) - failed}/{len(TESTS)} passed")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Regression tests for parsing JSON out of model output
+
+Run from the backend directory:
+    python test_llm_json.py
+"""
+
+import sys
+
+sys.path.append('.')
+
+
+def test_citation_before_payload():
+    """A bracketed citation in the prose does not hide the JSON that follows"""
+    from src.Common.llm_json import extract_json
+
+    assert extract_json('Here are results [1]:\n[{"a":1},{"a":2}]') == [{'a': 1}, {'a': 2}]
+    assert extract_json('Sure [1] see: {"x": [1,2') == {'x': [1, 2]}
+    # With nothing better, a list of numbers is still a JSON value
+    assert extract_json('Only a citation [1] here') == [1]
+    assert extract_json('[1, 2, 3]') == [1, 2, 3]
+    print("[OK] extract_json skips citations")
+
+
+def test_grounded_products():
+    """Products of a grounded response that cites its sources are kept"""
+    from src.ClothesSearch.response_parser import parse_json_products
+
+    text = ('I found these [1]:\n'
+            '[{"url": "https://www.zalora.sg/p/white-sneakers-123", "title": "White Sneakers"}]')
+    products = parse_json_products(text)
+    assert [p['url'] for p in products] == ['https://www.zalora.sg/p/white-sneakers-123']
+    print("[OK] parse_json_products with citations")
+
+
+TESTS = [
+    test_citation_before_payload,
+    test_grounded_products,
+]
+
+
+if __name__ == "__main__":
+    failed = 0
+    for test in TESTS:
+        try:
+            test()
+        except Exception as e:
+            failed += 1
+            print(f"[FAIL] {test.__name__}: {e!r}")
+    print(f"\n{len(TESTS) - failed}/{len(TESTS)} passed")
+    sys.exit(1 if failed else 0)